@@ -0,0 +1,146 @@
+'''End-to-end latency of a chain of functions with and without fusion
+
+Compiles a Step Functions chain of LENGTH Task states (like tests/test6) with
+the frontend compiler, once with the 'trim' optimization only and once with
+'trim' and 'fuse', and runs both with the local executor (runtime/local.py).
+Every function passes on its input, a list of about SIZE_KB. Every invocation
+waits INVOKE_LATENCY seconds before it starts, to stand in for the delay of an
+asynchronous Lambda invocation. Reports the median end-to-end latency over
+RUNS runs (after one warm-up run that loads the functions) and the number of
+invocations per run.
+
+With -f, the functions in FUSE_OFF (e.g., -f 4 for the 4th) set `Fuse: false`
+in the unum template and keep their own FaaS function.
+
+    python chain_fusion.py [-n LENGTH] [-s SIZE_KB] [-l INVOKE_LATENCY] [-r RUNS] [-c] [-f FUSE_OFF ...]
+'''
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, os.path.join(REPO_DIR, 'runtime'))
+sys.path.insert(0, REPO_DIR)
+
+# sets FAAS_PLATFORM to 'local'
+from local import LocalExecutor
+from frontend import step_functions
+
+USER_FUNCTION = 'def lambda_handler(event, context):\n    return event\n'
+
+
+
+class LatencyLocalExecutor(LocalExecutor):
+    '''The local executor with a fixed delay before every invocation starts
+    '''
+    def __init__(self, functions, latency, **kwargs):
+        self.latency = latency
+        super().__init__(functions, **kwargs)
+
+    def _run(self, function, event):
+        time.sleep(self.latency)
+        super()._run(function, event)
+
+
+
+def chain(length):
+    names = [f'F{i}' for i in range(1, length + 1)]
+    states = {n: {"Type": "Task", "Resource": n, "Next": m} for n, m in zip(names, names[1:])}
+    states[names[-1]] = {"Type": "Task", "Resource": names[-1], "End": True}
+
+    return names, {"StartAt": names[0], "States": states}
+
+
+
+def create_workflow(workflow_dir, length, checkpoint, fuse_off, optimize):
+    '''Compile the chain into `workflow_dir`
+
+    @return (dict of deployed function names to directories, dict of fused
+        function names to directories)
+    '''
+    names, state_machine = chain(length)
+    template = {
+        "Globals": {"Checkpoint": checkpoint},
+        "Functions": {n: {"Properties": {"CodeUri": f'{n}/', "Runtime": "python3.8"}} for n in names}
+    }
+    for i in fuse_off:
+        template["Functions"][names[i-1]]["Properties"]["Fuse"] = False
+
+    ir = step_functions.compile(state_machine, template, optimize)
+
+    for n in names:
+        os.mkdir(os.path.join(workflow_dir, n))
+        with open(os.path.join(workflow_dir, n, 'app.py'), 'w') as f:
+            f.write(USER_FUNCTION)
+
+    for config in ir["unum IR"]:
+        with open(os.path.join(workflow_dir, config["Name"], 'unum_config.json'), 'w') as f:
+            f.write(json.dumps(config))
+
+    deployed = [c["Name"] for c in ir["unum IR"]]
+
+    return ({n: os.path.join(workflow_dir, n) for n in deployed},
+        {n: os.path.join(workflow_dir, n) for n in names if n not in deployed})
+
+
+
+def run(length, size, latency, runs, checkpoint, fuse_off, optimize):
+    '''
+    @return (number of deployed functions, invocations per run, median
+        seconds per run)
+    '''
+    value = ['x' * 1022] * size
+
+    with tempfile.TemporaryDirectory() as workflow_dir:
+        functions, fused_functions = create_workflow(workflow_dir, length, checkpoint, fuse_off, optimize)
+
+        with LatencyLocalExecutor(functions, latency, fused_functions=fused_functions) as executor:
+            # load every function once
+            executor.run(value)
+
+            invocations = executor.invocations
+            times = []
+            for r in range(runs):
+                t1 = time.perf_counter()
+                outputs = executor.run(value)
+                t2 = time.perf_counter()
+                times.append(t2 - t1)
+
+                assert outputs == [value]
+
+            return len(functions), (executor.invocations - invocations) // runs, statistics.median(times)
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end latency of a chain of functions with and without fusion')
+    parser.add_argument('-n', '--length', type=int, default=8, help='number of functions in the chain')
+    parser.add_argument('-s', '--size', type=int, default=64, help='payload size in KB')
+    parser.add_argument('-l', '--latency', type=float, default=0.02,
+        help='injected latency per invocation in seconds')
+    parser.add_argument('-r', '--runs', type=int, default=10)
+    parser.add_argument('-c', '--checkpoint', action='store_true', help='checkpoint every function')
+    parser.add_argument('-f', '--fuse-off', type=int, nargs='*', default=[],
+        help='positions (from 1) of functions that set Fuse: false')
+    args = parser.parse_args()
+
+    print(f'Chain of {args.length} functions, {args.size} KB payloads, {args.latency*1000:.1f} ms per invocation, checkpoint {args.checkpoint}')
+    print(f'{"optimize":>12} {"functions":>10} {"invocations":>12} {"latency (ms)":>13} {"speedup":>8}')
+
+    baseline = None
+    for optimize in [['trim'], ['trim', 'fuse']]:
+        functions, invocations, elapsed = run(args.length, args.size, args.latency, args.runs,
+            args.checkpoint, args.fuse_off, optimize)
+        if baseline == None:
+            baseline = elapsed
+
+        print(f'{"+".join(optimize):>12} {functions:>10} {invocations:>12} {elapsed*1000:>13.1f} {baseline/elapsed:>7.1f}x')
+
+
+
+if __name__ == '__main__':
+    main()
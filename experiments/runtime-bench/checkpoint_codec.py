@@ -0,0 +1,196 @@
+'''DynamoDB checkpoint cost and latency per checkpoint codec
+
+Writes checkpoints of JSON user function outputs of several sizes with each
+CheckpointCodec (UNUM_CHECKPOINT_CODEC) and reads them back with
+DynamoDBDriver.read_input(), as an aggregation function does. Reports, per
+codec and output size:
+
+    stored: bytes of the "User" attribute
+    WCU: write capacity units of one checkpoint put (1 KB units)
+    RCU: read capacity units of one strongly consistent read (4 KB units)
+    encode/decode: milliseconds spent in the codec per checkpoint
+    put/read: milliseconds per checkpoint() and read_input() call
+
+Capacity units are computed from DynamoDB's item size rules, so they do not
+depend on the endpoint. Outputs that exceed DynamoDB's 400 KB item size limit
+are reported as too large.
+
+By default the table is an in-process moto mock, so put and read latencies
+mostly measure serialization. Pass --endpoint-url to run against DynamoDB
+Local or DynamoDB. Codecs whose package is not installed (e.g., zstd needs
+zstandard) are skipped.
+
+    python checkpoint_codec.py [-s SIZE_KB ...] [-c CODEC ...] [-r REPEAT] [--endpoint-url URL]
+'''
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+# ds.py only imports boto3 on the aws platform
+os.environ['FAAS_PLATFORM'] = 'aws'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'runtime'))
+
+import boto3
+from botocore.exceptions import ClientError
+
+TABLE_NAME = 'unum-checkpoint-codec-bench'
+
+
+
+def create_table():
+    client = boto3.client('dynamodb')
+    client.create_table(TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'Name', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'Name', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST')
+    client.get_waiter('table_exists').wait(TableName=TABLE_NAME)
+
+
+
+def delete_table():
+    boto3.client('dynamodb').delete_table(TableName=TABLE_NAME)
+
+
+
+def user_function_output(size):
+    '''A list of records whose JSON is about `size` bytes
+    '''
+    rng = random.Random(size)
+    records = []
+    length = 2
+    while length < size:
+        r = {
+            "id": len(records),
+            "name": f'object-{rng.randrange(10**6)}',
+            "score": round(rng.random(), 6),
+            "label": rng.choice(['cat', 'dog', 'bird', 'fish']),
+            "box": [rng.randrange(1024) for i in range(4)]
+        }
+        records.append(r)
+        length = length + len(json.dumps(r)) + 2
+
+    return records
+
+
+
+def item_size(item):
+    '''Size of a checkpoint item by DynamoDB's rules: attribute name lengths
+    plus UTF-8 string lengths plus binary lengths
+    '''
+    size = 0
+    for k, v in item.items():
+        size = size + len(k.encode('utf-8'))
+        if isinstance(v, str):
+            size = size + len(v.encode('utf-8'))
+        else:
+            size = size + len(bytes(v))
+
+    return size
+
+
+
+def run_codec(codec_type, size, repeat):
+    from ds import CheckpointCodec, DynamoDBDriver
+
+    os.environ['UNUM_CHECKPOINT_CODEC'] = codec_type
+    driver = DynamoDBDriver(TABLE_NAME, False)
+
+    output = json.dumps(user_function_output(size))
+    session = f'bench-{codec_type}-{size}-{time.time_ns()}'
+
+    t1 = time.perf_counter()
+    for r in range(repeat):
+        encoded = driver.codec.encode(output)
+    t2 = time.perf_counter()
+    for r in range(repeat):
+        CheckpointCodec.decode(encoded)
+    t3 = time.perf_counter()
+
+    item = {"Name": driver.checkpoint_name(session, 'Branch-unumIndex-0'), "User": encoded}
+    stored = len(encoded.encode('utf-8')) if isinstance(encoded, str) else len(encoded)
+    wcu = math.ceil(item_size(item) / 1024)
+    rcu = math.ceil(item_size(item) / 4096)
+
+    names = [f'Branch-unumIndex-{r}' for r in range(repeat)]
+    try:
+        t4 = time.perf_counter()
+        for n in names:
+            driver.checkpoint(session, n, {"User": output})
+        t5 = time.perf_counter()
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ValidationException':
+            return stored, wcu, rcu, (t2-t1)/repeat, (t3-t2)/repeat, None, None
+        raise e
+
+    t6 = time.perf_counter()
+    for n in names:
+        ckpts = driver.read_input(session, [n])
+    t7 = time.perf_counter()
+
+    if ckpts[0]['User'] != json.loads(output):
+        raise AssertionError(f'{codec_type}: read a different output than written')
+
+    return stored, wcu, rcu, (t2-t1)/repeat, (t3-t2)/repeat, (t5-t4)/repeat, (t7-t6)/repeat
+
+
+
+def run(sizes, codecs, repeat):
+    from ds import CheckpointCodec
+
+    available = []
+    for c in codecs:
+        try:
+            CheckpointCodec.create(c)
+            available.append(c)
+        except ImportError as e:
+            print(f'Skipping {c}: {e}')
+
+    print(f'{"codec":>6} {"output":>9} {"stored":>9} {"WCU":>5} {"RCU":>5} {"encode ms":>10} {"decode ms":>10} {"put ms":>8} {"read ms":>8}')
+    for s in sizes:
+        for c in available:
+            stored, wcu, rcu, encode, decode, put, read = run_codec(c, s*1024, repeat)
+            if put == None:
+                print(f'{c:>6} {s:>7}KB {stored:>9} {"item too large (> 400 KB)":>41}')
+            else:
+                print(f'{c:>6} {s:>7}KB {stored:>9} {wcu:>5} {rcu:>5} {encode*1000:>10.3f} {decode*1000:>10.3f} {put*1000:>8.3f} {read*1000:>8.3f}')
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DynamoDB checkpoint cost and latency per checkpoint codec')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[1, 16, 128, 350, 1024],
+        help='user function output sizes in KB')
+    parser.add_argument('-c', '--codecs', nargs='+', default=['json', 'zlib', 'zstd'])
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--endpoint-url', required=False,
+        help='DynamoDB endpoint, e.g., http://localhost:8000 for DynamoDB Local. Defaults to a moto mock')
+    args = parser.parse_args()
+
+    if args.endpoint_url:
+        os.environ['AWS_ENDPOINT_URL_DYNAMODB'] = args.endpoint_url
+        create_table()
+        try:
+            run(args.sizes, args.codecs, args.repeat)
+        finally:
+            delete_table()
+    else:
+        try:
+            from moto import mock_aws
+        except ImportError:
+            from moto import mock_dynamodb as mock_aws
+
+        with mock_aws():
+            create_table()
+            run(args.sizes, args.codecs, args.repeat)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+'''Cold start cost of the unum runtime with and without lazy clients
+
+Loads the runtime (main.py) for a function with a Scalar continuation and a
+dynamodb data store in a fresh Python process, as a FaaS platform does on a
+cold start, and reports
+
+    init: milliseconds to import main.py, i.e., the cold start
+    first use: milliseconds to create the SDK clients that the first
+        invocation uses (the DynamoDB client and table, and the Lambda
+        client), which lazy clients defer from the cold start
+    the packages with the largest import times during init, from python
+        -X importtime, with the self times of their modules summed up.
+        main's own time includes creating the Unum runtime object, and
+        with eager clients, the clients
+
+for eager and lazy clients (UNUM_LAZY_CLIENTS) and for the function-to-ARN
+mapping as function-arn.yaml or as the function-arn.json that unum-cli
+writes to build artifacts. Nothing is invoked and no AWS credentials are
+needed. Times are medians over the runs.
+
+    python cold_start.py [-r RUNS] [-t TOP]
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RUNTIME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'runtime')
+
+MAPPING = {
+    "A": "arn:aws:lambda:us-east-1:123456789012:function:bench-A",
+    "B": "arn:aws:lambda:us-east-1:123456789012:function:bench-B"
+}
+
+COLD_START = '''
+import json, sys, time
+t1 = time.perf_counter()
+import main
+t2 = time.perf_counter()
+sys.stderr.write('init done\\n')
+main.unum.ds.client, main.unum.ds.table, main.unum.faas_backend.lambda_client
+t3 = time.perf_counter()
+print(json.dumps([t2 - t1, t3 - t2]))
+'''
+
+
+
+def create_function(function_dir, mapping_format):
+    with open(os.path.join(function_dir, 'app.py'), 'w') as f:
+        f.write('def lambda_handler(event, context):\n    return event\n')
+
+    with open(os.path.join(function_dir, 'unum_config.json'), 'w') as f:
+        f.write(json.dumps({"Name": "A", "Next": {"Name": "B", "InputType": "Scalar"}, "Checkpoint": True}))
+
+    if mapping_format == 'json':
+        with open(os.path.join(function_dir, 'function-arn.json'), 'w') as f:
+            f.write(json.dumps(MAPPING))
+    else:
+        with open(os.path.join(function_dir, 'function-arn.yaml'), 'w') as f:
+            f.write(''.join(f'{k}: {v}\n' for k, v in MAPPING.items()))
+
+
+
+def cold_start(function_dir, lazy):
+    '''Run one cold start
+
+    @return (init seconds, first use seconds, dict of package names to import
+        seconds)
+    '''
+    env = dict(os.environ,
+        PYTHONPATH=os.path.abspath(RUNTIME_DIR),
+        FAAS_PLATFORM='aws',
+        UNUM_INTERMEDIARY_DATASTORE_TYPE='dynamodb',
+        UNUM_INTERMEDIARY_DATASTORE_NAME='unum-cold-start-bench',
+        GC='False',
+        UNUM_LAZY_CLIENTS=str(lazy).lower(),
+        AWS_DEFAULT_REGION=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'),
+        AWS_ACCESS_KEY_ID=os.environ.get('AWS_ACCESS_KEY_ID', 'bench'),
+        AWS_SECRET_ACCESS_KEY=os.environ.get('AWS_SECRET_ACCESS_KEY', 'bench'))
+
+    ret = subprocess.run([sys.executable, '-X', 'importtime', '-c', COLD_START],
+        cwd=function_dir, env=env, capture_output=True, text=True, check=True)
+
+    init, first_use = json.loads(ret.stdout.splitlines()[-1])
+
+    # lines look like "import time:       self [us] |  cumulative | imported package"
+    packages = {}
+    for line in ret.stderr.split('init done')[0].splitlines():
+        fields = line.split('|')
+        if len(fields) != 3 or fields[0].strip().endswith('[us]'):
+            continue
+
+        package = fields[2].strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(fields[0].split(':')[1]) / 1e6
+
+    return init, first_use, packages
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold start cost of the unum runtime with and without lazy clients')
+    parser.add_argument('-r', '--runs', type=int, default=5)
+    parser.add_argument('-t', '--top', type=int, default=8, help='number of packages to list')
+    args = parser.parse_args()
+
+    print(f'{"clients":>8} {"mapping":>8} {"init (ms)":>10} {"first use (ms)":>15} {"total (ms)":>11}  largest imports (ms)')
+
+    for lazy in [False, True]:
+        for mapping_format in ['yaml', 'json']:
+            with tempfile.TemporaryDirectory() as function_dir:
+                create_function(function_dir, mapping_format)
+                runs = [cold_start(function_dir, lazy) for r in range(args.runs)]
+
+            init = statistics.median(r[0] for r in runs)
+            first_use = statistics.median(r[1] for r in runs)
+            packages = {p: statistics.median(r[2].get(p, 0) for r in runs) for p in runs[0][2]}
+            top = sorted(packages.items(), key=lambda p: p[1], reverse=True)[:args.top]
+
+            print(f'{"lazy" if lazy else "eager":>8} {mapping_format:>8} {init*1000:>10.1f} {first_use*1000:>15.1f} {(init+first_use)*1000:>11.1f}  '
+                + ', '.join(f'{p} {t*1000:.1f}' for p, t in top))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+'''Client-side CPU time of DynamoDB operations: resource path vs client path
+
+Measures the CPU time (time.process_time) per operation of the DynamoDB
+requests that the runtime makes, for
+
+    resource: the boto3 resource's Table (and the resource's client for
+        BatchGetItem), as DynamoDBDriver does, which converts every item, key
+        and expression value with TypeSerializer and every response with
+        TypeDeserializer
+    client: the low-level client with attribute values in DynamoDB's typed
+        format (e.g., {'S': 'a string'}) and constant request parameters
+        built once
+
+for the operations
+
+    put: a checkpoint of a user function output of SIZE_KB
+    get: get_checkpoint() of that checkpoint
+    read: read_input() of ITEMS such checkpoints with BatchGetItem
+    bitmap: marking a branch on a bitmap synchronization item of WIDTH
+        branches, which returns the whole ReadyMap
+    counter: marking a branch on a counter synchronization item
+
+Nothing is sent. A botocore before-send handler answers every request with a
+canned response of the size DynamoDB would return, so the times include
+building, serializing and signing requests and parsing responses, but no
+network or server time. The two paths take turns for ROUNDS rounds of REPEAT
+operations each, and the fastest round of each path is reported.
+
+    python dynamodb_client_path.py [-s SIZE_KB] [-n ITEMS] [-w WIDTH] [-r REPEAT] [-k ROUNDS]
+
+The client path saves at most about 0.5 ms of CPU time per request, and
+the speedups vary between runs (see README.md). That is small next to a
+DynamoDB round trip, so DynamoDBDriver keeps the resource path, which
+returns numbers as Decimal.
+'''
+import argparse
+import json
+import os
+import sys
+import time
+
+# ds.py only imports boto3 on the aws platform
+os.environ['FAAS_PLATFORM'] = 'aws'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'runtime'))
+
+from botocore.awsrequest import AWSResponse
+
+import serde
+from clients import ClientFactory
+from ds import CheckpointCodec
+
+TABLE_NAME = 'unum-client-path-bench'
+SESSION = 'bench-session'
+
+
+
+class RawBody(object):
+
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+
+class CannedResponse(object):
+    '''Answers every request of the clients it is attached to with `body`
+    '''
+    def __init__(self):
+        self.body = b'{}'
+
+    def attach(self, client):
+        client.meta.events.register('before-send.dynamodb', self._send, unique_id='bench-canned-response')
+
+    def _send(self, request, **kwargs):
+        return AWSResponse(request.url, 200, {'Content-Type': 'application/x-amz-json-1.0'}, RawBody(self.body))
+
+
+
+def user_function_output(size):
+    '''A JSON string of about `size` bytes
+    '''
+    records = []
+    length = 2
+    while length < size:
+        records.append({"id": len(records), "name": f'object-{len(records)}', "box": [1, 2, 3, 4]})
+        length = length + len(json.dumps(records[-1])) + 2
+
+    return json.dumps(records)
+
+
+
+def resource_put(table, output):
+    table.put_item(Item={"Name": f'{SESSION}/A-output', "User": output},
+        ConditionExpression='attribute_not_exists(#N)',
+        ExpressionAttributeNames={"#N": "Name"})
+
+
+
+def resource_get(table):
+    ret = table.get_item(Key={'Name': f'{SESSION}/A-output'},
+        ConsistentRead=True,
+        ProjectionExpression='#User',
+        ExpressionAttributeNames={'#User': 'User'})
+
+    return serde.loads(CheckpointCodec.decode(ret["Item"]["User"]))
+
+
+
+def resource_read(resource, names):
+    ret = resource.meta.client.batch_get_item(RequestItems={
+        TABLE_NAME: {'Keys': [{'Name': f'{SESSION}/{n}-output'} for n in names], 'ConsistentRead': True}
+    })
+
+    return [serde.loads(CheckpointCodec.decode(e['User'])) for e in ret['Responses'][TABLE_NAME]]
+
+
+
+def resource_bitmap(table, index):
+    ret = table.update_item(Key={"Name": f'{SESSION}/C-fanin'},
+        ReturnValues='ALL_NEW',
+        UpdateExpression="set #L[" + str(index) + "] = :nd",
+        ConditionExpression='attribute_exists(#N)',
+        ExpressionAttributeValues={':nd': True},
+        ExpressionAttributeNames={"#N": "Name", "#L": "ReadyMap"})
+
+    return all(ret['Attributes']['ReadyMap'])
+
+
+
+def resource_counter(table, index):
+    ret = table.update_item(Key={"Name": f'{SESSION}/C-fanin'},
+        ReturnValues='UPDATED_NEW',
+        UpdateExpression="SET #I = :t ADD #C :incr",
+        ConditionExpression='attribute_not_exists(#I)',
+        ExpressionAttributeValues={':t': True, ':incr': 1},
+        ExpressionAttributeNames={"#I": str(index), "#C": "ReadyCount"})
+
+    return ret['Attributes']['ReadyCount']
+
+
+
+# constant request parameters of the client path
+GET_CHECKPOINT_REQUEST = {
+    'TableName': TABLE_NAME,
+    'Key': {'Name': {'S': f'{SESSION}/A-output'}},
+    'ConsistentRead': True,
+    'ProjectionExpression': '#User',
+    'ExpressionAttributeNames': {'#User': 'User'}
+}
+NAME_CONDITION = {
+    'ConditionExpression': 'attribute_not_exists(#N)',
+    'ExpressionAttributeNames': {"#N": "Name"}
+}
+BITMAP_UPDATE_VALUES = {':nd': {'BOOL': True}}
+BITMAP_UPDATE_NAMES = {"#N": "Name", "#L": "ReadyMap"}
+COUNTER_UPDATE_VALUES = {':t': {'BOOL': True}, ':incr': {'N': '1'}}
+
+
+
+def user_attribute(attribute_value):
+    '''Return the str or bytes of a typed "User" attribute
+    '''
+    return attribute_value['S'] if 'S' in attribute_value else attribute_value['B']
+
+
+
+def client_put(client, output):
+    client.put_item(TableName=TABLE_NAME,
+        Item={"Name": {'S': f'{SESSION}/A-output'}, "User": {'S': output}},
+        **NAME_CONDITION)
+
+
+
+def client_get(client):
+    ret = client.get_item(**GET_CHECKPOINT_REQUEST)
+
+    return serde.loads(CheckpointCodec.decode(user_attribute(ret["Item"]["User"])))
+
+
+
+def client_read(client, names):
+    ret = client.batch_get_item(RequestItems={
+        TABLE_NAME: {'Keys': [{'Name': {'S': f'{SESSION}/{n}-output'}} for n in names], 'ConsistentRead': True}
+    })
+
+    return [serde.loads(CheckpointCodec.decode(user_attribute(e['User']))) for e in ret['Responses'][TABLE_NAME]]
+
+
+
+def client_bitmap(client, index):
+    ret = client.update_item(TableName=TABLE_NAME,
+        Key={"Name": {'S': f'{SESSION}/C-fanin'}},
+        ReturnValues='ALL_NEW',
+        UpdateExpression="set #L[" + str(index) + "] = :nd",
+        ConditionExpression='attribute_exists(#N)',
+        ExpressionAttributeValues=BITMAP_UPDATE_VALUES,
+        ExpressionAttributeNames=BITMAP_UPDATE_NAMES)
+
+    return all(b['BOOL'] for b in ret['Attributes']['ReadyMap']['L'])
+
+
+
+def client_counter(client, index):
+    ret = client.update_item(TableName=TABLE_NAME,
+        Key={"Name": {'S': f'{SESSION}/C-fanin'}},
+        ReturnValues='UPDATED_NEW',
+        UpdateExpression="SET #I = :t ADD #C :incr",
+        ConditionExpression='attribute_not_exists(#I)',
+        ExpressionAttributeValues=COUNTER_UPDATE_VALUES,
+        ExpressionAttributeNames={"#I": str(index), "#C": "ReadyCount"})
+
+    return int(ret['Attributes']['ReadyCount']['N'])
+
+
+
+def cpu_time(f, repeat):
+    t1 = time.process_time()
+    for r in range(repeat):
+        f()
+    t2 = time.process_time()
+
+    return (t2 - t1) / repeat
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Client-side CPU time of DynamoDB operations: resource path vs client path')
+    parser.add_argument('-s', '--size', type=int, default=4, help='user function output size in KB')
+    parser.add_argument('-n', '--items', type=int, default=100, help='checkpoints per read (at most 100)')
+    parser.add_argument('-w', '--width', type=int, default=1000, help='branches of the bitmap synchronization item')
+    parser.add_argument('-r', '--repeat', type=int, default=20)
+    parser.add_argument('-k', '--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    client = ClientFactory.client('dynamodb')
+    resource = ClientFactory.resource('dynamodb')
+    table = resource.Table(TABLE_NAME)
+
+    canned = CannedResponse()
+    canned.attach(client)
+    canned.attach(resource.meta.client)
+
+    output = user_function_output(args.size * 1024)
+    names = [f'B-unumIndex-{i}' for i in range(args.items)]
+    checkpoint_item = lambda n: {"Name": {"S": f'{SESSION}/{n}-output'}, "User": {"S": output}}
+
+    operations = [
+        ('put', json.dumps({}),
+            lambda: resource_put(table, output),
+            lambda: client_put(client, output)),
+        ('get', json.dumps({"Item": {"User": {"S": output}}}),
+            lambda: resource_get(table),
+            lambda: client_get(client)),
+        ('read', json.dumps({"Responses": {TABLE_NAME: [checkpoint_item(n) for n in names]}, "UnprocessedKeys": {}}),
+            lambda: resource_read(resource, names),
+            lambda: client_read(client, names)),
+        ('bitmap', json.dumps({"Attributes": {"Name": {"S": f'{SESSION}/C-fanin'}, "ReadyMap": {"L": [{"BOOL": True}] * args.width}}}),
+            lambda: resource_bitmap(table, 0),
+            lambda: client_bitmap(client, 0)),
+        ('counter', json.dumps({"Attributes": {"ReadyCount": {"N": "1"}}}),
+            lambda: resource_counter(table, 0),
+            lambda: client_counter(client, 0)),
+    ]
+
+    print(f'{args.size} KB outputs, {args.items} items per read, bitmaps of {args.width} branches')
+    print(f'{"operation":>10} {"resource (us)":>14} {"client (us)":>12} {"speedup":>8}')
+    for name, body, resource_op, client_op in operations:
+        canned.body = body.encode('utf-8')
+        # warm up both paths, e.g., to load service models
+        resource_op()
+        client_op()
+
+        rounds = [(cpu_time(resource_op, args.repeat), cpu_time(client_op, args.repeat)) for k in range(args.rounds)]
+        resource_time = min(r[0] for r in rounds)
+        client_time = min(r[1] for r in rounds)
+        print(f'{name:>10} {resource_time*1e6:>14.1f} {client_time*1e6:>12.1f} {resource_time/client_time:>7.1f}x')
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+'''Fan-in input read time versus ReadConcurrency
+
+Writes NUM_ITEMS Map branch outputs to a DynamoDB table and times
+DynamoDBDriver.read_input() reading all of them back for each read
+concurrency (UNUM_READ_CONCURRENCY). Every BatchGetItem request gets
+BATCH_LATENCY seconds of injected latency to stand in for the network
+round-trip.
+
+By default the table is an in-process moto mock. Pass --endpoint-url to run
+against DynamoDB Local (or any DynamoDB endpoint) instead.
+
+    python fanin_read.py [-n NUM_ITEMS] [-l BATCH_LATENCY] [-w WIDTH ...] [--endpoint-url URL]
+'''
+import argparse
+import json
+import os
+import sys
+import time
+
+# ds.py only imports boto3 on the aws platform
+os.environ['FAAS_PLATFORM'] = 'aws'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'runtime'))
+
+import boto3
+
+TABLE_NAME = 'unum-fanin-read-bench'
+SESSION = 'benchmark-session'
+
+
+
+def create_table(num_items):
+    client = boto3.client('dynamodb')
+    client.create_table(TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'Name', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'Name', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST')
+    client.get_waiter('table_exists').wait(TableName=TABLE_NAME)
+
+    with boto3.resource('dynamodb').Table(TABLE_NAME).batch_writer() as writer:
+        for i in range(num_items):
+            writer.put_item(Item={
+                'Name': f'{SESSION}/Map-unumIndex-{i}-output',
+                'User': json.dumps({'index': i, 'payload': 'x' * 64})
+            })
+
+
+
+def delete_table():
+    boto3.client('dynamodb').delete_table(TableName=TABLE_NAME)
+
+
+
+def run_read(num_items, latency, width):
+    os.environ['UNUM_READ_CONCURRENCY'] = str(width)
+    from ds import DynamoDBDriver
+
+    driver = DynamoDBDriver(TABLE_NAME, False)
+    driver.resource.meta.client.meta.events.register('before-call.dynamodb.BatchGetItem',
+        lambda **kwargs: time.sleep(latency), unique_id='bench-latency')
+
+    values = [f'Map-unumIndex-{i}' for i in range(num_items)]
+
+    t1 = time.perf_counter()
+    ret = driver.read_input(SESSION, values)
+    t2 = time.perf_counter()
+
+    if [r['User']['index'] for r in ret] != list(range(num_items)):
+        raise AssertionError('read_input returned items out of order')
+
+    return t2 - t1
+
+
+
+def run(num_items, latency, widths):
+    print(f'Fan-in of {num_items} items, {latency*1000:.1f} ms per BatchGetItem')
+    print(f'{"width":>8} {"wall time (s)":>15} {"speedup":>10}')
+
+    baseline = None
+    for w in widths:
+        elapsed = run_read(num_items, latency, w)
+        if baseline == None:
+            baseline = elapsed
+        print(f'{w:>8} {elapsed:>15.3f} {baseline/elapsed:>9.1f}x')
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fan-in input read time versus ReadConcurrency')
+    parser.add_argument('-n', '--num-items', type=int, default=10000)
+    parser.add_argument('-l', '--latency', type=float, default=0.01,
+        help='injected latency per BatchGetItem in seconds')
+    parser.add_argument('-w', '--widths', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--endpoint-url', required=False,
+        help='DynamoDB endpoint, e.g., http://localhost:8000 for DynamoDB Local. Defaults to a moto mock')
+    args = parser.parse_args()
+
+    if args.endpoint_url:
+        os.environ['AWS_ENDPOINT_URL_DYNAMODB'] = args.endpoint_url
+        create_table(args.num_items)
+        try:
+            run(args.num_items, args.latency, args.widths)
+        finally:
+            delete_table()
+    else:
+        try:
+            from moto import mock_aws
+        except ImportError:
+            from moto import mock_dynamodb as mock_aws
+
+        with mock_aws():
+            create_table(args.num_items)
+            run(args.num_items, args.latency, args.widths)
+
+
+
+if __name__ == '__main__':
+    main()
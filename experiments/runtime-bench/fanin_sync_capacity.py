@@ -0,0 +1,148 @@
+'''DynamoDB fan-in synchronization cost versus fan-out width
+
+Runs an N-way fan-in synchronization against DynamoDB with each of the
+supported UNUM_SYNC_MODE values, and reports, per mode and width, the number
+of requests, the consumed capacity units and the bytes in DynamoDB responses
+summed over all N branches. Pass -k to shard each synchronization point
+(UNUM_SYNC_SHARDS).
+
+By default the table is an in-process moto mock. Pass --endpoint-url to run
+against DynamoDB Local (or any DynamoDB endpoint) instead. Note that moto
+reports a flat ConsumedCapacity per request regardless of item size, so the
+capacity column is only meaningful against DynamoDB Local or DynamoDB.
+
+    python fanin_sync_capacity.py [-n WIDTH ...] [-k SHARDS] [--endpoint-url URL]
+'''
+import argparse
+import os
+import random
+import sys
+import time
+
+# ds.py only imports boto3 on the aws platform
+os.environ['FAAS_PLATFORM'] = 'aws'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'runtime'))
+
+import boto3
+
+TABLE_NAME = 'unum-fanin-sync-bench'
+
+
+
+class RequestCounter(object):
+    '''Requests ReturnConsumedCapacity on every DynamoDB call made by a boto3
+    client and totals the requests, capacity units and response bytes
+    '''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.capacity = 0.0
+        self.response_bytes = 0
+
+    def attach(self, client):
+        # drivers share their resource (see clients.ClientFactory), so attach
+        # only once
+        client.meta.events.register('before-parameter-build.dynamodb', self._before, unique_id='bench-count-before')
+        client.meta.events.register('after-call.dynamodb', self._after, unique_id='bench-count-after')
+
+    def _before(self, params, model, **kwargs):
+        if 'ReturnConsumedCapacity' in model.input_shape.members:
+            params['ReturnConsumedCapacity'] = 'TOTAL'
+
+    def _after(self, http_response, parsed, **kwargs):
+        self.requests = self.requests + 1
+        self.response_bytes = self.response_bytes + len(http_response.content)
+        if 'ConsumedCapacity' in parsed:
+            self.capacity = self.capacity + parsed['ConsumedCapacity'].get('CapacityUnits', 0)
+
+
+
+def create_table():
+    client = boto3.client('dynamodb')
+    client.create_table(TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'Name', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'Name', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST')
+    client.get_waiter('table_exists').wait(TableName=TABLE_NAME)
+
+
+
+def delete_table():
+    boto3.client('dynamodb').delete_table(TableName=TABLE_NAME)
+
+
+
+def run_fanin(mode, shards, num_branches, counter):
+    '''Synchronize `num_branches` branches in random completion order and
+    check that exactly the last one to finish sees the fan-in ready
+    '''
+    os.environ['UNUM_SYNC_MODE'] = mode
+    os.environ['UNUM_SYNC_SHARDS'] = str(shards)
+    from ds import DynamoDBDriver
+
+    driver = DynamoDBDriver(TABLE_NAME, False)
+    counter.attach(driver.resource.meta.client)
+    counter.reset()
+
+    session = f'bench-{mode}-{num_branches}-{time.time_ns()}'
+    order = list(range(num_branches))
+    random.shuffle(order)
+
+    ready = []
+    for i in order:
+        if driver.fanin_sync_ready(session, 'Aggregate', i, f'Branch-unumIndex-{i}', num_branches):
+            ready.append(i)
+
+    if ready != [order[-1]]:
+        raise AssertionError(f'{mode}: expected only branch {order[-1]} to complete the fan-in, got {ready}')
+
+    return counter.requests, counter.capacity, counter.response_bytes
+
+
+
+def run(widths, modes, shards):
+    counter = RequestCounter()
+    print(f'{shards} shard(s) per synchronization point')
+    print(f'{"mode":>8} {"width":>8} {"requests":>10} {"capacity":>10} {"resp bytes":>12}')
+    for n in widths:
+        for m in modes:
+            requests, capacity, response_bytes = run_fanin(m, shards, n, counter)
+            print(f'{m:>8} {n:>8} {requests:>10} {capacity:>10.1f} {response_bytes:>12}')
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DynamoDB fan-in synchronization cost versus fan-out width')
+    parser.add_argument('-n', '--widths', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('-m', '--modes', nargs='+', default=['bitmap', 'counter'])
+    parser.add_argument('-k', '--shards', type=int, default=1)
+    parser.add_argument('--endpoint-url', required=False,
+        help='DynamoDB endpoint, e.g., http://localhost:8000 for DynamoDB Local. Defaults to a moto mock')
+    args = parser.parse_args()
+
+    if args.endpoint_url:
+        os.environ['AWS_ENDPOINT_URL_DYNAMODB'] = args.endpoint_url
+        create_table()
+        try:
+            run(args.widths, args.modes, args.shards)
+        finally:
+            delete_table()
+    else:
+        try:
+            from moto import mock_aws
+        except ImportError:
+            from moto import mock_dynamodb as mock_aws
+
+        with mock_aws():
+            create_table()
+            run(args.widths, args.modes, args.shards)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+'''Map fan-out wall time versus Dispatch Concurrency
+
+Runs a Map continuation over a list of NUM_ITEMS elements against the fake
+FaaS backend with INVOKE_LATENCY seconds of injected latency per invoke, and
+reports how long the fan-out takes for each dispatch concurrency.
+
+    python map_dispatch.py [-n NUM_ITEMS] [-l INVOKE_LATENCY] [-w WIDTH ...]
+'''
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault('FAAS_PLATFORM', 'fake')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'runtime'))
+
+from faas_invoke_backend import FakeFaaSBackend
+from unum import UnumContinuation
+
+
+
+class LatencyFakeFaaSBackend(FakeFaaSBackend):
+    '''The fake FaaS backend with a fixed per-invoke latency and without the
+    per-invoke printing
+    '''
+    def __init__(self, latency):
+        self.latency = latency
+
+    def invoke(self, function, data):
+        time.sleep(self.latency)
+        return data
+
+
+
+def run_map(num_items, latency, width):
+    backend = LatencyFakeFaaSBackend(latency)
+    continuation = UnumContinuation('A', 'B', 'Map', None, backend, 'fake', None,
+        dispatch_concurrency=width)
+
+    user_function_output = [f'item-{i}' for i in range(num_items)]
+
+    t1 = time.perf_counter()
+    continuation.run(user_function_output,
+        'benchmark-session',
+        {"Fan-out": None},
+        {},
+        [],
+        gc={'A': []},
+        my_name='A',
+        my_curr_instance_name='A')
+    t2 = time.perf_counter()
+
+    return t2 - t1
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Map fan-out wall time versus Dispatch Concurrency')
+    parser.add_argument('-n', '--num-items', type=int, default=1000)
+    parser.add_argument('-l', '--latency', type=float, default=0.02,
+        help='injected latency per invoke in seconds')
+    parser.add_argument('-w', '--widths', type=int, nargs='+',
+        default=[1, 2, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    print(f'Map of {args.num_items} items, {args.latency*1000:.1f} ms per invoke')
+    print(f'{"width":>8} {"wall time (s)":>15} {"speedup":>10}')
+
+    baseline = None
+    for w in args.widths:
+        elapsed = run_map(args.num_items, args.latency, w)
+        if baseline == None:
+            baseline = elapsed
+        print(f'{w:>8} {elapsed:>15.3f} {baseline/elapsed:>9.1f}x')
+
+
+
+if __name__ == '__main__':
+    main()
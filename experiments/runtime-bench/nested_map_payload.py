@@ -0,0 +1,133 @@
+'''Egress payload construction time for nested Map branches
+
+Runs the egress work of a function that is a branch of DEPTH nested Maps and
+whose continuation is a Map over WIDTH elements: computing its outgoing edges
+for gc (Unum.get_my_outgoing_edges()) and dispatching the continuation
+payloads (Unum.run_continuation()). Payloads are serialized but not sent.
+
+Reports the time per invocation and the bytes of continuation payloads it
+creates, for each depth and width. -m sets the function's Next Payload
+Modifiers, e.g., -m Pop, or -m '$0=$0+1'.
+
+The data store is an in-process moto mock. It is not accessed while timing.
+
+    python nested_map_payload.py [-d DEPTH ...] [-n WIDTH ...] [-r REPEAT] [-m MODIFIER ...]
+'''
+import argparse
+import os
+import sys
+import time
+
+# ds.py only imports boto3 on the aws platform
+os.environ['FAAS_PLATFORM'] = 'aws'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'runtime'))
+
+import boto3
+
+TABLE_NAME = 'unum-nested-map-bench'
+
+
+
+class SerializingFakeFaaSBackend(object):
+    '''Serializes every payload as a real backend would and totals the bytes,
+    without invoking anything
+    '''
+    def __init__(self):
+        self.payload_bytes = 0
+
+    def invoke(self, function, data):
+        from faas_invoke_backend import InvocationBackend
+
+        self.payload_bytes = self.payload_bytes + len(InvocationBackend.serialize(data))
+        return data
+
+
+
+def create_table():
+    client = boto3.client('dynamodb')
+    client.create_table(TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'Name', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'Name', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST')
+    client.get_waiter('table_exists').wait(TableName=TABLE_NAME)
+
+
+
+def nested_input_payload(depth):
+    '''The input payload of the last branch of `depth` nested Maps of size 10
+    '''
+    fan_out = None
+    for d in range(depth):
+        f = {"Type": "Map", "Index": 9, "Size": 10}
+        if fan_out != None:
+            f["OuterLoop"] = fan_out
+        fan_out = f
+
+    payload = {
+        "Data": {"Source": "http", "Value": None},
+        "Session": "benchmark-session"
+    }
+    if fan_out != None:
+        payload["Fan-out"] = fan_out
+
+    return payload
+
+
+
+def run_egress(depth, width, repeat, modifiers):
+    from unum import Unum
+
+    config = {
+        "Name": "Inner",
+        "Next": {"Name": "Leaf", "InputType": "Map"},
+        "Next Payload Modifiers": modifiers
+    }
+    unum = Unum(config, 'dynamodb', TABLE_NAME, 'fake', 'True')
+    backend = SerializingFakeFaaSBackend()
+    for c in unum.cont_list:
+        c.invoker = backend
+
+    input_payload = nested_input_payload(depth)
+    user_function_output = [f'item-{i}' for i in range(width)]
+
+    t1 = time.perf_counter()
+    for r in range(repeat):
+        unum.get_my_outgoing_edges(input_payload, user_function_output)
+        unum.run_continuation(input_payload, user_function_output)
+        unum.cleanup()
+    t2 = time.perf_counter()
+
+    return (t2 - t1) / repeat, backend.payload_bytes // repeat
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Egress payload construction time for nested Map branches')
+    parser.add_argument('-d', '--depths', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('-n', '--widths', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('-r', '--repeat', type=int, default=20)
+    parser.add_argument('-m', '--modifiers', nargs='*', default=['Pop'])
+    args = parser.parse_args()
+
+    try:
+        from moto import mock_aws
+    except ImportError:
+        from moto import mock_dynamodb as mock_aws
+
+    with mock_aws():
+        create_table()
+
+        print(f'Next Payload Modifiers: {args.modifiers}')
+        print(f'{"depth":>8} {"width":>8} {"time (ms)":>12} {"payload bytes":>15}')
+        for d in args.depths:
+            for n in args.widths:
+                elapsed, payload_bytes = run_egress(d, n, args.repeat, args.modifiers)
+                print(f'{d:>8} {n:>8} {elapsed*1000:>12.3f} {payload_bytes:>15}')
+
+
+
+if __name__ == '__main__':
+    main()
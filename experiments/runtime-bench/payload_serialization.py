@@ -0,0 +1,162 @@
+'''Egress serialization time of user function outputs
+
+Measures the time to serialize a user function output for its checkpoint and
+its continuation payloads, for a large output passed to a Scalar continuation
+and for a wide output passed to a Map continuation. Compares
+
+    legacy: the output serialized for the checkpoint, and every payload
+        serialized twice, once to check its size and once to send it, as the
+        runtime did before serde.EncodedValue
+    json, orjson: the runtime's egress (serde.EncodedValue for the checkpoint
+        and UnumContinuation.run()) with each serde backend. orjson is skipped
+        if it is not installed.
+
+Payloads are serialized but not sent.
+
+    python payload_serialization.py [-s SIZE_KB ...] [-n WIDTH ...] [-r REPEAT]
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('FAAS_PLATFORM', 'fake')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'runtime'))
+
+import serde
+from faas_invoke_backend import InvocationBackend
+from unum import UnumContinuation
+
+# large enough that payloads are never compressed or spilled, but the size of
+# every payload is checked
+PAYLOAD_SIZE_LIMIT = 2**40
+
+
+
+class SerializingFakeFaaSBackend(object):
+    '''Serializes every payload as a real backend would, without invoking
+    anything
+    '''
+    def invoke(self, function, data):
+        InvocationBackend.serialize(data)
+
+
+
+def record(rng, i):
+    return {
+        "id": i,
+        "name": f'object-{rng.randrange(10**6)}',
+        "score": round(rng.random(), 6),
+        "label": rng.choice(['cat', 'dog', 'bird', 'fish']),
+        "box": [rng.randrange(1024) for j in range(4)]
+    }
+
+
+
+def large_output(size):
+    '''A list of records whose JSON is about `size` bytes
+    '''
+    rng = random.Random(size)
+    records = []
+    length = 2
+    while length < size:
+        records.append(record(rng, len(records)))
+        length = length + len(json.dumps(records[-1])) + 2
+
+    return records
+
+
+
+def wide_output(width):
+    '''A list of `width` records
+    '''
+    rng = random.Random(width)
+    return [record(rng, i) for i in range(width)]
+
+
+
+def legacy_egress(user_function_output, input_type):
+    json.dumps(user_function_output)
+
+    if input_type == 'Scalar':
+        values = [user_function_output]
+    else:
+        values = user_function_output
+
+    for i, v in enumerate(values):
+        payload = {
+            "Data": {"Source": "http", "Value": v},
+            "Session": "benchmark-session",
+            "Fan-out": {"Type": "Map", "Index": i, "Size": len(values)},
+            "GC": {}
+        }
+        len(json.dumps(payload))
+        json.dumps(payload)
+
+
+
+def runtime_egress(continuation, user_function_output):
+    encoded_output = serde.EncodedValue(user_function_output)
+    encoded_output.text
+
+    continuation.run(user_function_output,
+        "benchmark-session",
+        {},
+        {"Data": {"Source": "http", "Value": None}, "Session": "benchmark-session"},
+        [],
+        gc={},
+        encoded_output=encoded_output)
+
+
+
+def run(user_function_output, input_type, backend, repeat):
+    if backend == 'legacy':
+        t1 = time.perf_counter()
+        for r in range(repeat):
+            legacy_egress(user_function_output, input_type)
+        t2 = time.perf_counter()
+
+        return (t2 - t1) / repeat
+
+    serde.BACKEND = backend
+    continuation = UnumContinuation('A', 'B', input_type, None, SerializingFakeFaaSBackend(), 'fake', None,
+        payload_size_limit=PAYLOAD_SIZE_LIMIT)
+
+    t1 = time.perf_counter()
+    for r in range(repeat):
+        runtime_egress(continuation, user_function_output)
+    t2 = time.perf_counter()
+
+    return (t2 - t1) / repeat
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Egress serialization time of user function outputs')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[16, 256, 4096],
+        help='sizes in KB of large outputs passed to a Scalar continuation')
+    parser.add_argument('-n', '--widths', type=int, nargs='+', default=[100, 1000, 10000],
+        help='numbers of elements of wide outputs passed to a Map continuation')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    backends = ['legacy', 'json']
+    if serde.orjson != None:
+        backends.append('orjson')
+    else:
+        print('Skipping orjson: not installed')
+
+    outputs = [(f'{s} KB', 'Scalar', large_output(s*1024)) for s in args.sizes]
+    outputs = outputs + [(f'{n} items', 'Map', wide_output(n)) for n in args.widths]
+
+    print(f'{"output":>12} {"continuation":>13} ' + ' '.join(f'{b + " (ms)":>13}' for b in backends))
+    for name, input_type, user_function_output in outputs:
+        times = [run(user_function_output, input_type, b, args.repeat) for b in backends]
+        print(f'{name:>12} {input_type:>13} ' + ' '.join(f'{t*1000:>13.3f}' for t in times))
+
+
+
+if __name__ == '__main__':
+    main()
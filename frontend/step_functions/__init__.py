@@ -11,6 +11,8 @@ from cfn_tools import load_yaml, dump_yaml
 
 import shutil
 
+from .fuse import fuse, mark_fused_functions
+
 unum_map_counter = 0
 unum_parallel_counter = 0
 
@@ -249,9 +251,20 @@ def compile(state_machine, template, optimize):
     # mark the start function
     ir["Entry unum function"]["Start"] = True
 
-    if optimize:
+    # optimize is True for every optimization, or one or a list of 'trim'
+    # and 'fuse'. Fusing runs after trimming, so that it sees the
+    # continuations that trimming rewires.
+    if optimize == True:
+        optimize = ['trim', 'fuse']
+    elif isinstance(optimize, str):
+        optimize = [optimize]
+
+    if optimize and 'trim' in optimize:
         trim(ir)
 
+    if optimize and 'fuse' in optimize:
+        fuse(ir, template)
+
     return ir
 
 def translate_state_machine(state_machine):
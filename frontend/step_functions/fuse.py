@@ -0,0 +1,173 @@
+'''Fuse linear chains of functions into a single function
+
+A chain A -> B -> C of functions with Scalar continuations compiles into one
+FaaS function per step, and every step costs an asynchronous invocation and a
+serialization of the previous step's output. fuse() merges such a chain into
+its head function. The merged function's IR lists the user functions that run
+after the head's, in order, in its "Fused" field:
+
+    {
+        "Name": "A",
+        "Fused": ["B", "C"],
+        "Next": <C's Next>,
+        ...
+    }
+
+The runtime (main.py) runs A's user function and passes its output to B's and
+B's output to C's, in-process, and then checkpoints C's output and invokes C's
+continuations as A. unum-cli build packages B's and C's code with A under
+fused/B/ and fused/C/.
+
+A function B is fused into its predecessor A if
+
+    1. A's only continuation is B with a Scalar InputType and no Conditional
+    2. A is B's only predecessor, and B is not the entry function
+    3. A and B are user functions listed in the unum template (i.e., not a
+       generated UnumMap, UnumParallel or sink function), with the same
+       Runtime
+    4. neither A nor B sets `Fuse: false` in its Properties in the unum
+       template
+
+`Fuse: false` keeps a function in its own FaaS function, e.g., to give it a
+different memory size or timeout, or to isolate its failures.
+'''
+
+GENERATED_FUNCTION_PREFIXES = ("UnumMap", "UnumSinkMap", "UnumParallel", "UnumSinkParallel")
+
+
+
+def _continuations(config):
+    if "Next" not in config:
+        return []
+
+    if isinstance(config["Next"], list):
+        return config["Next"]
+
+    return [config["Next"]]
+
+
+
+def _fusable(name, template):
+    ''' Return True if the function can be part of a fused chain
+    '''
+    if name.startswith(GENERATED_FUNCTION_PREFIXES):
+        return False
+
+    if name not in template["Functions"]:
+        return False
+
+    return template["Functions"][name]["Properties"].get("Fuse", True) != False
+
+
+
+def _fused_next(config, configs, predecessors, template):
+    ''' Return the config of the function that can be fused into `config`,
+    or None
+    '''
+    if isinstance(config.get("Next"), dict) == False:
+        return None
+
+    if config["Next"]["InputType"] != "Scalar" or "Conditional" in config["Next"]:
+        return None
+
+    next_name = config["Next"]["Name"]
+    if next_name not in configs or predecessors.get(next_name) != 1:
+        return None
+
+    next_config = configs[next_name]
+    if next_config.get("Start") == True:
+        return None
+
+    if _fusable(config["Name"], template) == False or _fusable(next_name, template) == False:
+        return None
+
+    if template["Functions"][config["Name"]]["Properties"].get("Runtime") != template["Functions"][next_name]["Properties"].get("Runtime"):
+        return None
+
+    return next_config
+
+
+
+def _rename_fan_in_values(ir, old_name, new_name):
+    ''' Point Fan-in Values that name instances of `old_name` at instances of
+    `new_name`
+
+    A fused function checkpoints under its head's name, e.g., the Map branch
+    A -> B fused into A checkpoints A-unumIndex-0, A-unumIndex-1, ...
+    '''
+    for c in ir["unum IR"]:
+        for n in _continuations(c):
+            if isinstance(n["InputType"], dict) and "Fan-in" in n["InputType"]:
+                n["InputType"]["Fan-in"]["Values"] = [
+                    new_name + v[len(old_name):] if v == old_name or v.startswith(f'{old_name}-unumIndex-') else v
+                    for v in n["InputType"]["Fan-in"]["Values"]]
+
+
+
+def fuse(ir, template):
+    ''' Fuse linear chains of functions in the IR into their head functions
+
+    @param ir dict the IR from translate_state_machine()
+    @param template dict the unum template
+
+    Modifies `ir` in place. Fused functions are removed from ir["unum IR"]
+    and listed in their head function's "Fused" field.
+    '''
+    configs = {c["Name"]: c for c in ir["unum IR"]}
+
+    predecessors = {}
+    for c in ir["unum IR"]:
+        for n in _continuations(c):
+            predecessors[n["Name"]] = predecessors.get(n["Name"], 0) + 1
+
+    removed = []
+
+    for head in ir["unum IR"]:
+        if head["Name"] in removed:
+            continue
+
+        next_config = _fused_next(head, configs, predecessors, template)
+
+        while next_config != None:
+            # next_config has its own Fused functions if it came before head
+            # in the IR and was the head of a chain itself
+            head["Fused"] = head.get("Fused", []) + [next_config["Name"]] + next_config.get("Fused", [])
+
+            # the fused function continues as the last function of the chain
+            for field in ["Next", "Checkpoint", "Next Payload Modifiers"]:
+                head.pop(field, None)
+                if field in next_config:
+                    head[field] = next_config[field]
+
+            removed.append(next_config["Name"])
+            _rename_fan_in_values(ir, next_config["Name"], head["Name"])
+
+            if ir["Exit unum function"] is next_config:
+                ir["Exit unum function"] = head
+
+            next_config = _fused_next(head, configs, predecessors, template)
+
+    ir["unum IR"] = [c for c in ir["unum IR"] if c["Name"] not in removed]
+
+    return
+
+
+
+def mark_fused_functions(ir, template):
+    ''' Set `FusedInto` in the template Properties of functions fused into
+    another function, and remove it from functions that are not
+
+    Functions with FusedInto are not deployed on their own. unum-cli build
+    packages their code with the function they are fused into (see
+    package_fused_functions() in unum-cli), and LocalExecutor.from_template()
+    passes them to the local executor as fused functions.
+
+    @param ir dict the IR after fuse()
+    @param template dict the unum template. Modified in place.
+    '''
+    for f in template["Functions"].values():
+        f["Properties"].pop("FusedInto", None)
+
+    for config in ir["unum IR"]:
+        for name in config.get("Fused", []):
+            template["Functions"][name]["Properties"]["FusedInto"] = config["Name"]
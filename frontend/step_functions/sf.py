@@ -11,6 +11,8 @@ from cfn_tools import load_yaml, dump_yaml
 
 import shutil
 
+from fuse import fuse, mark_fused_functions
+
 unum_map_counter = 0
 unum_parallel_counter = 0
 
@@ -341,7 +343,7 @@ def main():
     parser.add_argument('-u', '--update',
         help="update the function's unum_config", action="store_true", required=False)
     parser.add_argument('-o', '--optimize',
-        help="optimizations", choices=['trim', 'foo'], required=False)
+        help="optimizations", choices=['trim', 'fuse', 'foo'], nargs='+', default=[], required=False)
     parser.add_argument('-c', '--clean',
         help="clean", action="store_true", required=False)
     parser.add_argument('--fanin_wait',
@@ -395,10 +397,14 @@ def main():
     # mark the start function
     ir["Entry unum function"]["Start"] = True
 
-    if args.optimize == "trim":
+    if "trim" in args.optimize:
         print(f'Trimming IR...')
         trim(ir)
 
+    if "fuse" in args.optimize:
+        print(f'Fusing chains...')
+        fuse(ir, template)
+
     # Check fan-in to wait
     if args.fanin_wait:
         for c in ir["unum IR"]:
@@ -457,6 +463,11 @@ def main():
                 with open(os.path.join(function_dir, 'unum_config.json'), 'w') as f:
                     f.write(json.dumps(config, indent=4))
 
+        # Functions fused into another function are not deployed on their
+        # own. unum-cli packages their code with the function they are fused
+        # into.
+        mark_fused_functions(ir, template)
+
         # move the old unum-template.yaml file to .unum-template.yaml.old
         # Save the new template as unum-template.yaml
         if os.path.isfile(f'.{args.template}.old') == False:
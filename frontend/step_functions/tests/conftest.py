@@ -0,0 +1,5 @@
+import os
+import sys
+
+# import the compiler as the frontend.step_functions package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
@@ -0,0 +1,152 @@
+import json
+import os
+
+from frontend.step_functions import compile
+from frontend.step_functions.fuse import fuse, mark_fused_functions
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+
+def template(names, **properties):
+    '''An unum template with a function of each name. `properties` are
+    extra Properties by function name.
+    '''
+    return {
+        "Globals": {"Checkpoint": True},
+        "Functions": {n: {"Properties": dict({"CodeUri": n, "Runtime": "python3.8"}, **properties.get(n, {}))} for n in names}
+    }
+
+
+
+def scalar(name):
+    return {"Name": name, "InputType": "Scalar"}
+
+
+
+def chain_ir(order):
+    '''The IR of the chain A -> B -> C with configs in `order`
+    '''
+    configs = {
+        "A": {"Name": "A", "Start": True, "Checkpoint": False, "Next": scalar("B")},
+        "B": {"Name": "B", "Checkpoint": False, "Next": scalar("C")},
+        "C": {"Name": "C", "Checkpoint": True},
+    }
+
+    return {"unum IR": [configs[n] for n in order], "Entry unum function": configs["A"], "Exit unum function": configs["C"]}
+
+
+
+def names(ir):
+    return [c["Name"] for c in ir["unum IR"]]
+
+
+
+def test_chain():
+    with open(os.path.join(TESTS_DIR, 'chain.json')) as f:
+        state_machine = json.loads(f.read())
+
+    ir = compile(state_machine, template('ABCDEF'), True)
+
+    assert names(ir) == ['A']
+    assert ir["unum IR"][0]["Fused"] == ['B', 'C', 'D', 'E', 'F']
+    assert ir["unum IR"][0]["Start"] == True
+    assert "Next" not in ir["unum IR"][0]
+    assert ir["Exit unum function"] is ir["unum IR"][0]
+
+
+
+def test_fused_functions_of_a_later_head_are_kept():
+    for order in ['ABC', 'BCA', 'CBA', 'ACB']:
+        ir = chain_ir(order)
+        fuse(ir, template('ABC'))
+
+        assert names(ir) == ['A'], order
+        assert ir["unum IR"][0]["Fused"] == ['B', 'C'], order
+        # the fused function checkpoints and continues as C
+        assert ir["unum IR"][0]["Checkpoint"] == True, order
+        assert "Next" not in ir["unum IR"][0], order
+        assert ir["Exit unum function"] is ir["unum IR"][0], order
+
+
+
+def test_map_branch_fan_in_values_are_renamed():
+    fan_in = {"Name": "Sink", "InputType": {"Fan-in": {"Values": ["B2-unumIndex-*"]}}}
+    ir = {"unum IR": [
+        {"Name": "A", "Start": True, "Next": {"Name": "B1", "InputType": "Map"}},
+        {"Name": "B1", "Next": scalar("B2")},
+        {"Name": "B2", "Next": fan_in, "Next Payload Modifiers": ["Pop"], "Checkpoint": True},
+        {"Name": "Sink"},
+    ]}
+    ir["Entry unum function"] = ir["unum IR"][0]
+    ir["Exit unum function"] = ir["unum IR"][-1]
+
+    fuse(ir, template(['A', 'B1', 'B2', 'Sink']))
+
+    assert names(ir) == ['A', 'B1', 'Sink']
+    b1 = ir["unum IR"][1]
+    assert b1["Fused"] == ['B2']
+    assert b1["Next"]["InputType"]["Fan-in"]["Values"] == ['B1-unumIndex-*']
+    assert b1["Next Payload Modifiers"] == ['Pop']
+    # the Map continuation of A is not fused
+    assert "Fused" not in ir["unum IR"][0]
+
+
+
+def test_generated_functions_are_not_fused():
+    with open(os.path.join(TESTS_DIR, 'map-chain.json')) as f:
+        state_machine = json.loads(f.read())
+
+    ir = compile(state_machine, template(['Start', 'F1', 'Last']), ['fuse'])
+
+    assert len(ir["unum IR"]) == 5
+    assert all("Fused" not in c for c in ir["unum IR"])
+
+
+
+def test_fuse_false():
+    ir = chain_ir('ABC')
+    fuse(ir, template('ABC', B={"Fuse": False}))
+
+    assert names(ir) == ['A', 'B', 'C']
+
+    ir = chain_ir('ABC')
+    fuse(ir, template('ABC', C={"Fuse": False}))
+
+    assert names(ir) == ['A', 'C']
+    assert ir["unum IR"][0]["Fused"] == ['B']
+    assert ir["unum IR"][0]["Next"] == scalar("C")
+
+
+
+def test_runtime_mismatch():
+    ir = chain_ir('ABC')
+    fuse(ir, template('ABC', B={"Runtime": "nodejs14.x"}))
+
+    assert names(ir) == ['A', 'B', 'C']
+
+    ir = chain_ir('ABC')
+    fuse(ir, template('ABC', C={"Runtime": "python3.9"}))
+
+    assert names(ir) == ['A', 'C']
+    assert ir["unum IR"][0]["Fused"] == ['B']
+
+
+
+def test_functions_with_several_predecessors_are_not_fused():
+    ir = chain_ir('ABC')
+    ir["unum IR"].append({"Name": "D", "Next": scalar("B")})
+    fuse(ir, template('ABCD'))
+
+    assert names(ir) == ['A', 'B', 'D']
+    assert ir["unum IR"][1]["Fused"] == ['C']
+
+
+
+def test_mark_fused_functions():
+    t = template('ABCD', D={"FusedInto": "A"})
+    ir = chain_ir('ABC')
+    fuse(ir, t)
+    mark_fused_functions(ir, t)
+
+    assert {n: f["Properties"].get("FusedInto") for n, f in t["Functions"].items()} == {"A": None, "B": "A", "C": "A", "D": None}
@@ -0,0 +1,177 @@
+'''Shared AWS SDK clients of the unum runtime
+
+All AWS clients of a function instance (the data store's and the invocation
+backend's) are created by ClientFactory from one boto3 session and with one
+botocore configuration:
+
+    max_pool_connections: the largest concurrency reserved for the service
+        (see ClientFactory.reserve_connections()), and at least botocore's
+        default of 10. botocore does not queue requests for a connection
+        when a client's pool is exhausted. It opens a new connection and
+        closes it after the request, so every request beyond the pool pays
+        for a new TCP and TLS handshake.
+    tcp_keepalive: on, so that idle pooled connections survive between warm
+        invocations
+    connect_timeout, read_timeout: UNUM_CONNECT_TIMEOUT (default 2) and
+        UNUM_READ_TIMEOUT (default 30) seconds, instead of botocore's 60
+    retries: UNUM_RETRY_MODE (default standard) with at most
+        UNUM_RETRY_MAX_ATTEMPTS (default 5) attempts
+
+The factory counts, per client, the requests sent while all of its pooled
+connections were in use. See ClientFactory.report().
+'''
+import os
+import threading
+
+
+
+class ClientFactory(object):
+
+    # botocore's default max_pool_connections
+    DEFAULT_POOL_CONNECTIONS = 10
+
+    session = None
+    clients = {}
+    # service name to the number of connections reserved for it
+    connections = {}
+    # client name to its request counters. See _count_requests()
+    stats = {}
+    lock = threading.RLock()
+
+    @classmethod
+    def reserve_connections(cls, service, connections):
+        '''Size the pools of clients of `service` for `connections`
+        concurrent requests
+
+        Components call this with their configured concurrency (e.g., the
+        dispatch concurrency for 'lambda') before they create clients.
+        Clients that already exist keep their pool size.
+        '''
+        with cls.lock:
+            cls.connections[service] = max(cls.connections.get(service, 0), int(connections))
+
+
+
+    @classmethod
+    def pool_connections(cls, service):
+        return max(cls.DEFAULT_POOL_CONNECTIONS, cls.connections.get(service, 0))
+
+
+
+    @classmethod
+    def config(cls, service):
+        '''Return the botocore Config of clients of `service`
+        '''
+        from botocore.config import Config
+
+        return Config(max_pool_connections=cls.pool_connections(service),
+            tcp_keepalive=True,
+            connect_timeout=float(os.environ.get('UNUM_CONNECT_TIMEOUT', 2)),
+            read_timeout=float(os.environ.get('UNUM_READ_TIMEOUT', 30)),
+            retries={
+                'mode': os.environ.get('UNUM_RETRY_MODE', 'standard'),
+                'total_max_attempts': int(os.environ.get('UNUM_RETRY_MAX_ATTEMPTS', 5))
+            })
+
+
+
+    @classmethod
+    def get_session(cls):
+        '''Return the shared boto3 session
+
+        boto3's sessions are not thread-safe, so clients are only created
+        while holding cls.lock.
+        '''
+        with cls.lock:
+            if cls.session == None:
+                import boto3
+                cls.session = boto3.session.Session()
+
+            return cls.session
+
+
+
+    @classmethod
+    def client(cls, service):
+        '''Return the shared low-level client of `service`
+        '''
+        with cls.lock:
+            if service not in cls.clients:
+                c = cls.get_session().client(service, config=cls.config(service))
+                cls._count_requests(c, service, cls.pool_connections(service))
+                cls.clients[service] = c
+
+            return cls.clients[service]
+
+
+
+    @classmethod
+    def resource(cls, service):
+        '''Return the shared service resource of `service`
+
+        A resource has its own client (and connection pool), counted as
+        "<service> resource".
+        '''
+        name = f'{service} resource'
+
+        with cls.lock:
+            if name not in cls.clients:
+                r = cls.get_session().resource(service, config=cls.config(service))
+                cls._count_requests(r.meta.client, name, cls.pool_connections(service))
+                cls.clients[name] = r
+
+            return cls.clients[name]
+
+
+
+    @classmethod
+    def _count_requests(cls, client, name, pool_connections):
+        '''Count the requests of `client`
+
+        Each HTTP request (including retries) is counted when it is sent and
+        finishes when its response is received. A request sent while at
+        least `pool_connections` requests are in flight cannot use a pooled
+        connection.
+        '''
+        stats = {
+            'pool': pool_connections,
+            'in_flight': 0,
+            'requests': 0,
+            'peak': 0,
+            'beyond_pool': 0
+        }
+        cls.stats[name] = stats
+
+        def sent(**kwargs):
+            with cls.lock:
+                stats['requests'] = stats['requests'] + 1
+                if stats['in_flight'] >= stats['pool']:
+                    stats['beyond_pool'] = stats['beyond_pool'] + 1
+                stats['in_flight'] = stats['in_flight'] + 1
+                stats['peak'] = max(stats['peak'], stats['in_flight'])
+
+        def received(**kwargs):
+            with cls.lock:
+                stats['in_flight'] = stats['in_flight'] - 1
+
+        client.meta.events.register('before-send', sent)
+        client.meta.events.register('response-received', received)
+
+
+
+    @classmethod
+    def report(cls, debug=False):
+        '''Print the request counters of every client since the last report
+        and reset them
+
+        A client is reported if any of its requests went beyond its pool, or
+        if `debug` is true.
+        '''
+        with cls.lock:
+            for name, stats in cls.stats.items():
+                if stats['beyond_pool'] > 0 or (debug and stats['requests'] > 0):
+                    print(f'[METRIC] {name} client: {stats["requests"]} requests, peak {stats["peak"]} in flight, {stats["beyond_pool"]} requests beyond the pool of {stats["pool"]} connections')
+
+                stats['requests'] = 0
+                stats['peak'] = stats['in_flight']
+                stats['beyond_pool'] = 0
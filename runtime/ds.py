@@ -1,13 +1,38 @@
 import uuid
-import time, datetime, json, os, math
+import time, datetime, json, os, math, random, zlib
+import threading, sqlite3, contextlib, shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import serde
+from clients import ClientFactory
 
 
+# With lazy clients (`LazyClients` in the unum template's Globals), SDK
+# packages are imported and their clients created on first use rather than
+# during cold start, so that functions that never use them do not pay for
+# them. See UnumIntermediaryDataStore.lazy_client().
+LAZY_CLIENTS = os.environ.get('UNUM_LAZY_CLIENTS', 'false').lower() == 'true'
+
 if os.environ['FAAS_PLATFORM'] == 'aws':
-    import boto3
     from botocore.exceptions import ClientError
+    if LAZY_CLIENTS == False:
+        import boto3
 elif os.environ['FAAS_PLATFORM'] =='gcloud':
-    from google.cloud import firestore
     from google.cloud import exceptions as gcloudexceptions
+    if LAZY_CLIENTS == False:
+        from google.cloud import firestore
+
+
+
+def backoff(retries):
+    '''Sleep before retry number `retries` (starting at 0) of a request
+
+    Exponential backoff with full jitter: a random time up to 50 ms * 2^retries,
+    capped at 1 second.
+    '''
+    time.sleep(random.uniform(0, min(1.0, 0.05 * 2 ** retries)))
+
+
 
 class UnumIntermediaryDataStore(object):
     
@@ -21,6 +46,38 @@ class UnumIntermediaryDataStore(object):
         self.my_type = ds_type
         self.name = ds_name
         self.debug = debug
+        # whether checkpoint_fanin_sync_ready() writes the checkpoint and
+        # marks the fan-in branch ready in a single request
+        self.fused_checkpoint = False
+        # seconds that an execution lease is held. See claim_execution()
+        self.execution_lease = 0
+        # whether the driver implements append_gc_log() and sweep_gc_log()
+        # for deferred gc
+        self.deferred_gc = False
+        self._clients = {}
+        self._clients_lock = threading.RLock()
+
+
+
+    def lazy_client(self, name, create):
+        '''Return the client called `name`, creating it with create() on first
+        use
+
+        Drivers expose their SDK clients as properties that call this.
+        Without lazy clients (LAZY_CLIENTS), drivers use the properties in
+        __init__ so that clients are still created during cold start. A
+        client is created once even if several threads (e.g., concurrent
+        reads) use it first at the same time.
+        '''
+        client = self._clients.get(name)
+        if client == None:
+            with self._clients_lock:
+                client = self._clients.get(name)
+                if client == None:
+                    client = create()
+                    self._clients[name] = client
+
+        return client
 
 
     @classmethod
@@ -35,12 +92,292 @@ class UnumIntermediaryDataStore(object):
     @classmethod
     def create(cls, datastore_type, *params):
         if datastore_type not in cls.subclasses:
-            raise ValueError(f'unum does not support {platform} as intermediary data store')
+            raise ValueError(f'unum does not support {datastore_type} as intermediary data store')
 
         return cls.subclasses[datastore_type](*params)
 
 
 
+    def checkpoint_fanin_sync_ready(self, session, instance_name, data, aggregation_function_instance_name, index, num_branches):
+        '''Checkpoint a fan-in branch and mark it ready for the fan-in
+
+        Drivers that set self.fused_checkpoint override this to do both in a
+        single request. The default checkpoints and, if the checkpoint is
+        written, calls fanin_sync_ready().
+
+        @return (ret, ready) where ret is checkpoint()'s return value and
+            ready is fanin_sync_ready()'s, or False if the checkpoint is not
+            written.
+        '''
+        ret = self.checkpoint(session, instance_name, data)
+        if ret < 1:
+            return ret, False
+
+        return ret, self.fanin_sync_ready(session, aggregation_function_instance_name, index, instance_name, num_branches)
+
+
+
+    def claim_execution(self, session, instance_name, owner):
+        '''Claim the lease to run the user function of a function instance
+
+        Drivers that set self.execution_lease override this. The default
+        grants every claim.
+
+        @param owner str identifies the claiming execution
+
+        @return True if `owner` holds the lease. False if another owner does.
+        '''
+        return True
+
+
+
+    def delete_checkpoints(self, session, instance_names):
+        '''Delete the checkpoints of multiple function instances
+
+        Drivers that support batched deletes override this. The default
+        deletes one checkpoint at a time.
+        '''
+        for n in instance_names:
+            self.delete_checkpoint(session, n)
+
+
+
+    def delete_sync_points(self, sync_point_names):
+        '''Delete fan-in and gc synchronization items named by
+        fanin_sync_point_name() and gc_sync_point_name()
+
+        Drivers that do not override this leave synchronization items in the
+        data store.
+        '''
+        pass
+
+
+
+    def append_gc_log(self, session, instance_name, checkpoints, sync_points):
+        '''Record checkpoints and synchronization items for deferred garbage
+        collection in the session's gc log. See sweep_gc_log().
+        '''
+        raise NotImplementedError(f'{self.my_type} does not support deferred gc')
+
+
+
+    def sweep_gc_log(self, session):
+        '''Delete everything recorded in the session's gc log and the log
+        itself. See append_gc_log().
+        '''
+        raise NotImplementedError(f'{self.my_type} does not support deferred gc')
+
+
+
+    def stream_input(self, session, values, prefetch=2):
+        '''Given the session id and a list of pointers to the intermediary
+        data store, return a FanInInputStream that lazily reads the data in
+        the same order as read_input().
+
+        @param prefetch number of batches read ahead of the one being consumed
+        '''
+        return FanInInputStream(self, session, values, prefetch=prefetch)
+
+
+
+class FanInInputStream(object):
+    '''A lazily read, ordered sequence of a fan-in function's inputs
+
+    Iterating over the stream reads the upstream checkpoints in batches of
+    BATCH_SIZE with the data store's read_input() and yields their user
+    function outputs one at a time. At most `prefetch` batches are read ahead
+    in a background thread, so no more than `prefetch`+1 batches are in
+    memory regardless of the fan-in width.
+
+    len() is the number of inputs. Every iteration re-reads the inputs from
+    the data store, and the stream does not support indexing.
+
+    The GC field of every checkpoint read is retained (it is small) so that
+    gc_tasks() can return the fan-in's GC tasks after the user function runs.
+    '''
+    BATCH_SIZE = 100
+
+    def __init__(self, datastore, session, values, prefetch=2):
+        self.datastore = datastore
+        self.session = session
+        self.values = values
+        self.prefetch = max(1, prefetch)
+        self.batches = [values[i:i+self.BATCH_SIZE] for i in range(0, len(values), self.BATCH_SIZE)]
+
+        # batch index -> list of the GC fields in that batch
+        self._gc = {}
+
+
+
+    def __len__(self):
+        return len(self.values)
+
+
+
+    def __iter__(self):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = deque()
+            next_batch = 0
+
+            while len(pending) > 0 or next_batch < len(self.batches):
+                while next_batch < len(self.batches) and len(pending) <= self.prefetch:
+                    pending.append((next_batch, executor.submit(self._read_batch, next_batch)))
+                    next_batch = next_batch + 1
+
+                b, f = pending.popleft()
+                for ckpt in f.result():
+                    yield ckpt["User"]
+
+
+
+    def _read_batch(self, b):
+        ckpt_vals = self.datastore.read_input(self.session, self.batches[b])
+        self._gc[b] = [ckpt["GC"] for ckpt in ckpt_vals if "GC" in ckpt]
+
+        return ckpt_vals
+
+
+
+    def gc_tasks(self):
+        '''Return the GC tasks of all checkpoints in the stream
+
+        Batches that the user function did not consume are read (again) to
+        collect their GC fields.
+
+        @return dict whose keys are parent nodes' instance names and values
+            are that node's outgoing edges, as in Unum.my_gc_tasks
+        '''
+        for b in range(len(self.batches)):
+            if b not in self._gc:
+                self._read_batch(b)
+
+        return {k:v for b in range(len(self.batches)) for t in self._gc[b] for k,v in t.items()}
+
+
+
+class CheckpointCodec(object):
+    '''Encodes the user function output stored in checkpoints
+
+    Checkpoints keep the user function output as a JSON string ("User").
+    Codecs encode the string before it is written, e.g., as compressed
+    bytes, which DynamoDB stores as a Binary attribute. Encoded bytes start
+    with the codec's MAGIC, so readers decode any checkpoint with
+    CheckpointCodec.decode() regardless of the codec that wrote it.
+    '''
+
+    subclasses = {}
+    # codec instances used to decode, by type
+    decoders = {}
+
+    # Leading bytes of the codec's encoded values
+    MAGIC = None
+
+    # Outputs shorter than this are not encoded. A DynamoDB item smaller than
+    # 1 KB consumes one write capacity unit either way.
+    MIN_SIZE = 1024
+
+    @classmethod
+    def add_codec(cls, codec_type):
+        def wrapper(subclass):
+            cls.subclasses[codec_type] = subclass
+            return subclass
+
+        return wrapper
+
+
+
+    @classmethod
+    def create(cls, codec_type):
+        if codec_type not in cls.subclasses:
+            raise ValueError(f'unum does not support {codec_type} as checkpoint codec. Supported codecs: {", ".join(cls.subclasses)}')
+
+        return cls.subclasses[codec_type]()
+
+
+
+    @classmethod
+    def decode(cls, value):
+        '''Return the JSON string of a checkpoint's encoded user function
+        output
+
+        @param value str, bytes or boto3 Binary
+        '''
+        if isinstance(value, str):
+            return value
+
+        value = bytes(value)
+        for codec_type, subclass in cls.subclasses.items():
+            if subclass.MAGIC != None and value.startswith(subclass.MAGIC):
+                if codec_type not in cls.decoders:
+                    cls.decoders[codec_type] = subclass()
+
+                return cls.decoders[codec_type].decode_bytes(value)
+
+        raise ValueError(f'Unknown checkpoint encoding: {value[:4]}')
+
+
+
+    def encode(self, output):
+        '''Encode the JSON string of a user function output
+
+        @return the string as is if it is shorter than MIN_SIZE, or bytes
+        '''
+        if len(output) < self.MIN_SIZE:
+            return output
+
+        return self.encode_bytes(output.encode('utf-8'))
+
+
+
+@CheckpointCodec.add_codec('json')
+class JSONCodec(CheckpointCodec):
+    '''Store outputs as JSON strings, i.e., no encoding
+    '''
+    def encode(self, output):
+        return output
+
+
+
+@CheckpointCodec.add_codec('zlib')
+class ZlibCodec(CheckpointCodec):
+    '''zlib (deflate) compression from the standard library
+
+    zlib streams with the default 32 KB window start with 0x78.
+    '''
+    MAGIC = b'\x78'
+    LEVEL = 6
+
+    def encode_bytes(self, data):
+        return zlib.compress(data, self.LEVEL)
+
+    def decode_bytes(self, data):
+        return zlib.decompress(data).decode('utf-8')
+
+
+
+@CheckpointCodec.add_codec('zstd')
+class ZstdCodec(CheckpointCodec):
+    '''Zstandard compression. Faster than zlib at a similar or better ratio.
+    Requires the zstandard package.
+    '''
+    MAGIC = b'\x28\xb5\x2f\xfd'
+    LEVEL = 3
+
+    def __init__(self):
+        # only functions that use this codec need the zstandard package
+        import zstandard
+
+        self.compressor = zstandard.ZstdCompressor(level=self.LEVEL)
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def encode_bytes(self, data):
+        return self.compressor.compress(data)
+
+    def decode_bytes(self, data):
+        return self.decompressor.decompress(data).decode('utf-8')
+
+
+
 @UnumIntermediaryDataStore.add_datastore('firestore')
 class FirestoreDriver(UnumIntermediaryDataStore):
     '''
@@ -51,7 +388,21 @@ class FirestoreDriver(UnumIntermediaryDataStore):
     '''
     def __init__(self, ds_name, debug):
         super(FirestoreDriver, self).__init__("firestore", ds_name, debug)
-        self.db = firestore.Client()
+
+        if LAZY_CLIENTS == False:
+            self.db
+
+
+
+    @property
+    def db(self):
+        '''The Firestore client. See lazy_client()
+        '''
+        def create():
+            from google.cloud import firestore
+            return firestore.Client()
+
+        return self.lazy_client('db', create)
 
 
 
@@ -71,17 +422,41 @@ class FirestoreDriver(UnumIntermediaryDataStore):
     def read_input(self, collection, documents):
         '''Read multiple documents from a collection
 
-        Used by the aggregation function to read its inputs
+        Used by the aggregation function to read its inputs. Returns the
+        checkpoints in the same order, as DynamoDBDriver.read_input() does.
         '''
         if self.debug:
             print(f'[DEBUG] Reading inputs from collection: {collection}, and documents: {documents}')
-        
-        return [self._read(collection, d) for d in documents]
+
+        ret = []
+        for d in documents:
+            ckpt = self._read(collection, d)
+            if ckpt == None:
+                print(f'[WARN] Not all values for fan-in were read from {self.my_type}. Missing: {d}')
+                continue
+
+            item = {
+                'User': serde.loads(CheckpointCodec.decode(ckpt['User'])),
+                'Name': d
+            }
+            if 'GC' in ckpt:
+                item['GC'] = ckpt['GC']
+
+            ret.append(item)
+
+        return ret
 
 
 
     def get_checkpoint(self, session, instance_name):
-        return self._read(session, instance_name)
+        '''Return the user function output in the checkpoint or None if the
+        checkpoint doesn't exist
+        '''
+        ckpt = self._read(session, instance_name)
+        if ckpt == None:
+            return None
+
+        return serde.loads(CheckpointCodec.decode(ckpt["User"]))
 
 
 
@@ -139,6 +514,12 @@ class FirestoreDriver(UnumIntermediaryDataStore):
 
 
 
+    def delete_sync_points(self, sync_point_names):
+        for collection, document in sync_point_names:
+            self._delete(collection, document)
+
+
+
     def gc_sync_point_name(self, session, parent_function_instance_name):
         return session, f'{parent_function_instance_name}-gc'
 
@@ -165,7 +546,7 @@ class FirestoreDriver(UnumIntermediaryDataStore):
 
         @return True is I'm the last-to-finish child node. False if I'm not.
         '''
-        return self._sync_ready(self.gc_sync_point_name(session, parent_function_instance_name), index, num_branches)
+        return self._sync_ready(self.gc_sync_point_name(session, parent_function_instance_name), index, my_instance_name, num_branches)
 
 
 
@@ -249,6 +630,7 @@ class FirestoreDriver(UnumIntermediaryDataStore):
 
         set_ref = self.db.collection(collection).document(document)
 
+        from google.cloud import firestore
         result = set_ref.update({'ReadySet': firestore.ArrayUnion([my_instance_name])})
 
         if self.debug:
@@ -320,6 +702,8 @@ class FirestoreDriver(UnumIntermediaryDataStore):
         transaction = self.db.transaction(max_attempts=500)
         bitmap_ref = self.db.collection(bitmap_name[0]).document(bitmap_name[1])
 
+        from google.cloud import firestore
+
         @firestore.transactional
         def _update_my_index(transaction, bitmap_ref):
             snapshot = bitmap_ref.get(transaction=transaction)
@@ -392,11 +776,125 @@ class FirestoreDriver(UnumIntermediaryDataStore):
 class DynamoDBDriver(UnumIntermediaryDataStore):
 
 
+    # BatchGetItem accepts at most 100 keys per request
+    BATCH_GET_SIZE = 100
+    # Retries of UnprocessedKeys before read_input() gives up
+    BATCH_GET_MAX_RETRIES = 10
+    # BatchWriteItem accepts at most 25 requests
+    BATCH_WRITE_SIZE = 25
+    # Retries of UnprocessedItems before a batched delete gives up
+    BATCH_WRITE_MAX_RETRIES = 10
+    # Retries of a fan-in checkpoint transaction that is cancelled by a
+    # conflicting transaction or throttling
+    TRANSACTION_MAX_RETRIES = 10
+    # Cancellation reasons of a transaction that are worth retrying
+    TRANSACTION_RETRY_CODES = ['TransactionConflict', 'ThrottlingError', 'ProvisionedThroughputExceeded', 'RequestLimitExceeded']
+    # Number of items a session's deferred gc log is spread across
+    GC_LOG_SHARDS = 16
+    # Item attribute that the table's TTL is enabled on
+    TTL_ATTRIBUTE = "ExpireAt"
+
     def __init__(self, ds_name, debug):
+        '''
+        The fan-in and gc synchronization mode and the number of shards per
+        synchronization point are workflow-wide settings (`SyncMode` and
+        `SyncShards` in the unum template's Globals) that are passed to
+        functions via the UNUM_SYNC_MODE and UNUM_SYNC_SHARDS environment
+        variables. See _sync_ready() for details.
+
+        The number of concurrent BatchGetItem requests in read_input() is set
+        by `ReadConcurrency` in the Globals (UNUM_READ_CONCURRENCY, default 8).
+        The number of concurrent BatchWriteItem requests in garbage collection
+        is set by `WriteConcurrency` (UNUM_WRITE_CONCURRENCY, default 8).
+
+        If `CheckpointTTL` (UNUM_CHECKPOINT_TTL) is a positive number of
+        seconds, checkpoints, synchronization items and gc logs are written
+        with an "ExpireAt" attribute that many seconds in the future. With
+        DynamoDB TTL enabled on "ExpireAt" for the table, items that garbage
+        collection misses are eventually deleted by DynamoDB.
+
+        If `FusedCheckpoint` (UNUM_FUSED_CHECKPOINT) is true, fan-in branches
+        write their checkpoint and mark themselves ready in one transaction.
+        See checkpoint_fanin_sync_ready(). It requires the counter SyncMode.
+
+        `CheckpointCodec` (UNUM_CHECKPOINT_CODEC, default json) encodes user
+        function outputs in checkpoints. Compressing codecs store outputs as
+        Binary attributes, which consume fewer capacity units and fit larger
+        outputs in the 400 KB item size limit. See CheckpointCodec.
+
+        If `ExecutionLease` (UNUM_EXECUTION_LEASE) is a positive number of
+        seconds, functions claim a lease before they run the user function so
+        that concurrent duplicates skip it. See claim_execution().
+        '''
         super(DynamoDBDriver, self).__init__("dynamodb", ds_name, debug)
-        self.client = boto3.client('dynamodb')
-        self.resource = boto3.resource('dynamodb')
-        self.table = self.resource.Table(self.name)
+
+        self.deferred_gc = True
+
+        self.sync_mode = os.environ.get('UNUM_SYNC_MODE', 'bitmap')
+        if self.sync_mode not in ['bitmap', 'counter']:
+            raise ValueError(f'Unknown UNUM_SYNC_MODE: {self.sync_mode}. Supported values: bitmap, counter')
+
+        self.sync_shards = int(os.environ.get('UNUM_SYNC_SHARDS', 1))
+        if self.sync_shards < 1:
+            raise ValueError(f'UNUM_SYNC_SHARDS must be a positive integer: {self.sync_shards}')
+
+        self.read_concurrency = int(os.environ.get('UNUM_READ_CONCURRENCY', 8))
+        if self.read_concurrency < 1:
+            raise ValueError(f'UNUM_READ_CONCURRENCY must be a positive integer: {self.read_concurrency}')
+
+        self.write_concurrency = int(os.environ.get('UNUM_WRITE_CONCURRENCY', 8))
+        if self.write_concurrency < 1:
+            raise ValueError(f'UNUM_WRITE_CONCURRENCY must be a positive integer: {self.write_concurrency}')
+
+        self.ttl = int(os.environ.get('UNUM_CHECKPOINT_TTL', 0))
+
+        self.fused_checkpoint = os.environ.get('UNUM_FUSED_CHECKPOINT', 'false').lower() == 'true'
+        if self.fused_checkpoint and self.sync_mode != 'counter':
+            raise ValueError(f'UNUM_FUSED_CHECKPOINT requires UNUM_SYNC_MODE=counter. Got {self.sync_mode}')
+
+        self.codec = CheckpointCodec.create(os.environ.get('UNUM_CHECKPOINT_CODEC', 'json'))
+
+        self.execution_lease = int(os.environ.get('UNUM_EXECUTION_LEASE', 0))
+
+        # size the connection pools for concurrent reads and deletes, and
+        # create the clients during cold start, unless they are lazy
+        ClientFactory.reserve_connections('dynamodb', max(self.read_concurrency, self.write_concurrency))
+        if LAZY_CLIENTS == False:
+            self.client, self.table
+
+
+
+    @property
+    def client(self):
+        '''The boto3 DynamoDB client. See lazy_client() and
+        clients.ClientFactory
+        '''
+        return self.lazy_client('client', lambda: ClientFactory.client('dynamodb'))
+
+
+
+    @property
+    def resource(self):
+        '''The boto3 DynamoDB service resource. See lazy_client() and
+        clients.ClientFactory
+        '''
+        return self.lazy_client('resource', lambda: ClientFactory.resource('dynamodb'))
+
+
+
+    @property
+    def table(self):
+        return self.lazy_client('table', lambda: self.resource.Table(self.name))
+
+
+
+    def _ttl_attributes(self):
+        '''Return the TTL attribute to write with a new item, if any
+        '''
+        if self.ttl <= 0:
+            return {}
+
+        return {self.TTL_ATTRIBUTE: int(time.time()) + self.ttl}
 
 
     def read_input(self, session, values):
@@ -427,9 +925,13 @@ class DynamoDBDriver(UnumIntermediaryDataStore):
         results by adding the data onto Lambda's event queue. Therefore, the
         `values` parameter should always be a list. We don't consider the
         scenario where `values` is a dict.
+
+        Keys are read in batches of up to 100 with up to
+        `self.read_concurrency` batches in flight. Each batch retries its
+        UnprocessedKeys with exponential backoff. Results are placed directly
+        into their position in the returned list.
         '''
         item_names = [f'{session}/{v}-output' for v in values]
-        request_keys = [{'Name': k} for k in item_names]
 
         '''
         # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/dynamodb.html#DynamoDB.ServiceResource.batch_get_item
@@ -492,51 +994,89 @@ class DynamoDBDriver(UnumIntermediaryDataStore):
         UnprocessedKeys .
         '''
 
-        all_ret = []
+        # positions of each item in the returned list
+        order = {}
+        for i, n in enumerate(item_names):
+            order.setdefault(n, []).append(i)
 
-        for i in range(math.ceil(len(request_keys)/100)):
-            this_batch = request_keys[i*100:(i+1)*100]
+        vals = [None] * len(item_names)
 
-            this_batch_items = self.resource.batch_get_item(
-                RequestItems={
-                    self.name: {
-                        'Keys': this_batch,
-                        'ConsistentRead': True,
-                    }
-                })
+        unique_names = list(order.keys())
+        batches = [unique_names[i:i+self.BATCH_GET_SIZE] for i in range(0, len(unique_names), self.BATCH_GET_SIZE)]
 
-            try:
-                ret = this_batch_items['Responses'][self.name]
-                all_ret = all_ret+ret
+        def _read_batch(batch):
+            items, retries = self._batch_get(batch)
+            for e in items:
+                item = {
+                    'User': serde.loads(CheckpointCodec.decode(e['User'])),
+                    'Name': e['Name']
+                }
+                if 'GC' in e:
+                    item['GC'] = e['GC']
 
-            except KeyError as e:
-                print(this_batch_items)
-                raise e
+                for i in order[e['Name']]:
+                    vals[i] = item
 
-        # return a sorted array by the originally requested order
-        order = {n: i for i, n in enumerate(item_names)}
+            return retries
 
-        vals = []
+        if len(batches) <= 1 or self.read_concurrency == 1:
+            retries = [_read_batch(b) for b in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.read_concurrency, len(batches))) as executor:
+                retries = list(executor.map(_read_batch, batches))
 
-        for e in sorted(all_ret, key=lambda d: order[d['Name']]):
-            item = {
-                'User': json.loads(e['User']),
-                'Name': e['Name']
+        if self.debug or sum(retries) > 0:
+            print(f'[METRIC] read_input: {len(item_names)} items, {len(batches)} batches, {sum(retries)} UnprocessedKeys retries, max {max(retries, default=0)} retries in a batch')
+
+        found = [v for v in vals if v != None]
+
+        if len(found) < len(values):
+            print(f'[WARN] Not all values for fan-in were read from {self.my_type}')
+            print(f'[WARN] Expect {len(values)}. Got {len(found)}')
+            print(f'[WARN] Missing: {[item_names[i] for i, v in enumerate(vals) if v == None]}')
+
+        return found
+
+
+
+    def _batch_get(self, names):
+        '''Read the items named `names` with BatchGetItem, retrying
+        UnprocessedKeys with exponential backoff and full jitter.
+
+        Uses the resource's underlying client because boto3 resources are not
+        thread-safe while clients are.
+
+        @param names at most BATCH_GET_SIZE item names
+
+        @return (list of items found, number of retries)
+        '''
+        request_items = {
+            self.name: {
+                'Keys': [{'Name': n} for n in names],
+                'ConsistentRead': True,
             }
-            if 'GC' in e:
-                item['GC'] = e['GC']
+        }
+        items = []
+        retries = 0
 
-            vals.append(item)
+        while True:
+            ret = self.resource.meta.client.batch_get_item(RequestItems=request_items)
 
+            try:
+                items.extend(ret['Responses'][self.name])
+            except KeyError as e:
+                print(ret)
+                raise e
 
-        if len(vals) < len(values):
-            print(f'[WARN] Not all values for fan-in were read from {self.my_type}')
-            print(f'[WARN] Expect {len(values)}. Got {len(vals)}')
-            print(all_ret)
-        elif len(vals) > len(values):
-            print(f'[WARN] More fan-in values read from {self.my_type} than expanded')
+            request_items = ret.get('UnprocessedKeys', {})
+            if request_items == {} or self.name not in request_items:
+                return items, retries
 
-        return vals
+            if retries == self.BATCH_GET_MAX_RETRIES:
+                raise IOError(f'{len(request_items[self.name]["Keys"])} keys still unprocessed after {retries} BatchGetItem retries')
+
+            backoff(retries)
+            retries = retries + 1
 
 
 
@@ -545,7 +1085,8 @@ class DynamoDBDriver(UnumIntermediaryDataStore):
         checkpoint's contents or None if the checkpoint doesn't exist.
 
         This function uses DynamoDB's GetItem API and request to read the
-        `Value` field from the item.
+        `User` field from the item, and returns the user function output
+        decoded from it.
 
         There doesn't seem to be a faster API to only check whether an item
         exists in DynamoDB without getting some of its attributes. GetItem
@@ -575,16 +1116,16 @@ class DynamoDBDriver(UnumIntermediaryDataStore):
                     'Name': self.checkpoint_name(session, instance_name)
                 },
                 ConsistentRead=True,
-                ProjectionExpression='#Value',
+                ProjectionExpression='#User',
                 ExpressionAttributeNames= {
-                    '#Value': 'Value'
+                    '#User': 'User'
                 })
         except Exception as e:
             print(f"[WARN] get_checkpoint() Error Code: {e.response['Error']['Code']}")
             raise e
 
         if "Item" in ret:
-            return ret["Item"]["Value"]
+            return serde.loads(CheckpointCodec.decode(ret["Item"]["User"]))
         else:
             return None
 
@@ -596,7 +1137,7 @@ class DynamoDBDriver(UnumIntermediaryDataStore):
 
         @return a positive integer if success. -1 if the key already exists.
         '''
-        item = {key_name: key, **value}
+        item = {key_name: key, **value, **self._ttl_attributes()}
         try:
             if self.debug:
                 rsp = self.table.put_item(Item=item,
@@ -649,14 +1190,15 @@ class DynamoDBDriver(UnumIntermediaryDataStore):
         {
             "Session": "a uuid4 string",
             "Name": "<session>/<instance_name>-output",
-            "Value": "function result as a JSON string"
+            "User": "function result as a JSON string",
+            "GC": {gc edges}
         }
         ```
 
         The "Name" field is the primary key.
 
-        The "Value" field is of type string and is
-        json.dumps(data)
+        The "User" field is a string, or, with a compressing CheckpointCodec,
+        a Binary of the encoded string. See _encode_checkpoint().
 
         This function will only try to write if an item with the same "Name"
         does NOT already exists. If an item with the same "Name" already
@@ -666,7 +1208,17 @@ class DynamoDBDriver(UnumIntermediaryDataStore):
         If the data to write failed DynamoDB's schema validation, return 2.
         '''
 
-        return self._create_if_not_exist("Name", self.checkpoint_name(session, instance_name), data)
+        return self._create_if_not_exist("Name", self.checkpoint_name(session, instance_name), self._encode_checkpoint(data))
+
+
+
+    def _encode_checkpoint(self, data):
+        '''Return the checkpoint `data` with "User" encoded by self.codec
+        '''
+        if "User" not in data:
+            return data
+
+        return {**data, "User": self.codec.encode(data["User"])}
 
 
 
@@ -700,67 +1252,333 @@ class DynamoDBDriver(UnumIntermediaryDataStore):
 
 
 
-    def gc_sync_point_name(self, session, parent_function_instance_name):
-
-        return f'{session}/{parent_function_instance_name}-gc'
-
-
+    def delete_checkpoints(self, session, instance_names):
+        return self._batch_delete(self._checkpoint_item_names(session, instance_names))
 
-    def fanin_sync_point_name(self, session, aggregation_function_instance_name):
 
-        return f'{session}/{aggregation_function_instance_name}-fanin'
 
+    def _checkpoint_item_names(self, session, instance_names):
+        '''Return the names of the checkpoints of `instance_names` and, with
+        execution leases, of their leases
+        '''
+        names = [self.checkpoint_name(session, n) for n in instance_names]
+        if self.execution_lease > 0:
+            names.extend(self.lease_name(session, n) for n in instance_names)
 
+        return names
 
-    def gc_sync_ready(self, session, parent_function_instance_name, index, num_branches):
-        '''Mark my gc as ready and check if gc is ready to run
 
-        In the case of a parent node invoking multiple downstream child nodes,
-        all child nodes need to have created their checkpoints before the
-        parent node's checkpoint can be garbage collected. Unum have all child
-        nodes synchronize via the intermediate datastore so that the
-        last-to-finish child node deletes the parent's checkpoint.
 
-        The synchronization item is named by the gc_sync_point_name() function
-        based on the session ID and the parent function's instance name.
+    def lease_name(self, session, instance_name):
+        return f'{session}/{instance_name}-lease'
 
-        @return True is I'm the last-to-finish child node. False if I'm not.
-        '''
 
-        return self._sync_ready(self.gc_sync_point_name(session, parent_function_instance_name), index, num_branches)
 
+    def claim_execution(self, session, instance_name, owner):
+        '''Claim the lease to run the user function of a function instance
 
+        A conditional PutItem writes the lease item
 
-    def fanin_sync_ready(self, session, aggregation_function_instance_name, index, num_branches):
-        '''Mark my branch as ready and check if fan-in is ready to run
+            {
+                "Name": "<session>/<instance_name>-lease",
+                "Owner": owner,
+                "ExpireAt": now + self.execution_lease
+            }
 
-        In the case of fan-in, all upstream branches need to have created
-        their checkpoints before the aggregation function is invoked. Unum
-        have all branches synchronize via the intermediate datastore so that only
-        the last-to-finish branch invokes the aggregation function.
+        if the lease does not exist, is already held by `owner` (e.g., a
+        platform retry of the same invocation), or has expired. Otherwise, the
+        claim fails and the caller is a concurrent duplicate of the lease
+        holder. An execution that outlives its lease may therefore run
+        concurrently with a duplicate, in which case the conditional
+        checkpoint decides which one invokes the continuations, as without
+        leases.
 
-        The synchronization item is named by the fanin_sync_point_name() function
-        based on the session ID and the aggregation function's instance name.
+        Leases are garbage collected with their instance's checkpoint. With
+        DynamoDB TTL enabled on "ExpireAt", leases that garbage collection
+        misses are eventually deleted by DynamoDB.
 
-        @return True is I'm the last-to-finish branch. False if I'm not.
+        @return True if `owner` holds the lease. False if another owner does.
         '''
+        now = int(time.time())
+        item = {
+            "Name": self.lease_name(session, instance_name),
+            "Owner": owner,
+            self.TTL_ATTRIBUTE: now + self.execution_lease
+        }
 
-        return self._sync_ready(self.fanin_sync_point_name(session, aggregation_function_instance_name), index, num_branches)
+        try:
+            self.table.put_item(Item=item,
+                ConditionExpression='attribute_not_exists(#N) OR #O = :o OR #E < :now',
+                ExpressionAttributeNames={"#N": "Name", "#O": "Owner", "#E": self.TTL_ATTRIBUTE},
+                ExpressionAttributeValues={':o': owner, ':now': now})
+        except ClientError as e:
+            if e.response['Error']['Code']=='ConditionalCheckFailedException':
+                return False
+            raise e
 
+        return True
 
 
-    def _sync_ready(self, sync_point_name, index, num_branches):
-        '''Mark the caller ready and return the return map
 
-        @param sync_point_name DynamoDB primary key of the synchronization item
-        @param index caller's index in the synchronization item
-        @param num_branches the number of nodes that need to synchronize
+    def delete_sync_points(self, sync_point_names):
+        '''Delete synchronization items, including all their shards
         '''
-        return self._sync_ready_bitmap(sync_point_name, index, num_branches)
+        names = []
+        for n in sync_point_names:
+            names.append(n)
+            names.extend(self.sync_point_shard_names(n))
+
+        return self._batch_delete(names)
+
+
+
+    def gc_log_names(self, session):
+        '''Return the names of the items of a session's deferred gc log
+        '''
+        return [f'{session}/gc-log-{s}' for s in range(self.GC_LOG_SHARDS)]
+
+
+
+    def append_gc_log(self, session, instance_name, checkpoints, sync_points):
+        '''Record checkpoints and synchronization items (including their
+        shards) in the session's gc log for sweep_gc_log() to delete
+
+        The log is a string set of item names, spread over GC_LOG_SHARDS
+        items by the caller's instance name so that functions of wide
+        fan-outs do not all write to the same item. Appending the same names
+        more than once is harmless.
+        '''
+        names = self._checkpoint_item_names(session, checkpoints)
+        for n in sync_points:
+            names.append(n)
+            names.extend(self.sync_point_shard_names(n))
+
+        if len(names) == 0:
+            return
+
+        log_name = self.gc_log_names(session)[zlib.crc32(instance_name.encode('utf-8')) % self.GC_LOG_SHARDS]
+
+        update_expression = "ADD #D :names"
+        attribute_values = {':names': set(names)}
+        attribute_names = {"#D": "Deletes"}
+
+        ttl = self._ttl_attributes()
+        if ttl != {}:
+            update_expression = "SET #E = if_not_exists(#E, :e) ADD #D :names"
+            attribute_values[':e'] = ttl[self.TTL_ATTRIBUTE]
+            attribute_names['#E'] = self.TTL_ATTRIBUTE
+
+        self.table.update_item(
+            Key={"Name": log_name},
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=attribute_values,
+            ExpressionAttributeNames=attribute_names)
+
+
+
+    def sweep_gc_log(self, session):
+        '''Batch delete every item recorded in the session's gc log, and
+        then the log itself
+
+        @return the number of items recorded in the log
+        '''
+        log_names = self.gc_log_names(session)
+        logs, retries = self._batch_get(log_names)
+
+        names = [n for l in logs for n in l.get("Deletes", [])]
+        self._batch_delete(names)
+        self._batch_delete(log_names)
+
+        return len(names)
+
+
+
+    def _batch_delete(self, names):
+        '''Delete items by name with BatchWriteItem
+
+        Names are deduplicated and split into groups of BATCH_WRITE_SIZE, with
+        up to `self.write_concurrency` groups in flight. Each group retries its
+        UnprocessedItems with exponential backoff. Deleting an item that does
+        not exist is not an error.
+
+        @return the number of BatchWriteItem requests made
+        '''
+        names = list(dict.fromkeys(names))
+        groups = [names[i:i+self.BATCH_WRITE_SIZE] for i in range(0, len(names), self.BATCH_WRITE_SIZE)]
+
+        if len(groups) <= 1 or self.write_concurrency == 1:
+            requests = [self._batch_delete_group(g) for g in groups]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.write_concurrency, len(groups))) as executor:
+                requests = list(executor.map(self._batch_delete_group, groups))
+
+        if self.debug:
+            print(f'[DEBUG] Deleted {len(names)} items with {sum(requests)} BatchWriteItem requests')
+
+        return sum(requests)
+
+
+
+    def _batch_delete_group(self, names):
+        request_items = {
+            self.name: [{'DeleteRequest': {'Key': {'Name': n}}} for n in names]
+        }
+        retries = 0
+
+        while True:
+            ret = self.resource.meta.client.batch_write_item(RequestItems=request_items)
+
+            request_items = ret.get('UnprocessedItems', {})
+            if request_items == {} or self.name not in request_items:
+                return retries + 1
+
+            if retries == self.BATCH_WRITE_MAX_RETRIES:
+                raise IOError(f'{len(request_items[self.name])} deletes still unprocessed after {retries} BatchWriteItem retries')
+
+            backoff(retries)
+            retries = retries + 1
+
+
+
+    def gc_sync_point_name(self, session, parent_function_instance_name):
+
+        return f'{session}/{parent_function_instance_name}-gc'
+
+
+
+    def fanin_sync_point_name(self, session, aggregation_function_instance_name):
+
+        return f'{session}/{aggregation_function_instance_name}-fanin'
+
+
+
+    def gc_sync_ready(self, session, parent_function_instance_name, index, my_instance_name, num_branches):
+        '''Mark my gc as ready and check if gc is ready to run
+
+        In the case of a parent node invoking multiple downstream child nodes,
+        all child nodes need to have created their checkpoints before the
+        parent node's checkpoint can be garbage collected. Unum have all child
+        nodes synchronize via the intermediate datastore so that the
+        last-to-finish child node deletes the parent's checkpoint.
+
+        The synchronization item is named by the gc_sync_point_name() function
+        based on the session ID and the parent function's instance name.
+
+        @return True is I'm the last-to-finish child node. False if I'm not.
+        '''
+
+        return self._sync_ready(self.gc_sync_point_name(session, parent_function_instance_name), index, my_instance_name, num_branches)
+
+
+
+    def fanin_sync_ready(self, session, aggregation_function_instance_name, index, my_instance_name, num_branches):
+        '''Mark my branch as ready and check if fan-in is ready to run
+
+        In the case of fan-in, all upstream branches need to have created
+        their checkpoints before the aggregation function is invoked. Unum
+        have all branches synchronize via the intermediate datastore so that only
+        the last-to-finish branch invokes the aggregation function.
+
+        The synchronization item is named by the fanin_sync_point_name() function
+        based on the session ID and the aggregation function's instance name.
+
+        @return True is I'm the last-to-finish branch. False if I'm not.
+        '''
+
+        return self._sync_ready(self.fanin_sync_point_name(session, aggregation_function_instance_name), index, my_instance_name, num_branches)
+
+
+
+    def sync_point_shard_names(self, sync_point_name, num_branches=None):
+        '''Return the names of the shard items of a synchronization point
+
+        Empty if the synchronization point with `num_branches` branches is not
+        sharded. See _sync_ready(). If `num_branches` is None, return the
+        names of all shards the synchronization point may have.
+        '''
+        if self.sync_shards <= 1:
+            return []
+
+        if num_branches != None and num_branches <= self.sync_shards:
+            return []
+
+        return [f'{sync_point_name}-{s}' for s in range(self.sync_shards)]
+
+
+
+    def _sync_ready(self, sync_point_name, index, my_instance_name, num_branches):
+        '''Mark the caller ready and return whether all branches are ready.
+
+        With more than `self.sync_shards` branches, the synchronization point
+        is sharded into `self.sync_shards` items so that no single item is a
+        hot key or grows with the fan-in width. Branch `index` synchronizes on
+        shard `index % K` (named `{sync_point_name}-{index % K}`) at position
+        `index // K`. The branch that completes its shard then marks the shard
+        complete on the root item named `sync_point_name`, and only the branch
+        that completes the last shard sees the whole synchronization point
+        ready. Because each shard has exactly one completing branch, at most
+        one branch across all shards returns True (aside from duplicates of
+        that branch, as without sharding).
+
+        @param sync_point_name DynamoDB primary key of the synchronization item
+        @param index caller's index in the synchronization item
+        @param my_instance_name caller's instance name. Unused by DynamoDB
+            because branches are identified by their index.
+        @param num_branches the number of nodes that need to synchronize
+
+        @return True if all branches are ready. False if not.
+        '''
+        shard_names = self.sync_point_shard_names(sync_point_name, num_branches)
+
+        if shard_names == []:
+            return self._mark_ready(sync_point_name, index, num_branches)
+
+        k = len(shard_names)
+        shard = index % k
+        # branches i < num_branches with i % k == shard
+        shard_size = math.ceil((num_branches - shard) / k)
+
+        if self._mark_ready(shard_names[shard], index // k, shard_size) == False:
+            return False
+
+        return self._mark_ready(sync_point_name, shard, k)
+
+
+
+    def _mark_ready(self, sync_point_name, index, num_branches):
+        '''Mark the caller ready on a single synchronization item and return
+        whether all branches of the item are ready.
+
+        Two synchronization modes are supported, selected by self.sync_mode:
+
+            1. "bitmap" (default): see _sync_ready_bitmap()
+
+            2. "counter": see _sync_ready_counter()
+
+        Both modes are idempotent under duplicate executions of the same
+        branch: a duplicate never counts twice, and a duplicate of a branch
+        that already completed the synchronization also sees it complete.
+
+        @return True if all branches are ready. False if not.
+        '''
+        if self.sync_mode == 'counter':
+            return self._sync_ready_counter(sync_point_name, index, num_branches)
+
+        return self._sync_ready_bitmap(sync_point_name, index, num_branches)
 
 
 
     def _sync_ready_bitmap(self, sync_point_name, index, num_branches):
+        '''Synchronize using a list of booleans in DynamoDB
+
+        First create a list of `num_branches` False's if the item does not
+        yet exist. Then set the element at `index` to True and read back the
+        whole list.
+
+        This takes 2 round-trips per branch and every branch reads back the
+        entire list. An N-way fan-in therefore transfers O(N^2) bytes in
+        total.
+        '''
         self._create_bitmap(sync_point_name, num_branches)
         ready_map = self._update_bitmap_result(sync_point_name, index)
 
@@ -804,7 +1622,219 @@ class DynamoDBDriver(UnumIntermediaryDataStore):
 
 
     def _sync_ready_counter(self, sync_point_name, index, num_branches):
-        pass
+        '''Synchronize using a counter in DynamoDB
+
+        A single UpdateItem marks the caller by setting an attribute named
+        after its index and atomically increments the "ReadyCount" attribute,
+        on the condition that the caller's attribute does not exist yet. The
+        update creates the item if it does not exist, so there is no separate
+        create step, and only the two updated attributes are returned.
+
+        If the condition fails, the caller is a duplicate of a branch that
+        already marked itself. The counter is not incremented again and the
+        caller reads the current count instead so that a duplicate of the
+        last-to-finish branch still sees the synchronization complete.
+
+        @return True if all branches are ready. False if not.
+        '''
+        update_expression, attribute_values, attribute_names = self._counter_update(index)
+
+        try:
+            ret = self.table.update_item(
+                Key={"Name": sync_point_name},
+                ReturnValues='UPDATED_NEW',
+                UpdateExpression=update_expression,
+                ConditionExpression='attribute_not_exists(#I)',
+                ExpressionAttributeValues=attribute_values,
+                ExpressionAttributeNames=attribute_names)
+
+            count = ret['Attributes']['ReadyCount']
+
+        except ClientError as e:
+            if e.response['Error']['Code']=='ConditionalCheckFailedException':
+                count = self._read_ready_count(sync_point_name)
+            else:
+                raise e
+
+        return count == num_branches
+
+
+
+    def _counter_update(self, index):
+        '''Return the UpdateExpression, ExpressionAttributeValues and
+        ExpressionAttributeNames that mark branch `index` on a counter
+        synchronization item
+        '''
+        update_expression = "SET #I = :t ADD #C :incr"
+        attribute_values = {':t': True, ':incr': 1}
+        attribute_names = {"#I": str(index), "#C": "ReadyCount"}
+
+        ttl = self._ttl_attributes()
+        if ttl != {}:
+            update_expression = "SET #I = :t, #E = if_not_exists(#E, :e) ADD #C :incr"
+            attribute_values[':e'] = ttl[self.TTL_ATTRIBUTE]
+            attribute_names['#E'] = self.TTL_ATTRIBUTE
+
+        return update_expression, attribute_values, attribute_names
+
+
+
+    def checkpoint_fanin_sync_ready(self, session, instance_name, data, aggregation_function_instance_name, index, num_branches):
+        '''Checkpoint a fan-in branch and mark it ready in one transaction
+
+        Without fused checkpoints, a fan-in branch makes a conditional put for
+        its checkpoint followed by the synchronization requests of
+        _sync_ready(). With self.fused_checkpoint, a single TransactWriteItems
+        puts the checkpoint, on the condition that it does not exist, and
+        marks the branch on the counter synchronization item (see
+        _sync_ready_counter()), on the condition that the branch is not
+        marked yet and that the count *before* the increment is less than
+        `num_branches - 1`.
+
+        A transaction does not return the updated count. Instead, the count
+        condition only fails for the last-to-finish branch: every other branch
+        succeeds in one round-trip and knows it is not the last. The last
+        branch retries the transaction without the count condition and is
+        ready when it succeeds, i.e., it takes 2 round-trips.
+
+        The reasons of a cancelled transaction are told apart per item (see
+        _transact_checkpoint_mark()). Only a failed condition on the
+        checkpoint or on the branch's mark means that a previous execution of
+        this branch already checkpointed, and only a failed count condition
+        makes this branch the last. Conflicts with concurrent branches'
+        transactions on the synchronization item and throttling are retried,
+        and any other cancellation raises an IOError.
+
+        Because the checkpoint and the mark are written atomically, a branch
+        never leaves a checkpoint behind without being counted.
+
+        Sharded synchronization points (see _sync_ready()) are not fused.
+
+        @return (ret, ready) where ret is 1 if the checkpoint is written and
+            -1 if a checkpoint (and mark) of this branch already exists, as in
+            checkpoint(), and ready is True if I'm the last-to-finish branch.
+        '''
+        sync_point_name = self.fanin_sync_point_name(session, aggregation_function_instance_name)
+
+        if self.fused_checkpoint == False or self.sync_point_shard_names(sync_point_name, num_branches) != []:
+            return super(DynamoDBDriver, self).checkpoint_fanin_sync_ready(session, instance_name, data, aggregation_function_instance_name, index, num_branches)
+
+        checkpoint_item = {"Name": self.checkpoint_name(session, instance_name), **self._encode_checkpoint(data), **self._ttl_attributes()}
+
+        if num_branches > 1:
+            ret = self._transact_checkpoint_mark(checkpoint_item, sync_point_name, index, num_branches - 1)
+
+            if ret == 'written':
+                return 1, False
+
+            if ret == 'duplicate':
+                # a previous execution of this branch already checkpointed
+                return -1, False
+
+        # I'm the last-to-finish branch
+        ret = self._transact_checkpoint_mark(checkpoint_item, sync_point_name, index, None)
+
+        if ret == 'written':
+            return 1, True
+
+        return -1, False
+
+
+
+    def _transact_checkpoint_mark(self, checkpoint_item, sync_point_name, index, max_ready_count):
+        '''Put a checkpoint and mark branch `index` on a counter
+        synchronization item in one TransactWriteItems
+
+        Transactions cancelled by a TransactionConflict or throttling on
+        either item are retried with exponential backoff and full jitter.
+
+        @param max_ready_count if not None, the transaction is also
+            conditioned on the "ReadyCount" before the increment being less
+            than max_ready_count
+
+        @return 'written' if the transaction succeeds, 'duplicate' if the
+            checkpoint exists or branch `index` is already marked, and
+            'count' if the count condition failed
+
+        Raises IOError if the transaction is cancelled for any other reason,
+        or is still conflicting or throttled after TRANSACTION_MAX_RETRIES
+        retries.
+        '''
+        update_expression, attribute_values, attribute_names = self._counter_update(index)
+        condition_expression = 'attribute_not_exists(#I)'
+
+        if max_ready_count != None:
+            condition_expression = 'attribute_not_exists(#I) AND (attribute_not_exists(#C) OR #C < :max)'
+            attribute_values[':max'] = max_ready_count
+
+        transact_items = [
+            {
+                'Put': {
+                    'TableName': self.name,
+                    'Item': checkpoint_item,
+                    'ConditionExpression': 'attribute_not_exists(#N)',
+                    'ExpressionAttributeNames': {"#N": "Name"}
+                }
+            },
+            {
+                'Update': {
+                    'TableName': self.name,
+                    'Key': {"Name": sync_point_name},
+                    'UpdateExpression': update_expression,
+                    'ConditionExpression': condition_expression,
+                    'ExpressionAttributeValues': attribute_values,
+                    'ExpressionAttributeNames': attribute_names,
+                    'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'
+                }
+            }
+        ]
+        retries = 0
+
+        while True:
+            try:
+                self.resource.meta.client.transact_write_items(TransactItems=transact_items)
+                return 'written'
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'TransactionCanceledException' or 'CancellationReasons' not in e.response:
+                    raise e
+
+                reasons = e.response['CancellationReasons']
+
+            checkpoint_code = reasons[0].get('Code')
+            sync_point_code = reasons[1].get('Code')
+
+            if checkpoint_code == 'ConditionalCheckFailed':
+                return 'duplicate'
+
+            if sync_point_code == 'ConditionalCheckFailed':
+                if str(index) in reasons[1].get('Item', {}):
+                    return 'duplicate'
+
+                if max_ready_count != None:
+                    return 'count'
+
+            elif checkpoint_code in self.TRANSACTION_RETRY_CODES or sync_point_code in self.TRANSACTION_RETRY_CODES:
+                if retries == self.TRANSACTION_MAX_RETRIES:
+                    raise IOError(f'Checkpoint transaction on {sync_point_name} still cancelled after {retries} retries: {checkpoint_code}, {sync_point_code}')
+
+                backoff(retries)
+                retries = retries + 1
+                continue
+
+            raise IOError(f'Checkpoint transaction on {sync_point_name} cancelled: {checkpoint_code}, {sync_point_code}')
+
+
+
+    def _read_ready_count(self, sync_point_name):
+        '''Return the "ReadyCount" of a counter synchronization item
+        '''
+        ret = self.table.get_item(
+            Key={"Name": sync_point_name},
+            ConsistentRead=True,
+            ProjectionExpression='#C',
+            ExpressionAttributeNames={"#C": "ReadyCount"})
+
+        return ret["Item"]["ReadyCount"]
 
 
 
@@ -870,6 +1900,1044 @@ class DynamoDBDriver(UnumIntermediaryDataStore):
 
 
 
+@UnumIntermediaryDataStore.add_datastore('memory')
+class MemoryDriver(UnumIntermediaryDataStore):
+    '''An intermediary data store in the memory of the current process
+
+    Used with the local executor (see local.py) to run every function of a
+    workflow in one process. All MemoryDriver instances with the same name
+    share the same items, so the functions of a workflow see each other's
+    checkpoints and synchronization items. Checkpoints are stored as JSON
+    strings so that readers never share objects with the writer, as with a
+    remote data store.
+
+    Execution leases (UNUM_EXECUTION_LEASE) are supported as with
+    DynamoDBDriver. See claim_execution().
+    '''
+
+    # name -> {item name -> item}
+    tables = {}
+    tables_lock = threading.Lock()
+
+    def __init__(self, ds_name, debug):
+        super(MemoryDriver, self).__init__("memory", ds_name, debug)
+
+        self.deferred_gc = True
+
+        self.execution_lease = int(os.environ.get('UNUM_EXECUTION_LEASE', 0))
+
+        with MemoryDriver.tables_lock:
+            self.table = MemoryDriver.tables.setdefault(self.name, {})
+
+        self.lock = threading.Lock()
+
+
+
+    @classmethod
+    def clear(cls, ds_name):
+        '''Remove all items of the data store named `ds_name`
+        '''
+        with cls.tables_lock:
+            cls.tables.get(ds_name, {}).clear()
+
+
+
+    def checkpoint_name(self, session, instance_name):
+        return f'{session}/{instance_name}-output'
+
+
+
+    def checkpoint(self, session, instance_name, data):
+        '''Store `data` as the function instance's checkpoint
+
+        @return 1 if successful. -1 if a checkpoint already exists.
+        '''
+        name = self.checkpoint_name(session, instance_name)
+        value = json.dumps(data)
+
+        with self.lock:
+            if name in self.table:
+                return -1
+            self.table[name] = value
+
+        return 1
+
+
+
+    def get_checkpoint(self, session, instance_name):
+        '''Return the user function output in the checkpoint or None if the
+        checkpoint doesn't exist
+        '''
+        value = self.table.get(self.checkpoint_name(session, instance_name))
+        if value == None:
+            return None
+
+        return serde.loads(json.loads(value)["User"])
+
+
+
+    def read_input(self, session, values):
+        '''Given the session id and a list of instance names, return their
+        checkpoints in the same order, as DynamoDBDriver.read_input() does
+        '''
+        ret = []
+        for v in values:
+            value = self.table.get(self.checkpoint_name(session, v))
+            if value == None:
+                print(f'[WARN] Not all values for fan-in were read from {self.my_type}. Missing: {v}')
+                continue
+
+            ckpt = json.loads(value)
+            item = {
+                'User': serde.loads(ckpt['User']),
+                'Name': self.checkpoint_name(session, v)
+            }
+            if 'GC' in ckpt:
+                item['GC'] = ckpt['GC']
+
+            ret.append(item)
+
+        return ret
+
+
+
+    def delete_checkpoint(self, session, instance_name):
+        with self.lock:
+            self.table.pop(self.checkpoint_name(session, instance_name), None)
+            self.table.pop(self.lease_name(session, instance_name), None)
+
+
+
+    def lease_name(self, session, instance_name):
+        return f'{session}/{instance_name}-lease'
+
+
+
+    def claim_execution(self, session, instance_name, owner):
+        '''Claim the lease to run the user function of a function instance
+
+        The lease is an (owner, expiration time) item. The claim succeeds if
+        the lease does not exist, is already held by `owner`, or has expired,
+        as DynamoDBDriver.claim_execution()'s conditional put.
+
+        @return True if `owner` holds the lease. False if another owner does.
+        '''
+        name = self.lease_name(session, instance_name)
+        now = time.time()
+
+        with self.lock:
+            lease = self.table.get(name)
+            if lease != None and lease[0] != owner and lease[1] >= now:
+                return False
+
+            self.table[name] = (owner, now + self.execution_lease)
+
+        return True
+
+
+
+    def gc_sync_point_name(self, session, parent_function_instance_name):
+        return f'{session}/{parent_function_instance_name}-gc'
+
+
+
+    def fanin_sync_point_name(self, session, aggregation_function_instance_name):
+        return f'{session}/{aggregation_function_instance_name}-fanin'
+
+
+
+    def gc_sync_ready(self, session, parent_function_instance_name, index, my_instance_name, num_branches):
+        return self._sync_ready(self.gc_sync_point_name(session, parent_function_instance_name), index, num_branches)
+
+
+
+    def fanin_sync_ready(self, session, aggregation_function_instance_name, index, my_instance_name, num_branches):
+        return self._sync_ready(self.fanin_sync_point_name(session, aggregation_function_instance_name), index, num_branches)
+
+
+
+    def _sync_ready(self, sync_point_name, index, num_branches):
+        '''Add the caller's index to the set of ready branches and return
+        whether all branches are ready
+
+        Duplicates of a branch do not count twice, and a duplicate of the
+        last-to-finish branch also sees the synchronization complete.
+        '''
+        with self.lock:
+            ready = self.table.setdefault(sync_point_name, set())
+            ready.add(index)
+
+            return len(ready) == num_branches
+
+
+
+    def delete_sync_points(self, sync_point_names):
+        with self.lock:
+            for n in sync_point_names:
+                self.table.pop(n, None)
+
+
+
+    def gc_log_name(self, session):
+        return f'{session}/gc-log'
+
+
+
+    def append_gc_log(self, session, instance_name, checkpoints, sync_points):
+        names = [self.checkpoint_name(session, n) for n in checkpoints] + sync_points
+        if self.execution_lease > 0:
+            names.extend(self.lease_name(session, n) for n in checkpoints)
+
+        with self.lock:
+            self.table.setdefault(self.gc_log_name(session), set()).update(names)
+
+
+
+    def sweep_gc_log(self, session):
+        with self.lock:
+            names = self.table.pop(self.gc_log_name(session), set())
+            for n in names:
+                self.table.pop(n, None)
+
+        return len(names)
+
+
+
+@UnumIntermediaryDataStore.add_datastore('sqlite')
+class SQLiteDriver(UnumIntermediaryDataStore):
+    '''An intermediary data store in a SQLite database file
+
+    For workflows whose functions all run on one machine (or share a local
+    file system that supports SQLite's locking). `UnumIntermediaryDataStoreName`
+    is the path of the database file, which is created if it does not exist.
+    Use an absolute path because functions run in their own directories.
+
+    The database is in WAL mode so that readers do not block the writer and
+    the writer does not block readers. Writes from concurrent processes are
+    serialized by SQLite's write lock, and writers wait for the lock for up
+    to BUSY_TIMEOUT seconds. Each thread uses its own connection.
+
+    Tables:
+
+        checkpoints (name, data): the checkpoint as a JSON string
+
+        sync_points (name, branch): one row per ready branch of a
+            synchronization point
+
+        gc_log (session, name): items to delete with deferred gc
+
+        leases (name, owner, expire_at): execution leases. See
+            claim_execution()
+    '''
+
+    # SQLite limits the number of parameters in a statement (999 before 3.32)
+    BATCH_SIZE = 500
+    # Seconds a write waits for another connection's write lock
+    BUSY_TIMEOUT = 30
+
+    def __init__(self, ds_name, debug):
+        '''
+        `UNUM_SQLITE_SYNCHRONOUS` sets the database's synchronous pragma
+        (default FULL). NORMAL makes commits faster and is still safe from
+        corruption in WAL mode, but the most recent commits can be lost on a
+        power failure.
+        '''
+        super(SQLiteDriver, self).__init__("sqlite", ds_name, debug)
+
+        self.deferred_gc = True
+
+        self.synchronous = os.environ.get('UNUM_SQLITE_SYNCHRONOUS', 'FULL').upper()
+        if self.synchronous not in ['OFF', 'NORMAL', 'FULL', 'EXTRA']:
+            raise ValueError(f'Unknown UNUM_SQLITE_SYNCHRONOUS: {self.synchronous}. Supported values: OFF, NORMAL, FULL, EXTRA')
+
+        # the checkpoint and the fan-in mark are written in one transaction.
+        # See checkpoint_fanin_sync_ready()
+        self.fused_checkpoint = True
+
+        self.execution_lease = int(os.environ.get('UNUM_EXECUTION_LEASE', 0))
+
+        self.local = threading.local()
+
+        self._connection().executescript('''
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                name TEXT PRIMARY KEY,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sync_points (
+                name TEXT NOT NULL,
+                branch INTEGER NOT NULL,
+                PRIMARY KEY (name, branch)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS gc_log (
+                session TEXT NOT NULL,
+                name TEXT NOT NULL,
+                PRIMARY KEY (session, name)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expire_at REAL NOT NULL
+            );
+        ''')
+
+
+
+    def _connection(self):
+        '''Return this thread's connection to the database
+
+        Connections are in autocommit mode. Statements that must be atomic
+        together run in _transaction().
+        '''
+        conn = getattr(self.local, 'conn', None)
+
+        if conn == None:
+            conn = sqlite3.connect(self.name, timeout=self.BUSY_TIMEOUT, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(f'PRAGMA synchronous={self.synchronous}')
+            self.local.conn = conn
+
+        return conn
+
+
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        '''Run the statements in the with block in a write transaction
+
+        BEGIN IMMEDIATE takes the database's write lock up front, so the
+        reads in the transaction see the latest data and no other writer
+        commits in between.
+        '''
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        conn.execute('COMMIT')
+
+
+
+    def _batches(self, names):
+        return [names[i:i+self.BATCH_SIZE] for i in range(0, len(names), self.BATCH_SIZE)]
+
+
+
+    def checkpoint_name(self, session, instance_name):
+        return f'{session}/{instance_name}-output'
+
+
+
+    def checkpoint(self, session, instance_name, data):
+        '''Store `data` as the function instance's checkpoint if it does not
+        exist yet
+
+        @return 1 if successful. -1 if a checkpoint already exists.
+        '''
+        cur = self._connection().execute('INSERT OR IGNORE INTO checkpoints VALUES (?, ?)',
+            (self.checkpoint_name(session, instance_name), json.dumps(data)))
+
+        return 1 if cur.rowcount == 1 else -1
+
+
+
+    def get_checkpoint(self, session, instance_name):
+        '''Return the user function output in the checkpoint or None if the
+        checkpoint doesn't exist
+        '''
+        row = self._connection().execute('SELECT data FROM checkpoints WHERE name = ?',
+            (self.checkpoint_name(session, instance_name),)).fetchone()
+
+        if row == None:
+            return None
+
+        return serde.loads(json.loads(row[0])["User"])
+
+
+
+    def read_input(self, session, values):
+        '''Given the session id and a list of instance names, return their
+        checkpoints in the same order, as DynamoDBDriver.read_input() does
+
+        Checkpoints are read with one SELECT per BATCH_SIZE names.
+        '''
+        item_names = [self.checkpoint_name(session, v) for v in values]
+        conn = self._connection()
+
+        rows = {}
+        for batch in self._batches(list(dict.fromkeys(item_names))):
+            rows.update(conn.execute(f'SELECT name, data FROM checkpoints WHERE name IN ({",".join("?" * len(batch))})', batch))
+
+        ret = []
+        for n in item_names:
+            if n not in rows:
+                continue
+
+            ckpt = json.loads(rows[n])
+            item = {
+                'User': serde.loads(ckpt['User']),
+                'Name': n
+            }
+            if 'GC' in ckpt:
+                item['GC'] = ckpt['GC']
+
+            ret.append(item)
+
+        if len(ret) < len(values):
+            print(f'[WARN] Not all values for fan-in were read from {self.my_type}')
+            print(f'[WARN] Expect {len(values)}. Got {len(ret)}')
+            print(f'[WARN] Missing: {[n for n in item_names if n not in rows]}')
+
+        return ret
+
+
+
+    def delete_checkpoint(self, session, instance_name):
+        self.delete_checkpoints(session, [instance_name])
+
+
+
+    def delete_checkpoints(self, session, instance_names):
+        names = [self.checkpoint_name(session, n) for n in instance_names]
+        conn = self._connection()
+
+        for batch in self._batches(names):
+            conn.execute(f'DELETE FROM checkpoints WHERE name IN ({",".join("?" * len(batch))})', batch)
+
+        if self.execution_lease > 0:
+            names = [self.lease_name(session, n) for n in instance_names]
+            for batch in self._batches(names):
+                conn.execute(f'DELETE FROM leases WHERE name IN ({",".join("?" * len(batch))})', batch)
+
+
+
+    def lease_name(self, session, instance_name):
+        return f'{session}/{instance_name}-lease'
+
+
+
+    def claim_execution(self, session, instance_name, owner):
+        '''Claim the lease to run the user function of a function instance
+
+        An upsert writes the lease row if it does not exist, is already held
+        by `owner`, or has expired, as DynamoDBDriver.claim_execution()'s
+        conditional put. Otherwise, no row changes.
+
+        @return True if `owner` holds the lease. False if another owner does.
+        '''
+        now = time.time()
+
+        cur = self._connection().execute('''
+            INSERT INTO leases VALUES (?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expire_at = excluded.expire_at
+            WHERE owner = excluded.owner OR expire_at < ?
+        ''', (self.lease_name(session, instance_name), owner, now + self.execution_lease, now))
+
+        return cur.rowcount == 1
+
+
+
+    def gc_sync_point_name(self, session, parent_function_instance_name):
+        return f'{session}/{parent_function_instance_name}-gc'
+
+
+
+    def fanin_sync_point_name(self, session, aggregation_function_instance_name):
+        return f'{session}/{aggregation_function_instance_name}-fanin'
+
+
+
+    def gc_sync_ready(self, session, parent_function_instance_name, index, my_instance_name, num_branches):
+        with self._transaction() as conn:
+            return self._mark_ready(conn, self.gc_sync_point_name(session, parent_function_instance_name), index, num_branches)
+
+
+
+    def fanin_sync_ready(self, session, aggregation_function_instance_name, index, my_instance_name, num_branches):
+        with self._transaction() as conn:
+            return self._mark_ready(conn, self.fanin_sync_point_name(session, aggregation_function_instance_name), index, num_branches)
+
+
+
+    def _mark_ready(self, conn, sync_point_name, index, num_branches):
+        '''Mark the caller ready and return whether all branches are ready
+
+        Must run in a _transaction() so that the count includes exactly the
+        branches marked before this one. A duplicate of a branch does not
+        count twice, and a duplicate of the last-to-finish branch also sees
+        the synchronization complete.
+        '''
+        conn.execute('INSERT OR IGNORE INTO sync_points VALUES (?, ?)', (sync_point_name, int(index)))
+        count = conn.execute('SELECT COUNT(*) FROM sync_points WHERE name = ?', (sync_point_name,)).fetchone()[0]
+
+        return count == num_branches
+
+
+
+    def checkpoint_fanin_sync_ready(self, session, instance_name, data, aggregation_function_instance_name, index, num_branches):
+        '''Checkpoint a fan-in branch and mark it ready in one transaction
+
+        @return (ret, ready) as UnumIntermediaryDataStore.checkpoint_fanin_sync_ready()
+        '''
+        with self._transaction() as conn:
+            cur = conn.execute('INSERT OR IGNORE INTO checkpoints VALUES (?, ?)',
+                (self.checkpoint_name(session, instance_name), json.dumps(data)))
+
+            if cur.rowcount != 1:
+                return -1, False
+
+            return 1, self._mark_ready(conn, self.fanin_sync_point_name(session, aggregation_function_instance_name), index, num_branches)
+
+
+
+    def delete_sync_points(self, sync_point_names):
+        conn = self._connection()
+
+        for batch in self._batches(sync_point_names):
+            conn.execute(f'DELETE FROM sync_points WHERE name IN ({",".join("?" * len(batch))})', batch)
+
+
+
+    def append_gc_log(self, session, instance_name, checkpoints, sync_points):
+        names = [self.checkpoint_name(session, n) for n in checkpoints] + sync_points
+        if self.execution_lease > 0:
+            names.extend(self.lease_name(session, n) for n in checkpoints)
+
+        with self._transaction() as conn:
+            conn.executemany('INSERT OR IGNORE INTO gc_log VALUES (?, ?)', [(session, n) for n in names])
+
+
+
+    def sweep_gc_log(self, session):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM checkpoints WHERE name IN (SELECT name FROM gc_log WHERE session = ?)', (session,))
+            conn.execute('DELETE FROM sync_points WHERE name IN (SELECT name FROM gc_log WHERE session = ?)', (session,))
+            conn.execute('DELETE FROM leases WHERE name IN (SELECT name FROM gc_log WHERE session = ?)', (session,))
+            cur = conn.execute('DELETE FROM gc_log WHERE session = ?', (session,))
+
+            return cur.rowcount
+
+
+
+@UnumIntermediaryDataStore.add_datastore('redis')
+class RedisDriver(UnumIntermediaryDataStore):
+    '''An intermediary data store on a Redis server
+
+    `UnumIntermediaryDataStoreName` is the server's URL, e.g.,
+    redis://my-cache.example.com:6379/0 (rediss:// for TLS), or just
+    host:port.
+
+    Keys:
+
+        {session}/<instance name>-output: the checkpoint as a JSON string,
+            created with SET NX
+
+        {session}/<instance name>-fanin, {session}/<instance name>-gc: a
+            bitmap of the ready branches of a synchronization point
+
+        {session}/gc-log: a set of keys to delete with deferred gc
+
+    Every key of a session has the session as its hash tag so that they are
+    in the same slot on Redis Cluster, which the Lua scripts that touch more
+    than one key require.
+    '''
+
+    # Keys per MGET in read_input() and per UNLINK in deletes
+    BATCH_SIZE = 500
+
+    # KEYS[1]: synchronization point. ARGV: index, TTL
+    MARK_READY_SCRIPT = '''
+        redis.call('SETBIT', KEYS[1], ARGV[1], 1)
+        if tonumber(ARGV[2]) > 0 then
+            redis.call('EXPIRE', KEYS[1], ARGV[2])
+        end
+        return redis.call('BITCOUNT', KEYS[1])
+    '''
+
+    # KEYS[1]: checkpoint, KEYS[2]: synchronization point.
+    # ARGV: checkpoint data, index, TTL
+    CHECKPOINT_MARK_READY_SCRIPT = '''
+        local written
+        if tonumber(ARGV[3]) > 0 then
+            written = redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[3])
+        else
+            written = redis.call('SET', KEYS[1], ARGV[1], 'NX')
+        end
+        if not written then
+            return -1
+        end
+        redis.call('SETBIT', KEYS[2], ARGV[2], 1)
+        if tonumber(ARGV[3]) > 0 then
+            redis.call('EXPIRE', KEYS[2], ARGV[3])
+        end
+        return redis.call('BITCOUNT', KEYS[2])
+    '''
+
+    def __init__(self, ds_name, debug):
+        '''
+        If `CheckpointTTL` (UNUM_CHECKPOINT_TTL) is a positive number of
+        seconds, checkpoints, synchronization points and gc logs expire that
+        many seconds after they are written, so that keys that garbage
+        collection misses do not accumulate.
+        '''
+        super(RedisDriver, self).__init__("redis", ds_name, debug)
+
+        self.deferred_gc = True
+
+        # only functions that use this data store need the redis package
+        import redis
+
+        self.client = redis.Redis.from_url(self.name if '://' in self.name else f'redis://{self.name}')
+
+        self.ttl = int(os.environ.get('UNUM_CHECKPOINT_TTL', 0))
+
+        # scripts run atomically on the server. Script objects send the
+        # script's SHA1 (EVALSHA) and only load the script on a miss
+        self.mark_ready_script = self.client.register_script(self.MARK_READY_SCRIPT)
+        self.checkpoint_mark_ready_script = self.client.register_script(self.CHECKPOINT_MARK_READY_SCRIPT)
+
+        # the checkpoint and the fan-in mark are written by one script. See
+        # checkpoint_fanin_sync_ready()
+        self.fused_checkpoint = True
+
+
+
+    def _batches(self, names):
+        return [names[i:i+self.BATCH_SIZE] for i in range(0, len(names), self.BATCH_SIZE)]
+
+
+
+    def checkpoint_name(self, session, instance_name):
+        return f'{{{session}}}/{instance_name}-output'
+
+
+
+    def checkpoint(self, session, instance_name, data):
+        '''Store `data` as the function instance's checkpoint if it does not
+        exist yet
+
+        @return 1 if successful. -1 if a checkpoint already exists.
+        '''
+        written = self.client.set(self.checkpoint_name(session, instance_name), json.dumps(data),
+            nx=True, ex=self.ttl if self.ttl > 0 else None)
+
+        return 1 if written else -1
+
+
+
+    def get_checkpoint(self, session, instance_name):
+        '''Return the user function output in the checkpoint or None if the
+        checkpoint doesn't exist
+        '''
+        value = self.client.get(self.checkpoint_name(session, instance_name))
+        if value == None:
+            return None
+
+        return serde.loads(json.loads(value)["User"])
+
+
+
+    def read_input(self, session, values):
+        '''Given the session id and a list of instance names, return their
+        checkpoints in the same order, as DynamoDBDriver.read_input() does
+
+        Checkpoints are read with one MGET per BATCH_SIZE names, and all
+        MGETs are pipelined in one round-trip.
+        '''
+        item_names = [self.checkpoint_name(session, v) for v in values]
+
+        pipe = self.client.pipeline(transaction=False)
+        for batch in self._batches(item_names):
+            pipe.mget(batch)
+        results = [v for r in pipe.execute() for v in r]
+
+        ret = []
+        for n, value in zip(item_names, results):
+            if value == None:
+                continue
+
+            ckpt = json.loads(value)
+            item = {
+                'User': serde.loads(ckpt['User']),
+                'Name': n
+            }
+            if 'GC' in ckpt:
+                item['GC'] = ckpt['GC']
+
+            ret.append(item)
+
+        if len(ret) < len(values):
+            print(f'[WARN] Not all values for fan-in were read from {self.my_type}')
+            print(f'[WARN] Expect {len(values)}. Got {len(ret)}')
+            print(f'[WARN] Missing: {[n for n, v in zip(item_names, results) if v == None]}')
+
+        return ret
+
+
+
+    def _unlink(self, names):
+        '''Delete keys, BATCH_SIZE keys per UNLINK, in one round-trip
+
+        UNLINK frees the values' memory in the background so that deleting
+        large checkpoints does not block the server.
+        '''
+        if len(names) == 0:
+            return
+
+        pipe = self.client.pipeline(transaction=False)
+        for batch in self._batches(names):
+            pipe.unlink(*batch)
+        pipe.execute()
+
+
+
+    def delete_checkpoint(self, session, instance_name):
+        self.client.unlink(self.checkpoint_name(session, instance_name))
+
+
+
+    def delete_checkpoints(self, session, instance_names):
+        self._unlink([self.checkpoint_name(session, n) for n in instance_names])
+
+
+
+    def gc_sync_point_name(self, session, parent_function_instance_name):
+        return f'{{{session}}}/{parent_function_instance_name}-gc'
+
+
+
+    def fanin_sync_point_name(self, session, aggregation_function_instance_name):
+        return f'{{{session}}}/{aggregation_function_instance_name}-fanin'
+
+
+
+    def gc_sync_ready(self, session, parent_function_instance_name, index, my_instance_name, num_branches):
+        return self._sync_ready(self.gc_sync_point_name(session, parent_function_instance_name), index, num_branches)
+
+
+
+    def fanin_sync_ready(self, session, aggregation_function_instance_name, index, my_instance_name, num_branches):
+        return self._sync_ready(self.fanin_sync_point_name(session, aggregation_function_instance_name), index, num_branches)
+
+
+
+    def _sync_ready(self, sync_point_name, index, num_branches):
+        '''Set the caller's bit in the synchronization point's bitmap and
+        return whether all branches are ready
+
+        Setting the bit and counting the set bits run in one script, so
+        exactly one branch sees the count reach num_branches. A duplicate of
+        a branch does not count twice, and a duplicate of the last-to-finish
+        branch also sees the synchronization complete.
+        '''
+        count = self.mark_ready_script(keys=[sync_point_name], args=[int(index), self.ttl])
+
+        return count == num_branches
+
+
+
+    def checkpoint_fanin_sync_ready(self, session, instance_name, data, aggregation_function_instance_name, index, num_branches):
+        '''Checkpoint a fan-in branch and mark it ready in one script
+
+        @return (ret, ready) as UnumIntermediaryDataStore.checkpoint_fanin_sync_ready()
+        '''
+        count = self.checkpoint_mark_ready_script(
+            keys=[self.checkpoint_name(session, instance_name), self.fanin_sync_point_name(session, aggregation_function_instance_name)],
+            args=[json.dumps(data), int(index), self.ttl])
+
+        if count == -1:
+            return -1, False
+
+        return 1, count == num_branches
+
+
+
+    def delete_sync_points(self, sync_point_names):
+        self._unlink(sync_point_names)
+
+
+
+    def gc_log_name(self, session):
+        return f'{{{session}}}/gc-log'
+
+
+
+    def append_gc_log(self, session, instance_name, checkpoints, sync_points):
+        names = [self.checkpoint_name(session, n) for n in checkpoints] + sync_points
+        if len(names) == 0:
+            return
+
+        log_name = self.gc_log_name(session)
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.sadd(log_name, *names)
+        if self.ttl > 0:
+            pipe.expire(log_name, self.ttl)
+        pipe.execute()
+
+
+
+    def sweep_gc_log(self, session):
+        log_name = self.gc_log_name(session)
+        names = [n.decode() for n in self.client.smembers(log_name)]
+
+        self._unlink(names + [log_name])
+
+        return len(names)
+
+
+
+@UnumIntermediaryDataStore.add_datastore('fs')
+class FileSystemDriver(UnumIntermediaryDataStore):
+    '''An intermediary data store in a directory of a file system that all
+    functions mount, e.g., EFS on Lambda, or a local directory with the
+    local executor
+
+    `UnumIntermediaryDataStoreName` is the absolute path of the directory,
+    which is created if it does not exist. Every session has a
+    subdirectory:
+
+        <session>/<instance name>-output: the checkpoint as a JSON string
+
+        <session>/<instance name>-fanin/, <session>/<instance name>-gc/: a
+            synchronization point. It has one empty marker file per ready
+            branch, named after the branch's index, and a `.ready` file that
+            names the branch that completed the synchronization.
+
+    File creation with O_CREAT|O_EXCL and hard links are atomic on local
+    file systems and on NFS (including EFS), so checkpoints and
+    synchronization need no locks. On NFS, mount the file system without
+    attribute caching of directories (e.g., actimeo=0) so that branches that
+    finish at the same time see each other's markers.
+    '''
+
+    # File in a synchronization point's directory that names the branch
+    # that completed the synchronization
+    READY_FILE = '.ready'
+
+    def __init__(self, ds_name, debug):
+        '''
+        The number of checkpoints read concurrently by read_input() is set by
+        `ReadConcurrency` in the Globals (UNUM_READ_CONCURRENCY, default 8).
+        '''
+        super(FileSystemDriver, self).__init__("fs", ds_name, debug)
+
+        self.deferred_gc = True
+
+        self.read_concurrency = int(os.environ.get('UNUM_READ_CONCURRENCY', 8))
+        if self.read_concurrency < 1:
+            raise ValueError(f'UNUM_READ_CONCURRENCY must be a positive integer: {self.read_concurrency}')
+
+        os.makedirs(self.name, exist_ok=True)
+
+
+
+    def _path(self, name):
+        return os.path.join(self.name, name)
+
+
+
+    def _create_exclusive(self, path, content, sync=False):
+        '''Create the file at `path` with `content` if it does not exist
+
+        The content is written (and with `sync`, flushed to storage) to a
+        temporary file that is then hard linked to `path`. Linking fails if
+        `path` exists, so exactly one concurrent caller creates the file, and
+        readers never see a partially written file.
+
+        @return True if this call created the file. False if it exists.
+        '''
+        tmp_path = f'{path}.{uuid.uuid4()}.tmp'
+        with open(tmp_path, 'xb') as f:
+            f.write(content)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+
+        try:
+            os.link(tmp_path, path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+
+
+
+    def checkpoint_name(self, session, instance_name):
+        return f'{session}/{instance_name}-output'
+
+
+
+    def checkpoint(self, session, instance_name, data):
+        '''Store `data` as the function instance's checkpoint if it does not
+        exist yet
+
+        See _create_exclusive().
+
+        @return 1 if successful. -1 if a checkpoint already exists.
+        '''
+        path = self._path(self.checkpoint_name(session, instance_name))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        return 1 if self._create_exclusive(path, json.dumps(data).encode(), sync=True) else -1
+
+
+
+    def _read(self, name):
+        '''Return the decoded checkpoint file or None if it doesn't exist
+        '''
+        try:
+            with open(self._path(name), 'rb') as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+
+
+    def get_checkpoint(self, session, instance_name):
+        '''Return the user function output in the checkpoint or None if the
+        checkpoint doesn't exist
+        '''
+        ckpt = self._read(self.checkpoint_name(session, instance_name))
+        if ckpt == None:
+            return None
+
+        return serde.loads(ckpt["User"])
+
+
+
+    def read_input(self, session, values):
+        '''Given the session id and a list of instance names, return their
+        checkpoints in the same order, as DynamoDBDriver.read_input() does
+
+        Up to `self.read_concurrency` checkpoints are read concurrently.
+        '''
+        item_names = [self.checkpoint_name(session, v) for v in values]
+        unique_names = list(dict.fromkeys(item_names))
+
+        if len(unique_names) <= 1 or self.read_concurrency == 1:
+            ckpts = [self._read(n) for n in unique_names]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.read_concurrency, len(unique_names))) as executor:
+                ckpts = list(executor.map(self._read, unique_names))
+
+        items = {}
+        for n, ckpt in zip(unique_names, ckpts):
+            if ckpt == None:
+                continue
+
+            item = {
+                'User': serde.loads(ckpt['User']),
+                'Name': n
+            }
+            if 'GC' in ckpt:
+                item['GC'] = ckpt['GC']
+
+            items[n] = item
+
+        ret = [items[n] for n in item_names if n in items]
+
+        if len(ret) < len(values):
+            print(f'[WARN] Not all values for fan-in were read from {self.my_type}')
+            print(f'[WARN] Expect {len(values)}. Got {len(ret)}')
+            print(f'[WARN] Missing: {[n for n in item_names if n not in items]}')
+
+        return ret
+
+
+
+    def delete_checkpoint(self, session, instance_name):
+        try:
+            os.remove(self._path(self.checkpoint_name(session, instance_name)))
+        except FileNotFoundError:
+            pass
+
+
+
+    def gc_sync_point_name(self, session, parent_function_instance_name):
+        return f'{session}/{parent_function_instance_name}-gc'
+
+
+
+    def fanin_sync_point_name(self, session, aggregation_function_instance_name):
+        return f'{session}/{aggregation_function_instance_name}-fanin'
+
+
+
+    def gc_sync_ready(self, session, parent_function_instance_name, index, my_instance_name, num_branches):
+        return self._sync_ready(self.gc_sync_point_name(session, parent_function_instance_name), index, num_branches)
+
+
+
+    def fanin_sync_ready(self, session, aggregation_function_instance_name, index, my_instance_name, num_branches):
+        return self._sync_ready(self.fanin_sync_point_name(session, aggregation_function_instance_name), index, num_branches)
+
+
+
+    def _sync_ready(self, sync_point_name, index, num_branches):
+        '''Create the caller's marker file and return whether the caller
+        completes the synchronization
+
+        Branches that finish at the same time may all count num_branches
+        markers. Among them, the one that creates the READY_FILE with its
+        index wins, so exactly one branch sees the synchronization complete.
+        A duplicate of a branch does not count twice, and a duplicate of the
+        winner also sees the synchronization complete.
+        '''
+        path = self._path(sync_point_name)
+        os.makedirs(path, exist_ok=True)
+
+        try:
+            os.close(os.open(os.path.join(path, str(index)), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+        except FileExistsError:
+            pass
+
+        if len([n for n in os.listdir(path) if n.isdigit()]) < num_branches:
+            return False
+
+        ready_path = os.path.join(path, self.READY_FILE)
+        if self._create_exclusive(ready_path, str(index).encode()):
+            return True
+
+        with open(ready_path, 'r') as f:
+            return f.read() == str(index)
+
+
+
+    def delete_sync_points(self, sync_point_names):
+        for n in sync_point_names:
+            shutil.rmtree(self._path(n), ignore_errors=True)
+
+
+
+    def append_gc_log(self, session, instance_name, checkpoints, sync_points):
+        '''Everything of a session is in the session's directory, which
+        sweep_gc_log() deletes. There is nothing to record.
+        '''
+        pass
+
+
+
+    def sweep_gc_log(self, session):
+        '''Delete the session's directory
+
+        @return the number of checkpoints and synchronization points deleted
+        '''
+        path = self._path(session)
+        try:
+            count = len(os.listdir(path))
+        except FileNotFoundError:
+            return 0
+
+        shutil.rmtree(path, ignore_errors=True)
+
+        return count
+
+
+
 class S3Driver(UnumIntermediaryDataStore):
     def __init__(self, ds_name):
         ''' Initialze an s3 data store
@@ -879,7 +2947,7 @@ class S3Driver(UnumIntermediaryDataStore):
         @ param ds_name an s3 bucket name
         '''
         super(S3Driver, self).__init__("s3", ds_name)
-        self.backend = boto3.client("s3")
+        self.backend = ClientFactory.client("s3")
         # check if this bucket exists and this function has permission to
         # access it
         try:
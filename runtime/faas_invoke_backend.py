@@ -1,16 +1,27 @@
 import json
 import os
-from cfn_tools import load_yaml, dump_yaml
+import threading
+import serde
+from clients import ClientFactory
 
-if os.environ['FAAS_PLATFORM'] == 'aws':
+# With lazy clients (`LazyClients` in the unum template's Globals), the SDK
+# is imported and the invocation client created on the first invoke rather
+# than during cold start. See ds.LAZY_CLIENTS.
+LAZY_CLIENTS = os.environ.get('UNUM_LAZY_CLIENTS', 'false').lower() == 'true'
+
+if os.environ['FAAS_PLATFORM'] == 'aws' and LAZY_CLIENTS == False:
     import boto3
-elif os.environ['FAAS_PLATFORM'] =='gcloud':
+elif os.environ['FAAS_PLATFORM'] =='gcloud' and LAZY_CLIENTS == False:
     from google.cloud import pubsub_v1
 
 
 class InvocationBackend(object):
     subclasses = {}
 
+    # Largest invoke payload in bytes that the platform accepts. 0 means no
+    # limit. See UnumContinuation._fit_payload().
+    PAYLOAD_SIZE_LIMIT = 0
+
     @classmethod
     def add_backend(cls, platform):
         def wrapper(subclass):
@@ -28,17 +39,68 @@ class InvocationBackend(object):
 
 
 
+    @staticmethod
+    def serialize(data):
+        '''Return the JSON of an invoke payload as bytes
+
+        Continuation payloads are passed to invoke() already serialized (see
+        UnumContinuation._fit_payload()) and are sent as is. Other payloads
+        are dicts.
+        '''
+        if isinstance(data, bytes):
+            return data
+
+        return serde.dumps_payload(data)
+
+
+
+    @staticmethod
+    def load_mapping(name):
+        '''Load the mapping from unum function names to the platform's
+        resources (e.g., Lambda ARNs)
+
+        unum-cli writes the mapping to each function's build artifacts as
+        <name>.json, which is read with the json module. Without it, the
+        mapping is read from <name>.yaml, which needs cfn_tools.
+        '''
+        if os.path.isfile(f'{name}.json'):
+            with open(f'{name}.json', 'r') as f:
+                return json.loads(f.read())
+
+        from cfn_tools import load_yaml
+
+        with open(f'{name}.yaml', 'r') as f:
+            return load_yaml(f.read())
+
+
+
 @InvocationBackend.add_backend('gcloud')
 class GCloudFunctionBackend(InvocationBackend):
+
+    # Pub/Sub messages are at most 10 MB
+    PAYLOAD_SIZE_LIMIT = 10 * 1000 * 1000
+
     def __init__(self):
-        self.pubsub = pubsub_v1.PublisherClient()
+        self._pubsub = None
+        self._pubsub_lock = threading.Lock()
 
-        try:
-            with open('function_name_to_resource.yaml', 'r') as f:
-                self.mapping = load_yaml(f.read())
+        if LAZY_CLIENTS == False:
+            self.pubsub
 
-        except Exception as e:
-            raise e
+        self.mapping = self.load_mapping('function_name_to_resource')
+
+    @property
+    def pubsub(self):
+        '''The Pub/Sub publisher client, created on first use with lazy
+        clients
+        '''
+        if self._pubsub == None:
+            with self._pubsub_lock:
+                if self._pubsub == None:
+                    from google.cloud import pubsub_v1
+                    self._pubsub = pubsub_v1.PublisherClient()
+
+        return self._pubsub
 
     def invoke(self, function, data):
         '''Given a Unum function name, invoke it with data
@@ -51,7 +113,7 @@ class GCloudFunctionBackend(InvocationBackend):
         '''
         # print(f'Invoking function: {topic} with data: {data}')
         try:
-            self.pubsub.publish(topic, json.dumps(data).encode('utf-8'))
+            self.pubsub.publish(topic, self.serialize(data))
         except Exception as e:
             raise e
         
@@ -61,14 +123,26 @@ class GCloudFunctionBackend(InvocationBackend):
 @InvocationBackend.add_backend('aws')
 class AWSLambdaBackend(InvocationBackend):
 
+    # Asynchronous (Event) invokes accept payloads of at most 256 KB
+    PAYLOAD_SIZE_LIMIT = 256 * 1024
+
     def __init__(self):
-        self.lambda_client = boto3.client("lambda")
-        try:
-            with open('function-arn.yaml', 'r') as f:
-                self.mapping = load_yaml(f.read())
+        self._lambda_client = None
 
-        except Exception as e:
-            raise e
+        if LAZY_CLIENTS == False:
+            self.lambda_client
+
+        self.mapping = self.load_mapping('function-arn')
+
+    @property
+    def lambda_client(self):
+        '''The boto3 Lambda client, created on first use with lazy clients.
+        See clients.ClientFactory
+        '''
+        if self._lambda_client == None:
+            self._lambda_client = ClientFactory.client("lambda")
+
+        return self._lambda_client
 
     def invoke(self, function, data):
         return self._http_invoke_async(self.mapping[function], data)
@@ -76,13 +150,13 @@ class AWSLambdaBackend(InvocationBackend):
     def _http_invoke_async(self, function_arn, data):
         '''
         @param function string function arn
-        @param data dict
+        @param data dict or bytes payload. See serialize()
         '''
         response = self.lambda_client.invoke(
             FunctionName=function_arn,
             InvocationType='Event',
             LogType='None',
-            Payload=json.dumps(data),
+            Payload=self.serialize(data),
         )
         ret = response['Payload'].read()
 
@@ -95,4 +169,20 @@ class FakeFaaSBackend(InvocationBackend):
     def invoke(self, function, data):
         print(f'[FaaS Backend: fake] Invoking {function}')
         print(f'[FaaS Backend: fake] Payload: {data}')
-        return data
\ No newline at end of file
+        return data
+
+
+@InvocationBackend.add_backend('local')
+class LocalFaaSBackend(InvocationBackend):
+    '''Invoke functions of the workflow running in this process
+
+    Invocations are handed to the LocalExecutor (see local.py) that loaded
+    the workflow. The executor registers itself as LocalFaaSBackend.executor.
+    '''
+    executor = None
+
+    def invoke(self, function, data):
+        if LocalFaaSBackend.executor == None:
+            raise IOError(f'No local executor to invoke {function}')
+
+        return LocalFaaSBackend.executor.invoke(function, data)
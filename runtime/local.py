@@ -0,0 +1,301 @@
+'''Run an unum workflow locally in a single process
+
+LocalExecutor runs every function of a compiled workflow (i.e., function
+directories with an app.py and the unum_config.json written by the frontend
+compiler) in the current process on a thread pool. Each function runs through
+main.py's lambda_handler() exactly as it does on a FaaS platform. Functions
+invoke each other through the 'local' InvocationBackend
+(faas_invoke_backend.LocalFaaSBackend) and checkpoint to the 'memory'
+intermediary data store (ds.MemoryDriver) by default, or to another data store
+that runs locally, such as 'sqlite'.
+
+Like a FaaS platform, the executor runs each invocation in a loaded copy of
+the function ("instance") that is not running another invocation, and loads a
+new instance (a cold start) when all of the function's instances are busy.
+
+Importing this module sets the FAAS_PLATFORM environment variable to 'local'
+because main.py, ds.py and faas_invoke_backend.py read it at import time.
+
+    python local.py [-t unum-template.yaml] [-e event.json] [-n RUNS] [-w WORKERS] [-d TYPE NAME]
+'''
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ['FAAS_PLATFORM'] = 'local'
+
+from cfn_tools import load_yaml
+from faas_invoke_backend import LocalFaaSBackend
+from ds import MemoryDriver
+from unum import Unum, load_function_module
+import serde
+
+RUNTIME_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+
+class LocalFunction(object):
+    '''The loaded instances of one function of the workflow
+    '''
+    def __init__(self, name, function_dir):
+        self.name = name
+        self.function_dir = os.path.join(os.path.abspath(function_dir), '')
+
+        with open(os.path.join(self.function_dir, 'unum_config.json'), 'r') as f:
+            self.config = json.loads(f.read())
+
+        self.idle = []
+        self.lock = threading.Lock()
+        self.cold_starts = 0
+
+
+
+    def acquire(self):
+        '''Return an idle instance, loading a new one if there is none
+        '''
+        with self.lock:
+            if len(self.idle) > 0:
+                return self.idle.pop()
+
+            self.cold_starts = self.cold_starts + 1
+            instance_id = self.cold_starts
+
+        return self._load(instance_id)
+
+
+
+    def release(self, instance):
+        with self.lock:
+            self.idle.append(instance)
+
+
+
+    def _load(self, instance_id):
+        '''Load a new copy of main.py for this function
+
+        main.py reads unum_config.json from the working directory and imports
+        the user function from `app`, so both are pointed at the function
+        directory while loading. The working directory and sys.path are
+        process-wide, hence LocalExecutor.load_lock. Modules are loaded with
+        unum.load_function_module(), so that every function (and instance)
+        gets its own `app` and other modules.
+        '''
+        with LocalExecutor.load_lock:
+            cwd = os.getcwd()
+
+            os.chdir(self.function_dir)
+            try:
+                instance = load_function_module(f'unum_local_{self.name}_{instance_id}',
+                    os.path.join(RUNTIME_DIR, 'main.py'), self.function_dir)
+            finally:
+                os.chdir(cwd)
+
+        return instance
+
+
+
+class LocalExecutor(object):
+    '''Run the functions of an unum workflow in this process
+
+    Invocations are asynchronous, as on a FaaS platform. invoke() queues an
+    invocation on the thread pool and returns. wait() blocks until every
+    queued invocation, including those invoked by other functions, completes.
+    '''
+    load_lock = threading.Lock()
+
+    def __init__(self, functions, datastore_type='memory', datastore_name='unum-local', gc=False, max_workers=32,
+        fused_functions={}):
+        '''
+        @param functions dict of function names to function directories
+        @param datastore_type intermediary data store type
+        @param datastore_name intermediary data store name, e.g., the database
+            file of a 'sqlite' data store
+        @param gc the workflow's GC setting (True, False or 'deferred')
+        @param max_workers number of invocations that run concurrently
+        @param fused_functions dict of function names to function directories
+            of functions that the compiler fused into another function (see
+            "Fused" in unum_config.json). They only run as part of that
+            function.
+        '''
+        # read by main.py when loading functions
+        os.environ['UNUM_INTERMEDIARY_DATASTORE_TYPE'] = datastore_type
+        os.environ['UNUM_INTERMEDIARY_DATASTORE_NAME'] = datastore_name
+        os.environ['GC'] = str(gc)
+        os.environ['UNUM_FUSED_FUNCTION_DIRS'] = json.dumps(fused_functions)
+
+        self.datastore_type = datastore_type
+        self.datastore_name = datastore_name
+        self.functions = {n: LocalFunction(n, d) for n, d in functions.items()}
+
+        start = [n for n, f in self.functions.items() if f.config.get('Start') == True]
+        if len(start) != 1:
+            raise ValueError(f'Expect exactly one entry function. Got {start}')
+        self.start = start[0]
+
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.pending = 0
+        self.done = threading.Condition()
+
+        self.invocations = 0
+        self.outputs = []
+        self.errors = []
+
+        LocalFaaSBackend.executor = self
+
+
+
+    @classmethod
+    def from_template(cls, template_file, **kwargs):
+        '''Create an executor for the workflow described by an unum template
+        '''
+        with open(template_file, 'r') as f:
+            template = load_yaml(f.read())
+
+        workflow_dir = os.path.dirname(os.path.abspath(template_file))
+        functions = {n: os.path.join(workflow_dir, f["Properties"]["CodeUri"]) for n, f in template["Functions"].items()
+            if "FusedInto" not in f["Properties"]}
+        fused_functions = {n: os.path.join(workflow_dir, f["Properties"]["CodeUri"]) for n, f in template["Functions"].items()
+            if "FusedInto" in f["Properties"]}
+
+        kwargs.setdefault('gc', template["Globals"].get("GC", False))
+        kwargs.setdefault('fused_functions', fused_functions)
+
+        return cls(functions, **kwargs)
+
+
+
+    def invoke(self, function, data):
+        '''Asynchronously invoke a function with `data` as its input payload
+
+        The payload is serialized, so the function never shares objects with
+        its invoker. `data` is a payload dict or its JSON as bytes.
+        '''
+        if function not in self.functions and function != Unum.GC_SWEEPER_NAME:
+            raise ValueError(f'Unknown function: {function}')
+
+        event = serde.loads(LocalFaaSBackend.serialize(data))
+
+        with self.done:
+            self.pending = self.pending + 1
+            self.invocations = self.invocations + 1
+
+        self.pool.submit(self._run, function, event)
+
+
+
+    def _run(self, function, event):
+        # the UnumGCSweeper runs with the entry function's code
+        f = self.functions[self.start if function == Unum.GC_SWEEPER_NAME else function]
+        instance = f.acquire()
+
+        try:
+            if function == Unum.GC_SWEEPER_NAME:
+                instance.gc_sweeper_handler(event, None)
+            else:
+                user_function_output, session, next_payload_metadata = instance.lambda_handler(event, None)
+
+                if "Next" not in f.config and "Relay" not in event:
+                    self.outputs.append(user_function_output)
+
+        except Exception as e:
+            print(f'[ERROR] {function} failed: {e!r}')
+            self.errors.append((function, e))
+
+        finally:
+            f.release(instance)
+
+            with self.done:
+                self.pending = self.pending - 1
+                if self.pending == 0:
+                    self.done.notify_all()
+
+
+
+    def wait(self):
+        '''Block until there are no running or queued invocations
+        '''
+        with self.done:
+            while self.pending > 0:
+                self.done.wait()
+
+
+
+    def run(self, value):
+        '''Run the workflow to completion on one input
+
+        @param value the entry function's user function input
+
+        @return the user function outputs of the workflow's last functions
+            (functions without continuations), in completion order
+
+        Raises the first exception raised by a function, if any.
+        '''
+        self.outputs = []
+        self.errors = []
+
+        self.invoke(self.start, {"Data": {"Source": "http", "Value": value}})
+        self.wait()
+
+        if len(self.errors) > 0:
+            raise self.errors[0][1]
+
+        return self.outputs
+
+
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+        if self.datastore_type == 'memory':
+            MemoryDriver.clear(self.datastore_name)
+
+        if LocalFaaSBackend.executor == self:
+            LocalFaaSBackend.executor = None
+
+
+
+    def __enter__(self):
+        return self
+
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run an unum workflow locally in a single process')
+    parser.add_argument('-t', '--template', default='unum-template.yaml', help='unum template file')
+    parser.add_argument('-e', '--event', required=False,
+        help='JSON file with the entry function\'s input payload. Only its Data.Value is used')
+    parser.add_argument('-n', '--runs', type=int, default=1, help='number of times to run the workflow')
+    parser.add_argument('-w', '--workers', type=int, default=32, help='concurrent invocations')
+    parser.add_argument('-d', '--datastore', nargs=2, metavar=('TYPE', 'NAME'), default=['memory', 'unum-local'],
+        help='intermediary data store type and name, e.g., -d sqlite /tmp/unum.db')
+    args = parser.parse_args()
+
+    value = None
+    if args.event:
+        with open(args.event, 'r') as f:
+            value = json.loads(f.read())["Data"]["Value"]
+
+    with LocalExecutor.from_template(args.template, max_workers=args.workers,
+        datastore_type=args.datastore[0], datastore_name=args.datastore[1]) as executor:
+        for r in range(args.runs):
+            invocations = executor.invocations
+            t1 = time.perf_counter()
+            outputs = executor.run(value)
+            t2 = time.perf_counter()
+
+            print(f'Run {r}: {(t2-t1)*1000:.3f} ms, {executor.invocations - invocations} invocations. Outputs: {outputs}')
+
+        print(f'Cold starts: { {n: f.cold_starts for n, f in executor.functions.items()} }')
+
+
+
+if __name__ == '__main__':
+    main()
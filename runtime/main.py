@@ -5,7 +5,9 @@ import sys
 if os.environ['FAAS_PLATFORM'] == 'gcloud':
     import base64
 
-from unum import Unum
+from unum import Unum, load_function_module
+import serde
+from clients import ClientFactory
 from app import lambda_handler as user_lambda
 
 '''Create the unum runtime context from this function's unum configuration and
@@ -48,6 +50,56 @@ else:
 
 
 
+def load_fused_function(name):
+    '''Import the user function of a function fused into this one
+
+    The compiler fuses linear chains of functions into the chain's first
+    function (see "Fused" in unum_config.json). unum-cli build packages the
+    code of each fused function under fused/<function name>/. The local
+    executor instead sets UNUM_FUSED_FUNCTION_DIRS to the functions' own
+    directories.
+
+    The fused function's app.py is imported under its own module name with
+    unum.load_function_module(), so that it imports its own modules even if
+    this function or another fused function has modules of the same name.
+
+    @param name str function name
+
+    @return the function's lambda_handler
+    '''
+    function_dirs = json.loads(os.environ.get('UNUM_FUSED_FUNCTION_DIRS', '{}'))
+    function_dir = os.path.abspath(function_dirs.get(name, os.path.join('fused', name)))
+
+    app = load_function_module(f'unum_fused_{name}', os.path.join(function_dir, 'app.py'), function_dir)
+
+    return app.lambda_handler
+
+
+
+fused_user_lambdas = [load_fused_function(name) for name in config.get("Fused", [])]
+
+
+
+def run_user_function(user_function_input, context):
+    '''Run the user function, followed by the user functions fused into it
+
+    Each fused user function's input is the previous user function's output,
+    passed in-process instead of serialized into a continuation payload.
+
+    @return the last user function's output
+    '''
+    user_function_output = user_lambda(user_function_input, context)
+
+    for i, fused_lambda in enumerate(fused_user_lambdas):
+        if unum.debug:
+            print(f'[DEBUG] Running fused function {config["Fused"][i]}')
+
+        user_function_output = fused_lambda(user_function_output, context)
+
+    return user_function_output
+
+
+
 def ingress(event):
     '''Extract user function input from the request
 
@@ -74,6 +126,11 @@ def ingress(event):
 
     We can directly pass the data in the "Value" field to the user function.
 
+    If the payload would have exceeded the payload size limit, the invoker
+    compresses the "Value" ("Encoding": "zlib") or replaces it with a
+    reference to the invoker's checkpoint ("Source": "checkpoint"). See
+    Unum.read_input_value(), which returns the original value in both cases.
+
     When the "Source" is an unum intermediary data store, the "Value" field
     contains pointers to items in the data store. For example,
 
@@ -103,14 +160,32 @@ def ingress(event):
     fan-in should list outputs in the same order in their configurations.
 
     User function inputs are always JSON serializables.
+
+    If "Stream Fan-in Input" is true in unum_config.json, the fan-in
+    function receives a FanInInputStream instead of a list. It yields the
+    same upstream outputs in the same order but reads them from the data
+    store lazily, in batches, as the user function iterates, so that peak
+    memory does not grow with the fan-in width.
     '''
 
-    if event["Data"]["Source"] =="http":
+    if event["Data"]["Source"] =="http" or event["Data"]["Source"] == "checkpoint":
         if unum.entry_function == False:
             if unum.gc == True:
                 unum.my_gc_tasks = event['GC']
 
-        return event["Data"]["Value"]
+        return unum.read_input_value(event)
+    elif unum.stream_fan_in_input:
+
+        input_stream = unum.ds.stream_input(event["Session"], event["Data"]["Value"], unum.fan_in_prefetch)
+
+        if unum.debug:
+            print(f'[DEBUG] Streaming checkpoints: {event["Session"]}, {event["Data"]["Value"]}')
+
+        if unum.gc == True:
+            unum.fan_in_stream = input_stream
+            unum.fan_in_gc = True
+
+        return input_stream
     else:
 
         ckpt_vals = unum.ds.read_input(event["Session"], event["Data"]["Value"])
@@ -160,17 +235,25 @@ def egress(user_function_output, event):
     # See Unum.get_my_outgoing_edges for details on how outgoing edges are
     # computed.
 
+    # The user function's output is serialized once, for both the checkpoint
+    # and the continuation payloads. See serde.EncodedValue. A duplicate of an
+    # instance that completed in this container reuses its serialized output.
+    if unum.previous_output != None:
+        encoded_output = unum.previous_output
+    else:
+        encoded_output = serde.EncodedValue(user_function_output)
+
     if unum.gc == True:
         gc = {
             unum.get_my_instance_name(event): unum.get_my_outgoing_edges(event, user_function_output)
         }
         checkpoint_data = {
             'GC': gc,
-            "User": json.dumps(user_function_output)
+            "User": encoded_output.text
         }
     else:
         checkpoint_data = {
-            "User": json.dumps(user_function_output)
+            "User": encoded_output.text
         }
 
 
@@ -185,7 +268,14 @@ def egress(user_function_output, event):
     # branch cannot have complete knowledge on the outgoing branches of its sibling
     # branches.
 
-    ret = unum.run_checkpoint(event, checkpoint_data)
+    # With deferred gc, record what to garbage collect before checkpointing.
+    # With fused checkpoints, the checkpoint also marks my fan-in branch as
+    # ready, after which the session's last function may sweep the log at
+    # any time. See Unum.log_gc.
+    if unum.gc == True and unum.gc_deferred:
+        unum.log_gc(event)
+
+    ret = unum.run_checkpoint(event, checkpoint_data, user_function_output)
 
     next_payload_metadata = None
 
@@ -194,7 +284,7 @@ def egress(user_function_output, event):
 
         # invoke continuation with my user function results
         # t3 = time.perf_counter_ns()
-        session, next_payload_vmetadata = unum.run_continuation(event, user_function_output)
+        session, next_payload_vmetadata = unum.run_continuation(event, user_function_output, encoded_output)
         # t4 = time.perf_counter_ns()
     elif ret == -1:
         # checkpoint on and checkpoint failed due to concurrent instance beat
@@ -210,7 +300,7 @@ def egress(user_function_output, event):
         # again because there's no way for me to tell whether the previous
         # instance has done that or not.
         # t3 = time.perf_counter_ns()
-        session, next_payload_metadata = unum.run_continuation(event, user_function_output)
+        session, next_payload_metadata = unum.run_continuation(event, user_function_output, encoded_output)
         # t4 = time.perf_counter_ns()
     elif ret == None:
         # checkpoint off
@@ -219,16 +309,29 @@ def egress(user_function_output, event):
         # me to tell if there was a previous instance or if there's concurrent
         # instances.
         # t3 = time.perf_counter_ns()
-        session, next_payload_metadata = unum.run_continuation(event, user_function_output)
+        session, next_payload_metadata = unum.run_continuation(event, user_function_output, encoded_output)
         # t4 = time.perf_counter_ns()
     else:
         print(f'[ERROR] Unknown run_checkpoint() return value: {ret}')
 
+    # Remember completed instances whose checkpoint (if any) has my output,
+    # for duplicates that land in this container. See
+    # Unum.remember_completed().
+    if ret == 0 or ret == -2 or ret == None:
+        unum.remember_completed(event, encoded_output)
+
     session = unum.curr_session
 
     # Garbage collect my parents' checkpoints
     if unum.gc == True:
-        unum.run_gc()
+        if unum.gc_deferred:
+            unum.run_gc_sweeper(event)
+        else:
+            unum.run_gc()
+
+    # Report requests that could not use a pooled connection. See
+    # clients.ClientFactory.
+    ClientFactory.report(unum.debug)
 
     unum.cleanup()
 
@@ -264,6 +367,10 @@ def lambda_handler(event, context):
        Note that if checkpoint already exists before running the user
        function, we don't need to checkpoint again during egress.
 
+    With execution leases, an instance without a checkpoint claims a lease
+    before step 2 (see Unum.claim_execution()). If another execution of the
+    same instance holds the lease, this duplicate returns without running the
+    user function or its continuations.
     '''
 
     unum.cleanup()
@@ -271,18 +378,37 @@ def lambda_handler(event, context):
     if os.environ['FAAS_PLATFORM'] == 'gcloud':
         if 'data' in event:
             input_data = base64.b64decode(event['data']).decode('utf-8')
-            input_data = json.loads(input_data)
+            input_data = serde.loads(input_data)
 
-    elif os.environ['FAAS_PLATFORM'] == 'aws':
+    else:
         input_data = event
 
+    if "Relay" in input_data:
+        # This invocation is an intermediate node of a Map fan-out tree. Pass
+        # the slice on towards the leaf branches without running the user
+        # function.
+        unum.run_relay(input_data)
+        session = input_data["Session"]
+        unum.cleanup()
+
+        return None, session, None
+
     if unum.debug:
         print(f'[DEBUG] My instance name: {unum.get_my_instance_name(input_data)}. Invocation payload: {input_data}')
 
     ckpt_ret = unum.get_checkpoint(input_data)
-    if ckpt_ret == None:
+
+    # Lambda's and Cloud Functions' retries of an invocation keep its request
+    # (event) ID
+    if unum.previous_checkpoint == False and unum.claim_execution(input_data, getattr(context, 'aws_request_id', getattr(context, 'event_id', None))) == False:
+        session = unum.get_session(input_data)
+        unum.cleanup()
+
+        return None, session, None
+
+    if unum.previous_checkpoint == False:
         user_function_input = ingress(input_data)
-        user_function_output = user_lambda(user_function_input, context)
+        user_function_output = run_user_function(user_function_input, context)
         if unum.debug:
             print(f'[DEBUG] User function input: {user_function_input}')
             print(f'[DEBUG] User function output: {user_function_output}')
@@ -294,4 +420,28 @@ def lambda_handler(event, context):
 
     session, next_payload_metadata = egress(user_function_output, input_data)
 
-    return user_function_output, session, next_payload_metadata
\ No newline at end of file
+    return user_function_output, session, next_payload_metadata
+
+
+
+def gc_sweeper_handler(event, context):
+    '''Entry point of the workflow's UnumGCSweeper function
+
+    With deferred gc (`GC: deferred` in unum-template.yaml), functions do not
+    delete their parents' checkpoints. Instead, each function records its
+    checkpoint and synchronization items in the session's gc log, and the
+    last function of the session invokes this handler with
+
+        {
+            "Session": "session ID"
+        }
+
+    to bulk delete everything in the log. unum-cli deploys this handler as a
+    separate function using the entry function's code.
+    '''
+    deleted = unum.ds.sweep_gc_log(event["Session"])
+
+    if unum.debug:
+        print(f'[DEBUG] Swept {deleted} items of session {event["Session"]}')
+
+    return deleted
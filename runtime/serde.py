@@ -0,0 +1,145 @@
+'''JSON serialization of user function outputs and invoke payloads
+
+A user function's output is serialized for its checkpoint and again, as part
+of every continuation payload. EncodedValue serializes a value at most once
+and keeps the bytes, and dumps_payload() splices them into a payload's JSON
+instead of serializing the value again. The elements of a list are serialized
+at most once as well, for Map branch and relay payloads.
+
+JSON is serialized with orjson if it is installed (e.g., in the function's
+requirements.txt) and with the json module otherwise. Set UNUM_JSON_BACKEND to
+'json' to always use the json module. Values that orjson does not serialize
+(e.g., integers over 64 bits) fall back to the json module. Unlike the json
+module, orjson serializes NaN and Infinity as null.
+'''
+import json
+import os
+
+try:
+    # only used if installed
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = os.environ.get('UNUM_JSON_BACKEND', 'json' if orjson == None else 'orjson')
+
+if BACKEND not in ['json', 'orjson']:
+    raise ValueError(f'Unknown UNUM_JSON_BACKEND: {BACKEND}. Supported: json, orjson')
+if BACKEND == 'orjson' and orjson == None:
+    raise ImportError('UNUM_JSON_BACKEND is orjson but the orjson package is not installed')
+
+
+
+def dumps(value):
+    '''Serialize `value` to JSON
+
+    @return bytes UTF-8 encoded JSON
+    '''
+    if BACKEND == 'orjson':
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+
+    return json.dumps(value).encode('utf-8')
+
+
+
+def loads(data):
+    '''Deserialize JSON from bytes or str
+    '''
+    if BACKEND == 'orjson':
+        return orjson.loads(data)
+
+    return json.loads(data)
+
+
+
+class EncodedValue(object):
+    '''A JSON serializable value and its JSON, serialized on first use
+
+    @param value the value
+    @param encoded bytes the JSON of value, if already known
+    '''
+    def __init__(self, value, encoded=None):
+        self.value = value
+        self._encoded = encoded
+        self._elements = None
+
+
+
+    @property
+    def json(self):
+        '''The JSON of the value as bytes
+        '''
+        if self._encoded == None:
+            self._encoded = dumps(self.value)
+
+        return self._encoded
+
+
+
+    @property
+    def text(self):
+        '''The JSON of the value as str, e.g., for the "User" field of
+        checkpoints
+        '''
+        return self.json.decode('utf-8')
+
+
+
+    def elements(self):
+        '''Return an EncodedValue of each element of a list value
+
+        Elements are serialized once, no matter how many payloads they are
+        part of.
+        '''
+        if self._elements == None:
+            self._elements = [EncodedValue(v) for v in self.value]
+
+        return self._elements
+
+
+
+    def slice(self, start, end):
+        '''Return an EncodedValue of value[start:end] whose JSON is joined
+        from the JSON of the elements
+        '''
+        elements = self.elements()[start:end]
+
+        return EncodedValue(self.value[start:end], b'[' + b','.join(e.json for e in elements) + b']')
+
+
+
+def encode(value):
+    '''Return `value` as an EncodedValue
+    '''
+    if isinstance(value, EncodedValue):
+        return value
+
+    return EncodedValue(value)
+
+
+
+def dumps_payload(payload):
+    '''Serialize an invoke payload to JSON
+
+    If payload["Data"]["Value"] is an EncodedValue, its JSON is spliced into
+    the payload's JSON as is. Otherwise, this is the same as dumps().
+
+    @return bytes UTF-8 encoded JSON
+    '''
+    data = payload.get("Data")
+    if isinstance(data, dict) == False or isinstance(data.get("Value"), EncodedValue) == False:
+        return dumps(payload)
+
+    # "Data" is serialized last, so that the value goes before the last two
+    # closing braces
+    envelope = {k: v for k, v in payload.items() if k != "Data"}
+    envelope["Data"] = {k: v for k, v in data.items() if k != "Value"}
+    envelope_json = dumps(envelope)
+
+    if len(envelope["Data"]) > 0:
+        return envelope_json[:-2] + b',"Value":' + data["Value"].json + b'}}'
+    else:
+        return envelope_json[:-2] + b'"Value":' + data["Value"].json + b'}}'
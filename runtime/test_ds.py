@@ -77,7 +77,7 @@ test_datastore._delete("Name", "test-bitmap")
 # bitmap using the _sync_ready API
 
 def f(sync_point_name, index, num_branches):
-    if test_datastore._sync_ready(sync_point_name, index, num_branches):
+    if test_datastore._sync_ready(sync_point_name, index, f'branch-{index}', num_branches):
         print(f'I am thread {index} out of {num_branches} _sync_ready, and I see all Trues')
 
 jobs = []
@@ -101,7 +101,7 @@ test_datastore._delete("Name", "test-bitmap")
 # test 450 concurrent branch fan-in to make sure only 1 of them will see a
 # all-1's bitmap using the fanin_sync_ready API
 def f(session, aggregation_function_instance_name, index, num_branches):
-    if test_datastore.fanin_sync_ready(session, aggregation_function_instance_name, index, num_branches):
+    if test_datastore.fanin_sync_ready(session, aggregation_function_instance_name, index, f'branch-{index}', num_branches):
         print(f'I am thread {index} out of {num_branches} fan-in, and I see all Trues')
 
 jobs = []
@@ -127,7 +127,7 @@ test_datastore._delete("Name", test_datastore.fanin_sync_point_name(session, agg
 # test 300 concurrent branch gc to make sure only 1 of them will see a
 # all-1's bitmap using the gc_sync_ready API
 def f(session, parent_function_instance_name, index, num_branches):
-    if test_datastore.gc_sync_ready(session, parent_function_instance_name, index, num_branches):
+    if test_datastore.gc_sync_ready(session, parent_function_instance_name, index, f'branch-{index}', num_branches):
         print(f'I am thread {index} out of {num_branches} gc, and I see all Trues')
 
 jobs = []
@@ -0,0 +1,21 @@
+'''Unit tests of the unum runtime
+
+The runtime's modules read FAAS_PLATFORM at import time. The tests import them
+as on 'aws' (so that the DynamoDB driver can run against moto) with fake
+credentials. Nothing is sent to AWS. Tests that run workflows use
+local.LocalExecutor, which loads functions with the 'local' platform.
+
+ds is imported here, before any test module imports local (which sets
+FAAS_PLATFORM to 'local'), so that every test sees the same modules.
+'''
+import os
+import sys
+
+os.environ.setdefault('FAAS_PLATFORM', 'aws')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import ds
@@ -0,0 +1,111 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+import serde
+from clients import ClientFactory
+from ds import CheckpointCodec, DynamoDBDriver
+
+TABLE_NAME = 'unum-test'
+SESSION = 'test-session'
+
+OUTPUTS = [
+    # shorter than MIN_SIZE, stored as is by every codec
+    {"short": True},
+    {"key": "value " * 1000, "numbers": list(range(500)), "unicode": "é中" * 200},
+]
+
+
+
+def zstd_available():
+    try:
+        import zstandard
+    except ImportError:
+        return False
+
+    return True
+
+
+
+CODECS = ['json', 'zlib', pytest.param('zstd', marks=pytest.mark.skipif(zstd_available() == False, reason='requires zstandard'))]
+
+
+
+@pytest.fixture
+def driver(monkeypatch):
+    '''Return a function that creates a DynamoDBDriver with a codec on a moto
+    table
+    '''
+    with mock_aws():
+        monkeypatch.setattr(ClientFactory, 'session', None)
+        monkeypatch.setattr(ClientFactory, 'clients', {})
+
+        boto3.client('dynamodb').create_table(TableName=TABLE_NAME,
+            KeySchema=[{'AttributeName': 'Name', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'Name', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST')
+
+        def create(codec):
+            monkeypatch.setenv('UNUM_CHECKPOINT_CODEC', codec)
+
+            return DynamoDBDriver(TABLE_NAME, False)
+
+        yield create
+
+
+
+def checkpoint_data(output):
+    return {"User": serde.dumps(output).decode('utf-8'), "GC": {"A": ["B"]}}
+
+
+
+@pytest.mark.parametrize('codec', CODECS)
+@pytest.mark.parametrize('output', OUTPUTS)
+def test_round_trip(codec, output):
+    text = serde.dumps(output).decode('utf-8')
+    encoded = CheckpointCodec.create(codec).encode(text)
+
+    if codec == 'json' or len(text) < CheckpointCodec.MIN_SIZE:
+        assert encoded == text
+    else:
+        assert isinstance(encoded, bytes) and len(encoded) < len(text)
+
+    assert CheckpointCodec.decode(encoded) == text
+
+
+
+@pytest.mark.parametrize('codec', CODECS)
+@pytest.mark.parametrize('output', OUTPUTS)
+def test_driver_round_trip(driver, codec, output):
+    d = driver(codec)
+
+    assert d.checkpoint(SESSION, 'A', checkpoint_data(output)) == 1
+    assert d.get_checkpoint(SESSION, 'A') == output
+
+    ckpts = d.read_input(SESSION, ['A'])
+    assert [c["User"] for c in ckpts] == [output]
+    assert ckpts[0]["GC"] == {"A": ["B"]}
+
+
+
+@pytest.mark.parametrize('codec', CODECS[1:])
+def test_legacy_checkpoints_are_read_by_any_codec(driver, codec):
+    '''Checkpoints written before the codec was set, i.e., as uncompressed
+    JSON strings, are still read
+    '''
+    output = OUTPUTS[1]
+    driver('json').checkpoint(SESSION, 'A', checkpoint_data(output))
+
+    d = driver(codec)
+
+    assert d.get_checkpoint(SESSION, 'A') == output
+    assert [c["User"] for c in d.read_input(SESSION, ['A'])] == [output]
+
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        CheckpointCodec.create('lz4')
+
+    with pytest.raises(ValueError):
+        CheckpointCodec.decode(b'\x00\x01\x02\x03')
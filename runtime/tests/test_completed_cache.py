@@ -0,0 +1,129 @@
+import json
+from collections import OrderedDict
+
+import pytest
+
+import serde
+from ds import MemoryDriver
+from local import LocalExecutor
+from unum import Unum
+
+CONFIGS = {
+    "A": {"Name": "A", "Start": True, "Checkpoint": True, "Next": {"Name": "B", "InputType": "Map"}},
+    "B": {"Name": "B", "Checkpoint": True},
+}
+
+
+
+@pytest.fixture
+def workflow(tmp_path, monkeypatch):
+    '''Create the workflow A -> Map B, where B records every run of its user
+    function, and record the payloads of B and the data store reads
+
+    @return (functions, runs of B's user function, B's payloads, checkpoint
+        reads)
+    '''
+    runs_file = tmp_path / 'runs'
+    runs_file.write_text('')
+    apps = {
+        "A": "def lambda_handler(event, context):\n    return event\n",
+        "B": f"def lambda_handler(event, context):\n    with open({str(runs_file)!r}, 'a') as f:\n        f.write(f'{{event}}\\n')\n    return event * 10\n",
+    }
+
+    functions = {}
+    for name in CONFIGS:
+        d = tmp_path / name
+        d.mkdir()
+        (d / 'unum_config.json').write_text(json.dumps(CONFIGS[name]))
+        (d / 'app.py').write_text(apps[name])
+        functions[name] = str(d)
+
+    payloads = []
+    invoke = LocalExecutor.invoke
+
+    def record_invoke(self, function, data):
+        if function == 'B':
+            payloads.append(serde.loads(data) if isinstance(data, bytes) else data)
+        return invoke(self, function, data)
+
+    reads = []
+    get_checkpoint = MemoryDriver.get_checkpoint
+
+    def record_get_checkpoint(self, session, instance_name):
+        reads.append(instance_name)
+        return get_checkpoint(self, session, instance_name)
+
+    monkeypatch.setattr(LocalExecutor, 'invoke', record_invoke)
+    monkeypatch.setattr(MemoryDriver, 'get_checkpoint', record_get_checkpoint)
+    monkeypatch.setattr(Unum, 'completed', OrderedDict())
+
+    def runs():
+        return sorted(int(l) for l in runs_file.read_text().split())
+
+    return functions, runs, payloads, reads
+
+
+
+def replay(executor, payload):
+    '''Deliver a duplicate of `payload` and return the duplicate's output
+    '''
+    executor.outputs = []
+    executor.invoke('B', payload)
+    executor.wait()
+
+    assert executor.errors == []
+
+    return executor.outputs
+
+
+
+def instance_names():
+    return [name for session, name in Unum.completed]
+
+
+
+def test_warm_duplicates_are_short_circuited(workflow):
+    functions, runs, payloads, reads = workflow
+
+    with LocalExecutor(functions) as executor:
+        assert sorted(executor.run([1, 2, 3])) == [10, 20, 30]
+        assert sorted(instance_names()) == ['B-unumIndex-0', 'B-unumIndex-1', 'B-unumIndex-2']
+
+        reads.clear()
+        for p in list(payloads):
+            assert replay(executor, p) == [p["Data"]["Value"] * 10]
+
+    # neither the user function nor the data store ran for the duplicates
+    assert runs() == [1, 2, 3]
+    assert reads == []
+
+
+
+def test_least_recently_used_are_evicted(workflow, monkeypatch):
+    functions, runs, payloads, reads = workflow
+    monkeypatch.setattr(Unum, 'COMPLETED_CACHE_SIZE', 2)
+
+    with LocalExecutor(functions) as executor:
+        executor.run([1, 2, 3, 4, 5])
+
+        remembered = instance_names()
+        assert len(remembered) == 2
+
+        by_name = {f'B-unumIndex-{p["Fan-out"]["Index"]}': p for p in payloads}
+        evicted = [n for n in by_name if n not in remembered]
+
+        reads.clear()
+        # a hit makes the instance the most recently used
+        replay(executor, by_name[remembered[0]])
+        assert instance_names() == [remembered[1], remembered[0]]
+        assert reads == []
+
+        # evicted instances read their checkpoint, and each evicts the least
+        # recently used instance
+        for n in evicted:
+            replay(executor, by_name[n])
+        assert instance_names() == evicted[-2:]
+        assert reads == evicted
+
+    # duplicates never ran the user function, remembered or not
+    assert runs() == [1, 2, 3, 4, 5]
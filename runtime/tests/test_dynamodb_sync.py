@@ -0,0 +1,173 @@
+import random
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+import ds
+from clients import ClientFactory
+from ds import DynamoDBDriver
+
+TABLE_NAME = 'unum-test'
+SESSION = 'test-session'
+
+
+
+@pytest.fixture
+def driver(monkeypatch):
+    '''Return a function that creates a DynamoDBDriver on a moto table with
+    the given UNUM_* environment variables
+    '''
+    with mock_aws():
+        # clients created outside the mock would send requests to AWS
+        monkeypatch.setattr(ClientFactory, 'session', None)
+        monkeypatch.setattr(ClientFactory, 'clients', {})
+
+        boto3.client('dynamodb').create_table(TableName=TABLE_NAME,
+            KeySchema=[{'AttributeName': 'Name', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'Name', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST')
+
+        def create(**env):
+            for k, v in env.items():
+                monkeypatch.setenv(k, str(v))
+
+            return DynamoDBDriver(TABLE_NAME, False)
+
+        yield create
+
+
+
+@pytest.mark.parametrize('mode', ['bitmap', 'counter'])
+@pytest.mark.parametrize('shards', [1, 4])
+def test_only_the_last_branch_is_ready(driver, mode, shards):
+    d = driver(UNUM_SYNC_MODE=mode, UNUM_SYNC_SHARDS=shards)
+    num_branches = 20
+    order = list(range(num_branches))
+    random.Random(shards).shuffle(order)
+
+    ready = [i for i in order if d.fanin_sync_ready(SESSION, 'C', i, f'B-unumIndex-{i}', num_branches)]
+
+    assert ready == [order[-1]]
+
+
+
+@pytest.mark.parametrize('mode', ['bitmap', 'counter'])
+@pytest.mark.parametrize('shards', [1, 4])
+def test_duplicate_branches_are_not_counted(driver, mode, shards):
+    d = driver(UNUM_SYNC_MODE=mode, UNUM_SYNC_SHARDS=shards)
+    num_branches = 8
+
+    for i in range(num_branches - 1):
+        assert d.fanin_sync_ready(SESSION, 'C', i, f'B-unumIndex-{i}', num_branches) == False
+        # a duplicate of branch i is not counted as another branch
+        assert d.fanin_sync_ready(SESSION, 'C', i, f'B-unumIndex-{i}', num_branches) == False
+
+    assert d.fanin_sync_ready(SESSION, 'C', num_branches - 1, f'B-unumIndex-{num_branches - 1}', num_branches) == True
+
+
+
+def checkpoint_branch(d, index, num_branches):
+    return d.checkpoint_fanin_sync_ready(SESSION, f'B-unumIndex-{index}', {"User": f'{index}'}, 'C', index, num_branches)
+
+
+
+def test_fused_checkpoint(driver):
+    d = driver(UNUM_SYNC_MODE='counter', UNUM_FUSED_CHECKPOINT='true')
+
+    assert [checkpoint_branch(d, i, 4) for i in [2, 0, 3]] == [(1, False)] * 3
+    # duplicate of a branch that is not last
+    assert checkpoint_branch(d, 0, 4) == (-1, False)
+    assert checkpoint_branch(d, 1, 4) == (1, True)
+    # duplicate of the last branch
+    assert checkpoint_branch(d, 1, 4) == (-1, False)
+
+    assert d.get_checkpoint(SESSION, 'B-unumIndex-1') == 1
+
+
+
+def cancelled(checkpoint_code, sync_point_code, item=None):
+    reasons = [{'Code': checkpoint_code}, {'Code': sync_point_code}]
+    if item != None:
+        reasons[1]['Item'] = item
+
+    return ClientError({
+        'Error': {'Code': 'TransactionCanceledException', 'Message': 'Transaction cancelled'},
+        'CancellationReasons': reasons
+    }, 'TransactWriteItems')
+
+
+
+def fail_transactions(monkeypatch, d, errors):
+    '''Raise `errors`, in order, from the next transactions of `d`, then send
+    transactions to the table
+    '''
+    transact_write_items = d.resource.meta.client.transact_write_items
+    calls = []
+
+    def transact(**kwargs):
+        calls.append(kwargs)
+        if len(errors) > 0:
+            raise errors.pop(0)
+        return transact_write_items(**kwargs)
+
+    monkeypatch.setattr(d.resource.meta.client, 'transact_write_items', transact)
+    monkeypatch.setattr(ds, 'backoff', lambda retries: None)
+
+    return calls
+
+
+
+@pytest.mark.parametrize('code', ['TransactionConflict', 'ThrottlingError', 'ProvisionedThroughputExceeded'])
+def test_fused_checkpoint_retries_conflicts(driver, monkeypatch, code):
+    d = driver(UNUM_SYNC_MODE='counter', UNUM_FUSED_CHECKPOINT='true')
+    calls = fail_transactions(monkeypatch, d, [cancelled('None', code), cancelled(code, 'None')])
+
+    # a conflict is not mistaken for the last branch
+    assert checkpoint_branch(d, 0, 2) == (1, False)
+    assert len(calls) == 3
+
+    calls = fail_transactions(monkeypatch, d, [cancelled('None', code)])
+
+    assert checkpoint_branch(d, 1, 2) == (1, True)
+
+
+
+def test_fused_checkpoint_gives_up_on_persistent_conflicts(driver, monkeypatch):
+    d = driver(UNUM_SYNC_MODE='counter', UNUM_FUSED_CHECKPOINT='true')
+    monkeypatch.setattr(DynamoDBDriver, 'TRANSACTION_MAX_RETRIES', 2)
+    calls = fail_transactions(monkeypatch, d, [cancelled('None', 'TransactionConflict') for i in range(3)])
+
+    with pytest.raises(IOError, match='TransactionConflict'):
+        checkpoint_branch(d, 0, 2)
+
+    assert len(calls) == 3
+
+
+
+def test_fused_checkpoint_raises_on_other_cancellations(driver, monkeypatch):
+    d = driver(UNUM_SYNC_MODE='counter', UNUM_FUSED_CHECKPOINT='true')
+    calls = fail_transactions(monkeypatch, d, [cancelled('ValidationError', 'None')])
+
+    with pytest.raises(IOError, match='ValidationError'):
+        checkpoint_branch(d, 0, 2)
+
+    assert len(calls) == 1
+
+
+
+def test_fused_checkpoint_cancellation_reasons(driver, monkeypatch):
+    d = driver(UNUM_SYNC_MODE='counter', UNUM_FUSED_CHECKPOINT='true')
+
+    fail_transactions(monkeypatch, d, [cancelled('ConditionalCheckFailed', 'None')])
+    assert checkpoint_branch(d, 0, 3) == (-1, False)
+
+    fail_transactions(monkeypatch, d, [cancelled('None', 'ConditionalCheckFailed', {'0': {'BOOL': True}})])
+    assert checkpoint_branch(d, 0, 3) == (-1, False)
+
+    # the count condition failed: retry as the last branch without it
+    calls = fail_transactions(monkeypatch, d, [cancelled('None', 'ConditionalCheckFailed', {'ReadyCount': {'N': '2'}})])
+    assert checkpoint_branch(d, 0, 3) == (1, True)
+    assert ':max' in calls[0]['TransactItems'][1]['Update']['ExpressionAttributeValues']
+    assert ':max' not in calls[1]['TransactItems'][1]['Update']['ExpressionAttributeValues']
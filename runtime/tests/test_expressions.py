@@ -0,0 +1,93 @@
+import pytest
+
+from unum import Unum, UnumContinuation, UnumExpression
+
+
+
+def fan_out(indexes):
+    '''The Fan-out field of a branch of nested Maps, innermost index first
+    '''
+    field = None
+    for i in reversed(indexes):
+        f = {"Type": "Map", "Index": i, "Size": 10}
+        if field != None:
+            f["OuterLoop"] = field
+        field = f
+
+    return field
+
+
+
+def conditional(source):
+    return UnumExpression(source, 'eval', UnumExpression.CONDITIONAL_VARIABLES)
+
+
+
+def modifier(source):
+    return UnumExpression(source, 'exec', UnumExpression.MODIFIER_VARIABLES)
+
+
+
+@pytest.mark.parametrize('source', [
+    '__import__("os")',
+    'len($out)',
+    '$out.keys()',
+    '$out.__class__',
+    '$out[0]',
+    'os',
+    '[x for x in $out]',
+    'lambda: 1',
+])
+def test_conditional_rejects_unsupported_syntax(source):
+    with pytest.raises(ValueError):
+        conditional(source)
+
+
+
+def test_modifier_only_assigns_positionals_and_size():
+    with pytest.raises(ValueError):
+        modifier('$out = 1')
+
+    with pytest.raises(ValueError):
+        modifier('$0 = len($size)')
+
+    assert modifier('$0 = $0 + 1').execute({'0': 4}) == {'0': 5}
+    assert modifier('$size = $size - 1').execute({'size': 3}) == {'size': 2}
+
+
+
+def test_conditional_positionals():
+    values = {'0': 0, '1': 1, '2': 2, '3': 3, '10': 10}
+
+    assert conditional('$0 == 0 and $1 == 1 and $2 == 2 and $3 == 3').evaluate(values)
+    # $1 does not match part of $10
+    assert conditional('$10 == 10').evaluate(values)
+    assert conditional('$0 < $size - 1').evaluate({'0': 2, 'size': 3}) == False
+    assert conditional('$0 % 2 == 0 if $out else False').evaluate({'0': 4, 'out': [1]})
+
+
+
+def test_conditional_reads_only_its_variables():
+    assert conditional('$2 > $0').loads == ['0', '2']
+
+
+
+def test_expand_name_positionals():
+    payload = {"Fan-out": fan_out([0, 1, 2, 3])}
+
+    assert Unum.expand_name('A-unumIndex-$0', payload) == 'A-unumIndex-0'
+    assert Unum.expand_name('A-unumIndex-$3.$2.$1.$0', payload) == 'A-unumIndex-3.2.1.0'
+    assert Unum.expand_name('A-unumIndex-$size', payload) == 'A-unumIndex-$size'
+
+
+
+def test_continuation_expand_name():
+    payload = {"Fan-out": fan_out([5, 7, 8, 9])}
+    unum_index_list = Unum.compute_unum_index_list(payload)
+
+    assert UnumContinuation.expand_name('A-unumIndex-$3.$0', payload, unum_index_list) == 'A-unumIndex-9.5'
+    assert UnumContinuation.expand_name('A-unumIndex-($0+1).$1', payload, unum_index_list) == 'A-unumIndex-6.7'
+    assert UnumContinuation.expand_name('A-unumIndex-*', payload, unum_index_list, expand_star=True) == [f'A-unumIndex-{i}' for i in range(10)]
+
+    with pytest.raises(ValueError):
+        UnumContinuation.expand_name('A-unumIndex-(__import__("os"))', payload, unum_index_list)
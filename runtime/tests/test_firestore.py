@@ -0,0 +1,79 @@
+import pytest
+
+import serde
+from ds import FirestoreDriver
+
+SESSION = 'test-session'
+
+
+
+class FakeDocument(object):
+    def __init__(self, documents, name):
+        self.documents = documents
+        self.name = name
+        self.exists = name in documents
+
+
+
+    def get(self):
+        return FakeDocument(self.documents, self.name)
+
+
+
+    def to_dict(self):
+        return dict(self.documents[self.name])
+
+
+
+    def create(self, value):
+        self.documents[self.name] = dict(value)
+
+
+
+class FakeFirestore(object):
+    '''The parts of the google.cloud.firestore client that FirestoreDriver
+    reads checkpoints with
+    '''
+    def __init__(self):
+        self.collections = {}
+
+
+
+    def collection(self, name):
+        documents = self.collections.setdefault(name, {})
+
+        class Collection(object):
+            def document(self, name):
+                return FakeDocument(documents, name)
+
+        return Collection()
+
+
+
+@pytest.fixture
+def driver(monkeypatch):
+    # google.cloud is not installed
+    monkeypatch.setattr(FirestoreDriver, 'db', FakeFirestore())
+
+    return FirestoreDriver('unum-test', False)
+
+
+
+def test_get_checkpoint_returns_user_function_output(driver):
+    output = {"a": [1, 2], "b": None}
+    driver.checkpoint(SESSION, 'A', {"User": serde.dumps(output).decode('utf-8'), "GC": {"B": ["A"]}})
+
+    assert driver.get_checkpoint(SESSION, 'A') == output
+    assert driver.get_checkpoint(SESSION, 'B') == None
+    assert driver.get_checkpoint('another-session', 'A') == None
+
+
+
+def test_read_input_returns_decoded_checkpoints(driver):
+    for i in range(3):
+        driver.checkpoint(SESSION, f'B-unumIndex-{i}', {"User": serde.dumps([i]).decode('utf-8')})
+
+    ckpts = driver.read_input(SESSION, ['B-unumIndex-2', 'B-unumIndex-9', 'B-unumIndex-0'])
+
+    assert [c["User"] for c in ckpts] == [[2], [0]]
+    assert [c["Name"] for c in ckpts] == ['B-unumIndex-2', 'B-unumIndex-0']
@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+
+import pytest
+
+from ds import FileSystemDriver
+
+SESSION = 'test-session'
+NUM_BRANCHES = 16
+
+
+
+def sync_branch(ds_name, aggregation_instance_name, index, barrier, results):
+    driver = FileSystemDriver(ds_name, False)
+    barrier.wait()
+    results.put((index, driver.fanin_sync_ready(SESSION, aggregation_instance_name, index, f'B-unumIndex-{index}', NUM_BRANCHES)))
+
+
+
+@pytest.mark.parametrize('attempt', range(5))
+def test_concurrent_branches_have_one_winner(tmp_path, attempt):
+    '''Every branch runs in its own process, and all reach the
+    synchronization point at the same time
+    '''
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(NUM_BRANCHES)
+    results = context.Queue()
+
+    processes = [context.Process(target=sync_branch, args=(str(tmp_path), 'C', i, barrier, results)) for i in range(NUM_BRANCHES)]
+    for p in processes:
+        p.start()
+    ready = [results.get(timeout=30) for p in processes]
+    for p in processes:
+        p.join()
+
+    assert sorted(i for i, r in ready) == list(range(NUM_BRANCHES))
+    assert len([i for i, r in ready if r == True]) == 1
+
+
+
+def test_duplicates(tmp_path):
+    driver = FileSystemDriver(str(tmp_path), False)
+
+    for i in range(3):
+        assert driver.fanin_sync_ready(SESSION, 'C', i, f'B-unumIndex-{i}', 4) == False
+    # a duplicate is not counted as another branch
+    assert driver.fanin_sync_ready(SESSION, 'C', 0, 'B-unumIndex-0', 4) == False
+
+    assert driver.fanin_sync_ready(SESSION, 'C', 3, 'B-unumIndex-3', 4) == True
+    # a duplicate of the winner sees the synchronization complete, others
+    # do not
+    assert driver.fanin_sync_ready(SESSION, 'C', 3, 'B-unumIndex-3', 4) == True
+    assert driver.fanin_sync_ready(SESSION, 'C', 1, 'B-unumIndex-1', 4) == False
+
+
+
+def test_checkpoint_is_created_once(tmp_path):
+    driver = FileSystemDriver(str(tmp_path), False)
+
+    assert driver.checkpoint(SESSION, 'A', {"User": '[1]'}) == 1
+    assert driver.checkpoint(SESSION, 'A', {"User": '[2]'}) == -1
+    assert driver.get_checkpoint(SESSION, 'A') == [1]
+    # no temporary files are left behind
+    assert os.listdir(tmp_path / SESSION) == ['A-output']
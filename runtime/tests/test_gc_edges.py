@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+from unum import Unum, UnumContinuation
+
+
+
+def map_edge(function, size, suffix=''):
+    return {"Function": function, "Size": size, "Suffix": suffix}
+
+
+
+def test_count_edges():
+    assert Unum.count_edges([]) == 0
+    assert Unum.count_edges(['A', 'B-unumIndex-1']) == 2
+    assert Unum.count_edges(['A', map_edge('B', 100), 'C']) == 102
+    # sizes read from DynamoDB are Decimals
+    assert Unum.count_edges([map_edge('B', Decimal(3), '.1')]) == 3
+
+
+
+def test_find_edge():
+    edges = ['A', map_edge('B', 100, '.2'), 'C-unumIndex-2', map_edge('D', 3)]
+
+    assert Unum.find_edge(edges, 'A') == 0
+    assert Unum.find_edge(edges, 'B-unumIndex-0.2') == 1
+    assert Unum.find_edge(edges, 'B-unumIndex-99.2') == 100
+    assert Unum.find_edge(edges, 'C-unumIndex-2') == 101
+    assert Unum.find_edge(edges, 'D-unumIndex-2') == 104
+    assert Unum.find_edge([map_edge('B', Decimal(5))], 'B-unumIndex-4') == 4
+
+
+
+def test_find_edge_misses():
+    edges = [map_edge('B', 100, '.2'), map_edge('D', 3)]
+
+    # outside the Map
+    assert Unum.find_edge(edges, 'B-unumIndex-100.2') == None
+    assert Unum.find_edge(edges, 'D-unumIndex-3') == None
+    # another outer loop index
+    assert Unum.find_edge(edges, 'B-unumIndex-0.3') == None
+    assert Unum.find_edge(edges, 'B-unumIndex-0.2.1') == None
+    # nested Map branch of D, not a branch of D
+    assert Unum.find_edge(edges, 'D-unumIndex-0.1') == None
+    assert Unum.find_edge(edges, 'B') == None
+    assert Unum.find_edge(edges, 'E-unumIndex-0') == None
+
+
+
+def test_map_outgoing_edges_match_branch_instance_names():
+    continuation = UnumContinuation('A', 'B', 'Map', None, None, 'fake', None)
+    outer_loop = {"Type": "Map", "Index": 2, "Size": 4, "OuterLoop": {"Type": "Map", "Index": 0, "Size": 1}}
+    input_payload = {"Fan-out": outer_loop}
+    user_function_output = list(range(50))
+
+    edges = continuation.compute_outgoing_edges(user_function_output, input_payload,
+        Unum.compute_unum_index_list(input_payload), {"Fan-out": outer_loop})
+
+    assert edges == [map_edge('B', 50, '.2.0')]
+    assert Unum.count_edges(edges) == 50
+
+    for i in range(50):
+        branch_payload = {"Fan-out": {"Type": "Map", "Index": i, "Size": 50, "OuterLoop": outer_loop}}
+        assert Unum.find_edge(edges, Unum.compute_instance_name('B', branch_payload)) == i
+
+
+
+def test_empty_map_has_no_edges():
+    continuation = UnumContinuation('A', 'B', 'Map', None, None, 'fake', None)
+
+    assert continuation.compute_outgoing_edges([], {}, [], {}) == []
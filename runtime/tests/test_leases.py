@@ -0,0 +1,98 @@
+import time
+import types
+
+import boto3
+import pytest
+from moto import mock_aws
+
+import ds
+from clients import ClientFactory
+from ds import DynamoDBDriver, MemoryDriver, SQLiteDriver
+
+SESSION = 'test-session'
+LEASE = 60
+
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    '''The data store's clock, which the test moves forward with
+    clock.advance()
+    '''
+    clock = types.SimpleNamespace(now=time.time(), sleep=time.sleep)
+    clock.time = lambda: clock.now
+
+    def advance(seconds):
+        clock.now += seconds
+
+    clock.advance = advance
+    monkeypatch.setattr(ds, 'time', clock)
+
+    return clock
+
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'dynamodb'])
+def driver(request, tmp_path, monkeypatch, clock):
+    '''A driver of each type with an UNUM_EXECUTION_LEASE of LEASE seconds
+    '''
+    monkeypatch.setenv('UNUM_EXECUTION_LEASE', str(LEASE))
+
+    if request.param == 'memory':
+        yield MemoryDriver(f'leases-{tmp_path.name}', False)
+        MemoryDriver.clear(f'leases-{tmp_path.name}')
+    elif request.param == 'sqlite':
+        yield SQLiteDriver(str(tmp_path / 'unum.db'), False)
+    else:
+        with mock_aws():
+            monkeypatch.setattr(ClientFactory, 'session', None)
+            monkeypatch.setattr(ClientFactory, 'clients', {})
+            boto3.client('dynamodb').create_table(TableName='unum-test',
+                KeySchema=[{'AttributeName': 'Name', 'KeyType': 'HASH'}],
+                AttributeDefinitions=[{'AttributeName': 'Name', 'AttributeType': 'S'}],
+                BillingMode='PAY_PER_REQUEST')
+
+            yield DynamoDBDriver('unum-test', False)
+
+
+
+def test_first_claim(driver):
+    assert driver.claim_execution(SESSION, 'A', 'request-1') == True
+    # leases of other instances and sessions are separate
+    assert driver.claim_execution(SESSION, 'B', 'request-2') == True
+    assert driver.claim_execution('another-session', 'A', 'request-2') == True
+
+
+
+def test_duplicate_while_the_lease_is_live(driver, clock):
+    assert driver.claim_execution(SESSION, 'A', 'request-1') == True
+
+    clock.advance(LEASE - 1)
+
+    assert driver.claim_execution(SESSION, 'A', 'request-2') == False
+    # a retry of the holder reclaims its lease
+    assert driver.claim_execution(SESSION, 'A', 'request-1') == True
+
+
+
+def test_reclaim_after_expiry(driver, clock):
+    assert driver.claim_execution(SESSION, 'A', 'request-1') == True
+
+    clock.advance(LEASE + 1)
+
+    assert driver.claim_execution(SESSION, 'A', 'request-2') == True
+    # the new holder's lease is live
+    assert driver.claim_execution(SESSION, 'A', 'request-1') == False
+
+
+
+def test_leases_are_deleted_with_checkpoints(driver):
+    driver.claim_execution(SESSION, 'A', 'request-1')
+    driver.claim_execution(SESSION, 'B', 'request-1')
+
+    driver.delete_checkpoints(SESSION, ['A'])
+    assert driver.claim_execution(SESSION, 'A', 'request-2') == True
+
+    driver.append_gc_log(SESSION, 'B', ['B'], [])
+    driver.sweep_gc_log(SESSION)
+    assert driver.claim_execution(SESSION, 'B', 'request-2') == True
@@ -0,0 +1,242 @@
+import json
+import os
+import sys
+import time
+import types
+import uuid
+
+import pytest
+
+from ds import FanInInputStream, FirestoreDriver, MemoryDriver, SQLiteDriver
+from local import LocalExecutor
+from unum import Unum
+
+NUM_BRANCHES = 20
+
+CONFIGS = {
+    "A": {"Name": "A", "Start": True, "Checkpoint": True, "Next": {"Name": "B", "InputType": "Map"}},
+    "B": {"Name": "B", "Checkpoint": True,
+        "Next": {"Name": "C", "InputType": {"Fan-in": {"Values": ["B-unumIndex-*"]}}},
+        "Next Payload Modifiers": ["Pop"]},
+    "C": {"Name": "C", "Checkpoint": True},
+}
+
+APPS = {
+    "A": "def lambda_handler(event, context):\n    return list(range(event))\n",
+    "B": "def lambda_handler(event, context):\n    return event * 10\n",
+    "C": "def lambda_handler(event, context):\n    return sum(event)\n",
+}
+
+
+
+def write_functions(tmp_path, configs, apps):
+    '''Write function directories with the given unum_config.json and app.py
+    contents, by function name
+    '''
+    functions = {}
+    for name in configs:
+        d = tmp_path / name
+        d.mkdir()
+        (d / 'unum_config.json').write_text(json.dumps(configs[name]))
+        (d / 'app.py').write_text(apps[name])
+        functions[name] = str(d)
+
+    return functions
+
+
+
+@pytest.fixture
+def functions(tmp_path):
+    '''Function directories of A -> Map B -> fan-in C
+    '''
+    return write_functions(tmp_path, CONFIGS, APPS)
+
+
+
+def datastore_name(tmp_path, datastore_type):
+    if datastore_type == 'sqlite':
+        return str(tmp_path / 'unum.db')
+    if datastore_type == 'fs':
+        return str(tmp_path / 'unum-fs')
+
+    return f'unum-test-{uuid.uuid4()}'
+
+
+
+def items_left(executor):
+    if executor.datastore_type == 'memory':
+        return list(MemoryDriver.tables.get(executor.datastore_name, {}).keys())
+
+    if executor.datastore_type == 'fs':
+        return [os.path.relpath(os.path.join(d, f), executor.datastore_name)
+            for d, dirs, files in os.walk(executor.datastore_name) for f in files]
+
+    driver = SQLiteDriver(executor.datastore_name, False)
+    connection = driver._connection()
+    return ([row[0] for row in connection.execute('SELECT name FROM checkpoints')]
+        + [row[0] for row in connection.execute('SELECT name FROM sync_points')]
+        + [row[1] for row in connection.execute('SELECT session, name FROM gc_log')])
+
+
+
+@pytest.mark.parametrize('gc', [True, 'deferred'])
+@pytest.mark.parametrize('datastore_type', ['memory', 'sqlite', 'fs'])
+def test_map_and_fan_in(functions, tmp_path, gc, datastore_type):
+    with LocalExecutor(functions, datastore_type=datastore_type, datastore_name=datastore_name(tmp_path, datastore_type), gc=gc) as executor:
+        assert executor.run(NUM_BRANCHES) == [sum(i * 10 for i in range(NUM_BRANCHES))]
+        # A, every B and C
+        assert executor.invocations >= NUM_BRANCHES + 2
+
+        left = items_left(executor)
+
+    if gc == 'deferred':
+        # the sweeper deletes the whole session, including C's checkpoint
+        assert left == []
+    else:
+        # gc deletes every checkpoint and sync point except C's checkpoint,
+        # which no function consumes
+        assert len(left) == 1 and left[0].endswith('/C-output')
+
+
+
+def test_deferred_gc_with_a_slow_fan_in_branch(functions, tmp_path, monkeypatch):
+    '''With fused checkpoints, writing a branch's checkpoint also marks it as
+    ready. C and the sweeper can then run before the branch finishes.
+    '''
+    checkpoint_fanin_sync_ready = SQLiteDriver.checkpoint_fanin_sync_ready
+
+    def slow_first_branch(self, session, instance_name, *args):
+        ret = checkpoint_fanin_sync_ready(self, session, instance_name, *args)
+        if instance_name == 'B-unumIndex-0':
+            time.sleep(0.5)
+        return ret
+
+    monkeypatch.setattr(SQLiteDriver, 'checkpoint_fanin_sync_ready', slow_first_branch)
+
+    with LocalExecutor(functions, datastore_type='sqlite', datastore_name=str(tmp_path / 'unum.db'), gc='deferred') as executor:
+        assert executor.run(NUM_BRANCHES) == [sum(i * 10 for i in range(NUM_BRANCHES))]
+
+        assert items_left(executor) == []
+
+
+
+@pytest.mark.parametrize('datastore_type', ['memory', 'sqlite', 'fs'])
+def test_deferred_gc_of_a_session_that_ends_in_nested_maps(tmp_path, datastore_type):
+    '''A -> Map B -> Map C, where every C is a last function of the session
+    '''
+    configs = {
+        "A": {"Name": "A", "Start": True, "Checkpoint": True, "Next": {"Name": "B", "InputType": "Map"}},
+        "B": {"Name": "B", "Checkpoint": True, "Next": {"Name": "C", "InputType": "Map"}},
+        "C": {"Name": "C", "Checkpoint": True},
+    }
+    apps = {
+        "A": "def lambda_handler(event, context):\n    return list(range(event))\n",
+        "B": "def lambda_handler(event, context):\n    return list(range(event + 1))\n",
+        "C": "def lambda_handler(event, context):\n    return event\n",
+    }
+    functions = write_functions(tmp_path, configs, apps)
+
+    with LocalExecutor(functions, datastore_type=datastore_type, datastore_name=datastore_name(tmp_path, datastore_type), gc='deferred') as executor:
+        assert sorted(executor.run(4)) == sorted(j for i in range(4) for j in range(i + 1))
+
+        assert items_left(executor) == []
+
+
+
+def test_deferred_gc_requires_a_gc_log(monkeypatch):
+    monkeypatch.setattr(FirestoreDriver, 'db', None)
+
+    with pytest.raises(ValueError, match='does not support deferred gc'):
+        Unum({"Name": "A"}, 'firestore', 'unum-test', 'local', 'deferred')
+
+    assert Unum({"Name": "A"}, 'firestore', 'unum-test', 'local', 'true').gc == True
+
+
+
+def test_fused_functions_import_their_own_modules(tmp_path, monkeypatch):
+    '''A -> B -> C fused into A, where every function has a utils.py
+    '''
+    # a module of the same name that the process imported
+    utils = types.ModuleType('utils')
+    monkeypatch.setitem(sys.modules, 'utils', utils)
+
+    functions = {}
+    for name in 'ABC':
+        d = tmp_path / name
+        d.mkdir()
+        config = {"Name": name}
+        if name == 'A':
+            config.update({"Start": True, "Checkpoint": True, "Fused": ["B", "C"]})
+        (d / 'unum_config.json').write_text(json.dumps(config))
+        (d / 'utils.py').write_text(f'WHO = {name!r}\n')
+        (d / 'app.py').write_text('import utils\n\ndef lambda_handler(event, context):\n    return event + [utils.WHO]\n')
+        functions[name] = str(d)
+
+    with LocalExecutor({"A": functions["A"]}, fused_functions={"B": functions["B"], "C": functions["C"]}) as executor:
+        assert executor.run([]) == [['A', 'B', 'C']]
+
+    assert sys.modules['utils'] is utils
+
+
+
+@pytest.mark.parametrize('num_branches', [4, 50, 200])
+def test_map_through_relays(tmp_path, num_branches):
+    '''A Map wider than the relay tree's arity is dispatched through relays
+    '''
+    configs = dict(CONFIGS, A=dict(CONFIGS["A"], **{"Map Tree Arity": 4}))
+    functions = write_functions(tmp_path, configs, dict(APPS, C="def lambda_handler(event, context):\n    return event\n"))
+
+    with LocalExecutor(functions) as executor:
+        # C runs once, on the outputs of all branches in Map index order
+        assert executor.run(num_branches) == [[i * 10 for i in range(num_branches)]]
+
+        checkpoints = sorted(n.split('/', 1)[1] for n in items_left(executor) if n.endswith('-output'))
+
+    # every branch ran once, with its own Index, and relays run no user
+    # function or checkpoint
+    assert checkpoints == sorted(['A-output', 'C-output'] + [f'B-unumIndex-{i}-output' for i in range(num_branches)])
+    if num_branches > 4:
+        assert executor.invocations > num_branches + 2
+    else:
+        assert executor.invocations == num_branches + 2
+
+
+
+@pytest.mark.parametrize('gc', [False, True])
+@pytest.mark.parametrize('datastore_type', ['memory', 'sqlite'])
+def test_streamed_fan_in_input(tmp_path, monkeypatch, gc, datastore_type):
+    '''C's input streamed in several batches is the same as the list it
+    receives without streaming
+    '''
+    monkeypatch.setattr(FanInInputStream, 'BATCH_SIZE', 3)
+
+    read_batch = FanInInputStream._read_batch
+    batches = []
+
+    def record_batch(self, b):
+        batches.append(b)
+        return read_batch(self, b)
+
+    monkeypatch.setattr(FanInInputStream, '_read_batch', record_batch)
+
+    app = "def lambda_handler(event, context):\n    return [type(event).__name__, len(event), list(event), list(event)]\n"
+    outputs = {}
+    for stream in [False, True]:
+        workflow_dir = tmp_path / f'stream-{stream}'
+        workflow_dir.mkdir()
+        configs = dict(CONFIGS, C=dict(CONFIGS["C"], **{"Stream Fan-in Input": stream, "Fan-in Prefetch": 2}))
+        functions = write_functions(workflow_dir, configs, dict(APPS, C=app))
+
+        with LocalExecutor(functions, datastore_type=datastore_type, datastore_name=datastore_name(workflow_dir, datastore_type), gc=gc) as executor:
+            [outputs[stream]] = executor.run(NUM_BRANCHES)
+
+            left = items_left(executor)
+
+        if gc:
+            # the fan-in's gc tasks are collected from the stream too
+            assert len(left) == 1 and left[0].endswith('/C-output')
+
+    assert outputs[False] == ['list', NUM_BRANCHES, [i * 10 for i in range(NUM_BRANCHES)], [i * 10 for i in range(NUM_BRANCHES)]]
+    assert outputs[True] == ['FanInInputStream'] + outputs[False][1:]
+    # each of the two iterations read all 7 batches, in order
+    assert batches == list(range(7)) * 2
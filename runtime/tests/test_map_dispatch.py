@@ -0,0 +1,70 @@
+import pytest
+
+import serde
+from faas_invoke_backend import InvocationBackend
+from unum import UnumContinuation
+
+
+
+class FailingBackend(InvocationBackend):
+    '''Records invoked Map indexes and fails the invokes of `failed`
+    '''
+    def __init__(self, failed):
+        self.failed = failed
+        self.invoked = []
+
+    def invoke(self, function, data):
+        # payloads are handed to the backend serialized
+        if isinstance(data, bytes):
+            data = serde.loads(data)
+
+        index = data["Fan-out"]["Index"]
+        self.invoked.append(index)
+        if index in self.failed:
+            raise IOError(f'invoke failed at {index}')
+
+
+
+def run_map(backend, num_items, dispatch_concurrency):
+    continuation = UnumContinuation('A', 'B', 'Map', None, backend, 'fake', None,
+        dispatch_concurrency=dispatch_concurrency)
+
+    continuation.run([f'item-{i}' for i in range(num_items)],
+        'test-session',
+        {"Fan-out": None},
+        {},
+        [],
+        gc={'A': []},
+        my_name='A',
+        my_curr_instance_name='A')
+
+
+
+@pytest.mark.parametrize('dispatch_concurrency', [1, 4])
+def test_map_invokes_every_index(dispatch_concurrency):
+    backend = FailingBackend([])
+    run_map(backend, 10, dispatch_concurrency)
+
+    assert sorted(backend.invoked) == list(range(10))
+
+
+
+def test_sequential_dispatch_names_failed_index():
+    backend = FailingBackend([3, 7])
+
+    with pytest.raises(IOError, match=r'failed to invoke 1 of 10 indexes: \[3\]') as e:
+        run_map(backend, 10, 1)
+
+    assert backend.invoked == [0, 1, 2, 3]
+    assert str(e.value.__cause__) == 'invoke failed at 3'
+
+
+
+def test_concurrent_dispatch_names_failed_indexes():
+    backend = FailingBackend([7, 3])
+
+    with pytest.raises(IOError, match=r'failed to invoke 2 of 10 indexes: \[3, 7\]') as e:
+        run_map(backend, 10, 4)
+
+    assert sorted(backend.invoked) == list(range(10))
+    assert str(e.value.__cause__) == 'invoke failed at 3'
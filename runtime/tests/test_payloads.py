@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+import serde
+from local import LocalExecutor
+
+PAYLOAD_SIZE_LIMIT = 4000
+
+# outputs of A by kind. Random hex compresses by about half, which still
+# exceeds the limit.
+OUTPUTS = {
+    "compressible": "'x' * 50000",
+    "incompressible": "random.Random(0).randbytes(6000).hex()",
+    "small": "'x'",
+}
+
+
+
+def write_functions(tmp_path, configs, apps):
+    functions = {}
+    for name in configs:
+        d = tmp_path / name
+        d.mkdir()
+        (d / 'unum_config.json').write_text(json.dumps(configs[name]))
+        (d / 'app.py').write_text(apps[name])
+        functions[name] = str(d)
+
+    return functions
+
+
+
+@pytest.fixture
+def payloads(monkeypatch):
+    '''Record the "Data" of every payload by invoked function, except the
+    entry function's
+    '''
+    recorded = []
+    invoke = LocalExecutor.invoke
+
+    def record(self, function, data):
+        payload = serde.loads(data) if isinstance(data, bytes) else data
+        if "Session" in payload:
+            recorded.append((function, "Relay" in payload, payload["Data"]))
+        return invoke(self, function, data)
+
+    monkeypatch.setattr(LocalExecutor, 'invoke', record)
+    monkeypatch.setenv('UNUM_PAYLOAD_SIZE_LIMIT', str(PAYLOAD_SIZE_LIMIT))
+
+    return recorded
+
+
+
+def data_form(data):
+    if data["Source"] == "checkpoint":
+        return 'spilled'
+    if data.get("Encoding") == "zlib":
+        return 'compressed'
+    return 'inline'
+
+
+
+@pytest.mark.parametrize('output, compression, form', [
+    ('compressible', True, 'compressed'),
+    ('compressible', False, 'spilled'),
+    ('incompressible', True, 'spilled'),
+    ('small', True, 'inline'),
+])
+def test_scalar_payloads(tmp_path, monkeypatch, payloads, output, compression, form):
+    monkeypatch.setenv('UNUM_PAYLOAD_COMPRESSION', str(compression).lower())
+    functions = write_functions(tmp_path, {
+        "A": {"Name": "A", "Start": True, "Checkpoint": True, "Next": {"Name": "B", "InputType": "Scalar"}},
+        "B": {"Name": "B", "Checkpoint": True},
+    }, {
+        "A": f"import random\n\ndef lambda_handler(event, context):\n    return {OUTPUTS[output]}\n",
+        "B": "def lambda_handler(event, context):\n    return event\n",
+    })
+
+    with LocalExecutor(functions) as executor:
+        expected = executor.functions["A"].acquire().user_lambda(None, None)
+
+        assert executor.run(None) == [expected]
+
+    assert [(f, data_form(d)) for f, relay, d in payloads] == [('B', form)]
+
+
+
+@pytest.mark.parametrize('compression', [True, False])
+def test_map_payloads_through_relays(tmp_path, monkeypatch, payloads, compression):
+    '''Relay and leaf payloads refer to slices and elements of A's checkpoint
+    '''
+    monkeypatch.setenv('UNUM_PAYLOAD_COMPRESSION', str(compression).lower())
+    functions = write_functions(tmp_path, {
+        "A": {"Name": "A", "Start": True, "Checkpoint": True, "Map Tree Arity": 3, "Next": {"Name": "B", "InputType": "Map"}},
+        "B": {"Name": "B", "Checkpoint": True, "Next": {"Name": "C", "InputType": {"Fan-in": {"Values": ["B-unumIndex-*"]}}},
+            "Next Payload Modifiers": ["Pop"]},
+        "C": {"Name": "C", "Checkpoint": True},
+    }, {
+        "A": "import random\n\ndef lambda_handler(event, context):\n    return [random.Random(i).randbytes(i * 300).hex() for i in range(event)]\n",
+        "B": "def lambda_handler(event, context):\n    return event\n",
+        "C": "def lambda_handler(event, context):\n    return event\n",
+    })
+
+    with LocalExecutor(functions) as executor:
+        expected = executor.functions["A"].acquire().user_lambda(20, None)
+
+        # C's input is exactly A's output
+        assert executor.run(20) == [expected]
+
+    forms = {(relay, data_form(d)) for f, relay, d in payloads if f == 'B'}
+    # small elements are passed inline and large ones spilled, both to
+    # relays and to leaves
+    assert {(True, 'spilled'), (False, 'spilled'), (False, 'inline')} <= forms
@@ -0,0 +1,134 @@
+import random
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+# the driver's scripts need fakeredis's Lua support
+pytest.importorskip('lupa')
+import redis
+
+import serde
+from ds import RedisDriver
+
+SESSION = 'test-session'
+
+
+
+@pytest.fixture
+def driver(monkeypatch):
+    '''Return a function that creates a RedisDriver on a fake server with
+    the given UNUM_* environment variables
+    '''
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, 'from_url', classmethod(lambda cls, url: fakeredis.FakeRedis(server=server)))
+
+    def create(**env):
+        for k, v in env.items():
+            monkeypatch.setenv(k, str(v))
+
+        return RedisDriver('localhost:6379', False)
+
+    return create
+
+
+
+def checkpoint_data(output):
+    return {"User": serde.dumps(output).decode('utf-8')}
+
+
+
+def test_checkpoint_is_created_once(driver):
+    d = driver()
+
+    assert d.checkpoint(SESSION, 'A', checkpoint_data([1])) == 1
+    assert d.checkpoint(SESSION, 'A', checkpoint_data([2])) == -1
+    assert d.get_checkpoint(SESSION, 'A') == [1]
+    assert d.get_checkpoint(SESSION, 'B') == None
+
+
+
+def test_read_input(driver):
+    d = driver()
+    for i in range(3):
+        d.checkpoint(SESSION, f'B-unumIndex-{i}', dict(checkpoint_data(i), GC={f'B-unumIndex-{i}': ['C']}))
+
+    ckpts = d.read_input(SESSION, ['B-unumIndex-2', 'B-unumIndex-9', 'B-unumIndex-0'])
+
+    assert [c["User"] for c in ckpts] == [2, 0]
+    assert ckpts[0]["GC"] == {'B-unumIndex-2': ['C']}
+
+
+
+def test_only_the_last_branch_is_ready(driver):
+    d = driver()
+    num_branches = 20
+    order = list(range(num_branches))
+    random.Random(0).shuffle(order)
+
+    ready = [i for i in order if d.fanin_sync_ready(SESSION, 'C', i, f'B-unumIndex-{i}', num_branches)]
+
+    assert ready == [order[-1]]
+    # gc synchronization points are separate from fan-in ones
+    assert d.gc_sync_ready(SESSION, 'A', 0, 'B-unumIndex-0', 2) == False
+
+
+
+def test_duplicate_branches_are_not_counted(driver):
+    d = driver()
+
+    for i in range(3):
+        assert d.fanin_sync_ready(SESSION, 'C', i, f'B-unumIndex-{i}', 4) == False
+        assert d.fanin_sync_ready(SESSION, 'C', i, f'B-unumIndex-{i}', 4) == False
+
+    assert d.fanin_sync_ready(SESSION, 'C', 3, 'B-unumIndex-3', 4) == True
+    # a duplicate of the last branch also sees the synchronization complete
+    assert d.fanin_sync_ready(SESSION, 'C', 3, 'B-unumIndex-3', 4) == True
+
+
+
+def test_fused_checkpoint(driver):
+    d = driver()
+
+    def checkpoint_branch(index):
+        return d.checkpoint_fanin_sync_ready(SESSION, f'B-unumIndex-{index}', checkpoint_data(index), 'C', index, 3)
+
+    assert d.fused_checkpoint == True
+    assert checkpoint_branch(2) == (1, False)
+    assert checkpoint_branch(0) == (1, False)
+    # a duplicate neither writes the checkpoint nor counts
+    assert checkpoint_branch(0) == (-1, False)
+    assert checkpoint_branch(1) == (1, True)
+    assert checkpoint_branch(1) == (-1, False)
+
+    assert [c["User"] for c in d.read_input(SESSION, [f'B-unumIndex-{i}' for i in range(3)])] == [0, 1, 2]
+
+
+
+def test_ttl(driver):
+    d = driver(UNUM_CHECKPOINT_TTL=60)
+
+    d.checkpoint(SESSION, 'A', checkpoint_data(1))
+    d.checkpoint_fanin_sync_ready(SESSION, 'B-unumIndex-0', checkpoint_data(0), 'C', 0, 2)
+    d.append_gc_log(SESSION, 'A', ['A'], [])
+
+    for key in d.client.keys():
+        assert 0 < d.client.ttl(key) <= 60
+
+
+
+def test_gc_log(driver):
+    d = driver()
+
+    d.checkpoint(SESSION, 'A', checkpoint_data(1))
+    d.checkpoint_fanin_sync_ready(SESSION, 'B-unumIndex-0', checkpoint_data(0), 'C', 0, 1)
+    d.checkpoint('another-session', 'A', checkpoint_data(1))
+
+    d.append_gc_log(SESSION, 'A', ['A'], [])
+    d.append_gc_log(SESSION, 'B-unumIndex-0', ['B-unumIndex-0'], [d.fanin_sync_point_name(SESSION, 'C')])
+    # appending again is harmless
+    d.append_gc_log(SESSION, 'A', ['A'], [])
+    d.append_gc_log(SESSION, 'C', [], [])
+
+    assert d.sweep_gc_log(SESSION) == 3
+    assert d.client.keys() == [d.checkpoint_name('another-session', 'A').encode()]
+    assert d.sweep_gc_log(SESSION) == 0
@@ -0,0 +1,114 @@
+import importlib.util
+import json
+import sys
+
+import pytest
+
+import serde
+from serde import EncodedValue
+
+
+
+@pytest.fixture(params=['json', 'orjson'])
+def backend(request, monkeypatch):
+    if request.param == 'orjson' and serde.orjson == None:
+        pytest.skip('orjson is not installed')
+
+    monkeypatch.setattr(serde, 'BACKEND', request.param)
+
+    return request.param
+
+
+
+@pytest.mark.parametrize('payload', [
+    {"Data": {"Source": "http", "Value": [1, "a", {"b": None}]}},
+    {"Session": "s", "Fan-out": {"Type": "Map", "Index": 0, "Size": 2}, "Data": {"Value": {"k": [1.5]}}},
+    {"Data": {"Value": "x"}, "Session": "s"},
+    {"Data": {"Value": None}},
+])
+def test_dumps_payload_splices_value(backend, payload):
+    encoded = dict(payload)
+    encoded["Data"] = dict(payload["Data"], Value=EncodedValue(payload["Data"]["Value"]))
+
+    assert json.loads(serde.dumps_payload(encoded)) == payload
+    assert serde.loads(serde.dumps_payload(encoded)) == serde.loads(serde.dumps(payload))
+
+
+
+def test_dumps_payload_without_encoded_value(backend):
+    payload = {"Data": {"Source": "http", "Value": [1, 2]}}
+
+    assert serde.dumps_payload(payload) == serde.dumps(payload)
+    assert serde.dumps_payload({"Session": "s"}) == serde.dumps({"Session": "s"})
+
+
+
+def test_encoded_value_is_serialized_once(backend):
+    value = EncodedValue([1, 2])
+    # JSON that is already known is used as is
+    known = EncodedValue([1, 2], b'[1, 2]')
+
+    assert value.json is value.json
+    assert json.loads(value.text) == [1, 2]
+    assert serde.dumps_payload({"Data": {"Value": known}}).endswith(b'"Value":[1, 2]}}')
+    assert serde.encode(value) is value
+
+
+
+def test_encoded_value_slice_and_elements(backend):
+    value = EncodedValue([{"a": i} for i in range(5)])
+
+    elements = value.elements()
+    assert [json.loads(e.json) for e in elements] == value.value
+    # elements are serialized once for every slice and payload
+    assert value.elements() is elements
+
+    part = value.slice(1, 4)
+    assert part.value == value.value[1:4]
+    assert json.loads(part.json) == value.value[1:4]
+    assert json.loads(value.slice(5, 5).json) == []
+
+
+
+def test_orjson_falls_back_for_large_ints(monkeypatch):
+    if serde.orjson == None:
+        pytest.skip('orjson is not installed')
+    monkeypatch.setattr(serde, 'BACKEND', 'orjson')
+
+    value = {"big": 2 ** 70, "small": -1}
+
+    assert json.loads(serde.dumps(value)) == value
+    assert serde.loads(serde.dumps_payload({"Data": {"Value": EncodedValue(value)}})) == {"Data": {"Value": value}}
+
+
+
+def load_serde(monkeypatch, orjson_module, env=None):
+    '''Import a separate copy of serde with `orjson_module` as the orjson
+    package. None makes importing orjson fail.
+    '''
+    monkeypatch.setitem(sys.modules, 'orjson', orjson_module)
+    if env == None:
+        monkeypatch.delenv('UNUM_JSON_BACKEND', raising=False)
+    else:
+        monkeypatch.setenv('UNUM_JSON_BACKEND', env)
+
+    spec = importlib.util.spec_from_file_location('serde_copy', serde.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+
+def test_json_module_without_orjson(monkeypatch):
+    s = load_serde(monkeypatch, None)
+
+    assert s.orjson == None
+    assert s.BACKEND == 'json'
+    assert s.loads(s.dumps_payload({"Data": {"Value": s.EncodedValue([1, 2 ** 70])}})) == {"Data": {"Value": [1, 2 ** 70]}}
+
+    with pytest.raises(ImportError):
+        load_serde(monkeypatch, None, 'orjson')
+
+    with pytest.raises(ValueError):
+        load_serde(monkeypatch, None, 'pickle')
@@ -3,19 +3,100 @@ import json
 import uuid
 import os, sys
 import time, datetime
+import math
 import random
 import string
 import re
 import functools
 import copy
+import ast
+import zlib
+import base64
+import threading
+import importlib.util
+from collections import OrderedDict
 from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
 
 from faas_invoke_backend import InvocationBackend
+import serde
+from clients import ClientFactory
+
+# Modules of the unum runtime. unum-cli build copies them into every
+# function's directory, so they are shared rather than loaded per function by
+# load_function_module().
+RUNTIME_MODULES = ['main', 'unum', 'ds', 'serde', 'clients', 'faas_invoke_backend', 'local']
+
+
+
+def load_function_module(module_name, path, function_dir):
+    '''Import the Python file `path` as a new module called `module_name`,
+    with `function_dir` first on sys.path
+
+    Used to load the code of several functions into one process: fused
+    functions (main.load_fused_function()) and the functions of the local
+    executor. Functions may have modules of the same name, e.g., each its own
+    utils.py. The top-level modules and packages of `function_dir` (except
+    RUNTIME_MODULES) are therefore taken out of sys.modules while importing,
+    so that `path` imports the function's own copies even if the process
+    already imported modules of the same name (e.g., from the function that
+    a fused function is fused into). Afterwards, modules imported from
+    `function_dir` are removed from sys.modules and the modules taken out
+    are put back. The loaded module keeps references to the modules it
+    imported.
+
+    Imports that a function makes when it runs, rather than when it is
+    imported, are not isolated.
+    '''
+    function_dir = os.path.join(os.path.abspath(function_dir), '')
+
+    own_modules = set()
+    for e in os.listdir(function_dir):
+        if e.endswith('.py'):
+            own_modules.add(e[:-3])
+        elif os.path.isdir(os.path.join(function_dir, e)) and e.isidentifier():
+            own_modules.add(e)
+    own_modules = own_modules - set(RUNTIME_MODULES)
+
+    shadowed = {m: sys.modules.pop(m) for m in list(sys.modules) if m.split('.')[0] in own_modules}
+    loaded_modules = set(sys.modules)
+
+    sys.path.insert(0, function_dir)
+    try:
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(function_dir)
+
+        for m in set(sys.modules) - loaded_modules:
+            f = getattr(sys.modules[m], '__file__', None)
+            if m.split('.')[0] in own_modules or (f != None and os.path.abspath(f).startswith(function_dir)):
+                del sys.modules[m]
+
+        sys.modules.update(shadowed)
+
+    return module
 
 
 
 class Unum(object):
 
+    # Name of the function that sweeps a session's deferred gc log. See
+    # run_gc_sweeper(). unum-cli adds it to the platform template.
+    GC_SWEEPER_NAME = "UnumGCSweeper"
+
+    # Outputs of the instances that recently completed in this process,
+    # least recently used first. (session, instance name) -> serde.EncodedValue.
+    # Kept across invocations of a warm container (cleanup() does not reset
+    # it). See remember_completed().
+    completed = OrderedDict()
+    completed_lock = threading.Lock()
+    # `CompletedCacheSize` in the unum template's Globals
+    COMPLETED_CACHE_SIZE = int(os.environ.get('UNUM_COMPLETED_CACHE_SIZE', 64))
+    # Largest output in bytes of JSON that is remembered
+    COMPLETED_OUTPUT_MAX_SIZE = 256 * 1024
+
     def __init__(self, config, datastore_type, datastore_name, platform, gc):
         '''Given a unum configuration, unum intermediary data store info,
         create the runtime context for this function to run.
@@ -45,9 +126,16 @@ class Unum(object):
         '''
         self.name = config['Name']
         self.platform = platform
+        # With deferred gc, functions only record what to delete in the
+        # session's gc log, and the UnumGCSweeper function deletes it all
+        # once the session completes. See log_gc() and run_gc_sweeper().
+        self.gc_deferred = False
         if isinstance(gc, str):
             if gc == 'True' or gc == 'true':
                 self.gc = True
+            elif gc == 'Deferred' or gc == 'deferred':
+                self.gc = True
+                self.gc_deferred = True
             elif gc == 'False' or gc == 'false':
                 self.gc = False
             else:
@@ -68,6 +156,44 @@ class Unum(object):
         except KeyError:
             self.debug = False
 
+        # Maximum number of continuation invokes in flight at once. See
+        # UnumContinuation._dispatch_map() for how this is used.
+        try:
+            self.dispatch_concurrency = int(config['Dispatch Concurrency'])
+        except KeyError:
+            self.dispatch_concurrency = 1
+
+        # one pooled connection per invoke in flight
+        ClientFactory.reserve_connections('lambda', self.dispatch_concurrency)
+
+        # Map continuations wider than this are dispatched through a tree of
+        # relay invocations. See UnumContinuation._dispatch_map_tree().
+        try:
+            self.map_tree_arity = int(config['Map Tree Arity'])
+        except KeyError:
+            self.map_tree_arity = 0
+
+        # Pass fan-in inputs to the user function as a lazily read
+        # FanInInputStream instead of a list. See main.ingress().
+        try:
+            self.stream_fan_in_input = config['Stream Fan-in Input']
+        except KeyError:
+            self.stream_fan_in_input = False
+
+        try:
+            self.fan_in_prefetch = int(config['Fan-in Prefetch'])
+        except KeyError:
+            self.fan_in_prefetch = 2
+
+        # Continuation payloads larger than this many bytes are compressed
+        # (if `PayloadCompression` is true) or spilled to the data store. The
+        # default is the platform's limit on asynchronous invoke payloads.
+        # Both are workflow-wide settings in the unum template's Globals. See
+        # UnumContinuation._fit_payload().
+        self.payload_size_limit = int(os.environ.get('UNUM_PAYLOAD_SIZE_LIMIT',
+            InvocationBackend.subclasses.get(platform, InvocationBackend).PAYLOAD_SIZE_LIMIT))
+        self.payload_compression = os.environ.get('UNUM_PAYLOAD_COMPRESSION', 'false').lower() == 'true'
+
         try:
             self.entry_function = config['Start']
             self.get_session = self._generate_session
@@ -81,10 +207,21 @@ class Unum(object):
         except KeyError:
             self.next_payload_modifiers = []
 
+        # Modifiers are compiled once here rather than on every invocation.
+        # Invalid modifiers raise ValueError at cold start.
+        self.compiled_next_payload_modifiers = [m if m == "Pop" else UnumExpression(m, 'exec', UnumExpression.MODIFIER_VARIABLES)
+            for m in self.next_payload_modifiers]
+
         # print(f'Creating data store type: {datastore_type}, and name: {datastore_name}')
         self.ds = UnumIntermediaryDataStore.create(datastore_type, datastore_name, self.debug)
 
+        # Fail at cold start rather than at egress, after the user function
+        # ran and checkpointed
+        if self.gc_deferred and self.ds.deferred_gc == False:
+            raise ValueError(f'The {self.ds.my_type} data store does not support deferred gc (GC: deferred). Use GC: true instead')
+
         self.cont_list = []
+        self.faas_backend = None
         if 'Next' in config:
 
             self.faas_backend = InvocationBackend.create(platform)
@@ -98,6 +235,10 @@ class Unum(object):
                         config['Next'].get('Conditional'),
                         self.faas_backend, datastore_type,
                         self.ds,
+                        dispatch_concurrency=self.dispatch_concurrency,
+                        map_tree_arity=self.map_tree_arity,
+                        payload_size_limit=self.payload_size_limit,
+                        payload_compression=self.payload_compression,
                         debug=self.debug
                         ))
             elif isinstance(config['Next'], list):
@@ -130,6 +271,10 @@ class Unum(object):
                                 self.ds,
                                 parallel_index=pi,
                                 parallel_size=pc,
+                                dispatch_concurrency=self.dispatch_concurrency,
+                                map_tree_arity=self.map_tree_arity,
+                                payload_size_limit=self.payload_size_limit,
+                                payload_compression=self.payload_compression,
                                 debug=self.debug))
                         pi = pi+1
                     else:
@@ -142,6 +287,10 @@ class Unum(object):
                                 self.faas_backend,
                                 datastore_type,
                                 self.ds,
+                                dispatch_concurrency=self.dispatch_concurrency,
+                                map_tree_arity=self.map_tree_arity,
+                                payload_size_limit=self.payload_size_limit,
+                                payload_compression=self.payload_compression,
                                 debug=self.debug))
             else:
                 raise ValueError(f'Unknown config["Next"] type: {type(config["Next"])}; {config["Next"]}')
@@ -164,16 +313,31 @@ class Unum(object):
         self.curr_unumIndex_list = None
 
         self.previous_checkpoint = False
+        # serde.EncodedValue of a duplicate's output from Unum.completed
+        self.previous_output = None
         # self.curr_next_payload_fanout = None
 
+        # metadata after Next Payload Modifiers. See
+        # get_next_payload_metadata()
+        self.curr_next_payload_metadata = None
+
+        # Results of fan-in synchronizations fused with my checkpoint, keyed
+        # by the continuation's position in self.cont_list. See
+        # _run_checkpoint()
+        self.curr_fan_in_ready = {}
+
         # my_gc_tasks and my_outgoing_edges are for garbage collection
 
         # A dict whose keys are my parent nodes' instance names and values are
-        # that node's outgoing edges (i.e., child nodes' instance names)
+        # that node's outgoing edges (i.e., child nodes' instance names and
+        # compact Map edges. See UnumContinuation.compute_outgoing_edges())
         self.my_gc_tasks = None
         # A dict whose key is my instance name and values are my outgoing
         # edges
         self.my_outgoing_edges = None
+        # The FanInInputStream passed to the user function if fan-in input is
+        # streamed. my_gc_tasks is collected from it in run_gc().
+        self.fan_in_stream = None
 
 
 
@@ -188,9 +352,30 @@ class Unum(object):
         checkpointing and this instance is therefore a duplicate. unum sets
         self.previous_checkpoint = True to indicate a duplicate.
 
+        The data store is not read if this instance completed recently in
+        this process (see remember_completed()), in which case the output is
+        taken from Unum.completed, or if this instance cannot have a
+        checkpoint, i.e., it does not checkpoint (see _may_have_checkpoint()).
+
         @param input_payload dict the `event` from the lambda input
         '''
-        if self.debug == False:
+        if self.entry_function == False or "Session" in input_payload:
+            key = (self.get_session(input_payload), self.get_my_instance_name(input_payload))
+
+            with Unum.completed_lock:
+                encoded_output = Unum.completed.get(key)
+                if encoded_output != None:
+                    Unum.completed.move_to_end(key)
+
+            if encoded_output != None:
+                if self.debug:
+                    print(f'[DEBUG] {key[1]} of session {key[0]} completed in this container')
+
+                self.previous_checkpoint = True
+                self.previous_output = encoded_output
+                return encoded_output.value
+
+        if self._may_have_checkpoint(input_payload) == False:
             return None
 
         session = self.get_session(input_payload)
@@ -206,6 +391,95 @@ class Unum(object):
         return ds_ret
 
 
+
+    def remember_completed(self, input_payload, encoded_output):
+        '''Remember the output of this instance after it completed
+
+        Warm containers are reused, and duplicate deliveries of an
+        asynchronous event often land in the container that ran the
+        original. get_checkpoint() finds such duplicates in Unum.completed,
+        a least recently used cache of COMPLETED_CACHE_SIZE entries, without
+        reading the data store, and main.lambda_handler() re-dispatches the
+        continuations with the remembered output as it does for a duplicate
+        that finds its checkpoint.
+
+        Outputs larger than COMPLETED_OUTPUT_MAX_SIZE are not remembered, so
+        the cache holds at most COMPLETED_CACHE_SIZE * COMPLETED_OUTPUT_MAX_SIZE
+        bytes of JSON. Neither are the outputs of entry functions that started
+        a new session, which can have no duplicates.
+
+        @param encoded_output serde.EncodedValue of the user function output
+        '''
+        if Unum.COMPLETED_CACHE_SIZE <= 0 or (self.entry_function and "Session" not in input_payload):
+            return
+
+        if len(encoded_output.json) > Unum.COMPLETED_OUTPUT_MAX_SIZE:
+            return
+
+        key = (self.get_session(input_payload), self.get_my_instance_name(input_payload))
+
+        with Unum.completed_lock:
+            # without the element encodings from Map dispatch
+            Unum.completed[key] = serde.EncodedValue(encoded_output.value, encoded_output.json)
+            Unum.completed.move_to_end(key)
+
+            while len(Unum.completed) > Unum.COMPLETED_CACHE_SIZE:
+                Unum.completed.popitem(last=False)
+
+
+
+    def claim_execution(self, input_payload, owner=None):
+        '''Claim the right to run the user function of this instance
+
+        With execution leases (`ExecutionLease` in the unum template's
+        Globals, see the data store's claim_execution()), unum calls this
+        after get_checkpoint() finds no checkpoint and before running the user
+        function. The lease keeps concurrent duplicates of this instance
+        (e.g., an asynchronous event delivered twice) from running the user
+        function while the lease holder runs it. Duplicates that arrive after
+        the holder checkpointed find the checkpoint instead.
+
+        `owner` identifies this execution. Use the platform's request ID,
+        which stays the same when the platform retries a failed invocation,
+        so that a retry reclaims the lease of the execution that failed
+        instead of waiting for it to expire.
+
+        @return True if this execution may run the user function. False if
+            another execution holds the lease.
+        '''
+        if self.ds.execution_lease <= 0 or self._may_have_checkpoint(input_payload) == False:
+            return True
+
+        if owner == None:
+            owner = str(uuid.uuid4())
+
+        session = self.get_session(input_payload)
+        instance_name = self.get_my_instance_name(input_payload)
+
+        if self.ds.claim_execution(session, instance_name, owner):
+            return True
+
+        print(f'[WARN] {instance_name} of session {session} is running in another execution. Skipping this duplicate.')
+        return False
+
+
+
+    def _may_have_checkpoint(self, input_payload):
+        '''Return whether a checkpoint of this instance may exist
+
+        Functions that do not checkpoint (see _run_checkpoint()) never have
+        one. Neither do entry functions invoked without a session, which
+        start a new session.
+        '''
+        if self.checkpoint == False and self.no_fan_in_continuation():
+            return False
+
+        if self.entry_function and "Session" not in input_payload:
+            return False
+
+        return True
+
+
     @staticmethod
     def arn_to_function_name(arn):
         parts = arn.split(':')[-1].split('-')
@@ -232,25 +506,22 @@ class Unum(object):
 
         An instance name = f'{function_name}-unumIndex-{unum_index_str}'
 
-        @return a list of instance names
+        The branches of a Map continuation are represented by a single compact
+        edge rather than one instance name per branch. See
+        UnumContinuation.compute_outgoing_edges().
+
+        @return a list of instance names and compact Map edges
         '''
         
         if self.my_outgoing_edges == None:
 
-            post_modifier_metadata = self.run_next_payload_modifiers(input_payload)
+            post_modifier_metadata = self.get_next_payload_metadata(input_payload)
+            unum_index_list = self.get_my_unum_index_list(input_payload)
 
             outgoing_edges = []
 
             for c in self.cont_list:
-                next_payload = c.compute_payload_metadata(input_payload, user_function_output, post_modifier_metadata)
-
-                if next_payload == None:
-                    pass
-                elif isinstance(next_payload, list):
-                    for e in next_payload:
-                        outgoing_edges.append(Unum.compute_instance_name(c.function_name, e))
-                else:
-                    outgoing_edges.append(Unum.compute_instance_name(c.function_name, next_payload))
+                outgoing_edges.extend(c.compute_outgoing_edges(user_function_output, input_payload, unum_index_list, post_modifier_metadata))
 
             self.my_outgoing_edges = outgoing_edges
 
@@ -258,26 +529,41 @@ class Unum(object):
 
 
 
-    def run_continuation(self, input_payload, user_function_output):
+    def run_continuation(self, input_payload, user_function_output, encoded_output=None):
         '''Given the input payload of the invoker (runtime metadata) and the
         user function's output, execute the continuations.
 
         This function computes the session, and the fan-out field after Next
         Payload Modifiers before passing them to the continuation's run() API.
+
+        `encoded_output` is the user function's output as a
+        serde.EncodedValue, if the caller already has it (e.g., from
+        serializing the checkpoint), so that continuation payloads reuse its
+        JSON.
         '''
 
         if self.debug:
             print(f'[DEBUG] Before run_next_payload_modifiers. {self.get_my_instance_name(input_payload)}. My input payload: {input_payload}, My modifiers: {self.next_payload_modifiers}')
 
         session = self.get_session(input_payload)
-        next_payload_metadata = self.run_next_payload_modifiers(input_payload)
+        next_payload_metadata = self.get_next_payload_metadata(input_payload)
 
         if self.debug:
             print(f'[DEBUG] After run_next_payload_modifiers. {self.get_my_instance_name(input_payload)}. My input payload: {input_payload}, My modifiers: {self.next_payload_modifiers}. Continutaion payload metadata: {next_payload_metadata}')
 
         gc_info = {self.get_my_instance_name(input_payload): self.get_my_outgoing_edges(input_payload, user_function_output)}
 
-        for c in self.cont_list:
+        if encoded_output == None:
+            encoded_output = serde.EncodedValue(user_function_output)
+
+        # Oversized payloads refer to my checkpoint instead of carrying my
+        # output. See _run_checkpoint() for when a checkpoint is written
+        if self.checkpoint or self.no_fan_in_continuation() == False:
+            spill_instance_name = self.get_my_instance_name(input_payload)
+        else:
+            spill_instance_name = None
+
+        for i, c in enumerate(self.cont_list):
             c.run(user_function_output,
                 session,
                 next_payload_metadata,
@@ -285,14 +571,124 @@ class Unum(object):
                 self.get_my_unum_index_list(input_payload),
                 gc=gc_info,
                 my_name=self.name,
-                my_curr_instance_name=self.get_my_instance_name(input_payload))
+                my_curr_instance_name=self.get_my_instance_name(input_payload),
+                fan_in_ready=self.curr_fan_in_ready.get(i),
+                spill_instance_name=spill_instance_name,
+                encoded_output=encoded_output)
 
         # returning session simply for debugging purposes
         return session, next_payload_metadata
 
 
 
-    def _run_checkpoint(self, input_payload, user_function_output):
+    def run_relay(self, input_payload):
+        '''Dispatch the slice of a Map fan-out carried by a relay payload
+
+        When a Map continuation is wider than its "Map Tree Arity", the
+        invoker does not invoke every branch itself. Instead, it invokes the
+        Map continuation's function with relay payloads, each carrying a
+        contiguous slice of the Map's elements (see
+        UnumContinuation._dispatch_map_tree()). This function is invoked in
+        place of the user function on such a payload. It dispatches the slice,
+        either to the leaf branches directly or through another level of
+        relays, and does not checkpoint or garbage collect anything.
+
+        Leaf branches receive exactly the payload they would have received
+        from the original invoker, including the "Fan-out" Index and Size and
+        the "GC" field.
+        '''
+        relay = input_payload["Relay"]
+        values = self.read_input_value(input_payload)
+
+        # a relay payload that was spilled refers to the original invoker's
+        # checkpoint, which the leaf payloads can refer to as well
+        if input_payload["Data"]["Source"] == "checkpoint":
+            spill_instance_name = input_payload["Data"]["Value"]["Instance"]
+        else:
+            spill_instance_name = None
+
+        if self.faas_backend == None:
+            ClientFactory.reserve_connections('lambda', relay["Dispatch Concurrency"])
+            self.faas_backend = InvocationBackend.create(self.platform)
+
+        c = UnumContinuation(self.name,
+            relay["Function"],
+            'Map',
+            None,
+            self.faas_backend,
+            self.ds.my_type,
+            self.ds,
+            dispatch_concurrency=relay["Dispatch Concurrency"],
+            map_tree_arity=relay["Arity"],
+            payload_size_limit=self.payload_size_limit,
+            payload_compression=self.payload_compression,
+            debug=self.debug)
+
+        if self.debug:
+            print(f'[DEBUG] Relaying Map indexes [{relay["Start"]}, {relay["Start"]+len(values)}) of {relay["Size"]} to {relay["Function"]}')
+
+        c._dispatch_map_tree(serde.EncodedValue(values),
+            relay["Start"],
+            relay["Size"],
+            input_payload["Session"],
+            relay["Next Payload Metadata"],
+            input_payload.get("GC"),
+            [],
+            spill_instance_name=spill_instance_name)
+
+
+
+    def read_input_value(self, input_payload):
+        '''Return the value of an input payload whose "Data" is passed by
+        value
+
+        "Data" is one of
+
+            {"Source": "http", "Value": value}
+
+            {"Source": "http", "Encoding": "zlib", "Value": base64 string}
+
+            {"Source": "checkpoint", "Value": reference}
+
+        The latter two are created by invokers whose payload would exceed the
+        payload size limit (see UnumContinuation._fit_payload()). The
+        compressed value is the base64 encoded, zlib compressed JSON of the
+        value. A reference names the invoker's instance, whose checkpoint has
+        the value:
+
+            {"Instance": "A"}: the invoker's output
+
+            {"Instance": "A", "Index": 3}: a Map branch's element of it
+
+            {"Instance": "A", "Start": 0, "End": 100}: a relay's slice of it
+
+        The checkpoint is read only here, when the value is needed, and not
+        when, e.g., this instance is a duplicate that finds its own
+        checkpoint.
+        '''
+        data = input_payload["Data"]
+
+        if data["Source"] == "checkpoint":
+            reference = data["Value"]
+            ckpts = self.ds.read_input(input_payload["Session"], [reference["Instance"]])
+            if len(ckpts) == 0:
+                raise IOError(f'Input of {self.name} is in the checkpoint of {reference["Instance"]}, which does not exist')
+
+            value = ckpts[0]["User"]
+            if "Index" in reference:
+                return value[reference["Index"]]
+            if "Start" in reference:
+                return value[reference["Start"]:reference["End"]]
+            return value
+
+        if data.get("Encoding") == "zlib":
+            return serde.loads(zlib.decompress(base64.b64decode(data["Value"])))
+
+        return data["Value"]
+
+
+
+    def _run_checkpoint(self, input_payload, checkpoint_data, user_function_output):
         '''Checkpoint the user function's output
 
         Checkpoint saves the *user function's output* to the intermediary data
@@ -315,8 +711,18 @@ class Unum(object):
         or other types of continuations don't have to checkpoint.
 
         Users turn workflow-wise checkpoint on and off in the unum template.
+
+        If the data store fuses checkpoints (ds.fused_checkpoint), the
+        checkpoint of a fan-in branch is written together with the branch's
+        fan-in synchronization (ds.checkpoint_fanin_sync_ready()), and the
+        result is kept in self.curr_fan_in_ready for run_continuation().
+        Only the first Fan-in continuation whose conditional is true is fused.
+
+        @param checkpoint_data the checkpoint content. See main.egress()
+        @param user_function_output the user function's output, used to
+            evaluate Fan-in continuations' conditionals
         '''
-        # print(f'PRINTING _run_checkpoint. {self.get_session(input_payload)}; {self.get_my_instance_name(input_payload)}; {user_function_output}')
+        # print(f'PRINTING _run_checkpoint. {self.get_session(input_payload)}; {self.get_my_instance_name(input_payload)}; {checkpoint_data}')
 
         if self.previous_checkpoint:
             # if a previous checkpoint already exists, skip checkpoint again.
@@ -328,8 +734,17 @@ class Unum(object):
         if self.checkpoint == False and self.no_fan_in_continuation():
             return None
 
-        ret = self.ds.checkpoint(self.get_session(input_payload),
-                self.get_my_instance_name(input_payload), user_function_output)
+        session = self.get_session(input_payload)
+        instance_name = self.get_my_instance_name(input_payload)
+        fan_in = self._fused_fan_in(input_payload, user_function_output)
+
+        if fan_in == None:
+            ret = self.ds.checkpoint(session, instance_name, checkpoint_data)
+        else:
+            i, aggregation_function_instance_name, my_index, num_branches = fan_in
+            ret, ready = self.ds.checkpoint_fanin_sync_ready(session, instance_name, checkpoint_data,
+                aggregation_function_instance_name, my_index, num_branches)
+            self.curr_fan_in_ready[i] = ready
 
         if ret == -1:
             # checkpoint already exists
@@ -346,9 +761,46 @@ class Unum(object):
 
 
 
+    def _fused_fan_in(self, input_payload, user_function_output):
+        '''Return the fan-in synchronization to fuse with my checkpoint
+
+        @return None if the data store does not fuse checkpoints or I have no
+            Fan-in continuation to run. Otherwise, a tuple of the
+            continuation's position in self.cont_list, the aggregation
+            function's instance name, my index among the branches and the
+            number of branches.
+        '''
+        if self.ds.fused_checkpoint == False:
+            return None
+
+        next_payload_metadata = self.get_next_payload_metadata(input_payload)
+        unum_index_list = self.get_my_unum_index_list(input_payload)
+
+        for i, c in enumerate(self.cont_list):
+            if c.input_type != UnumContinuationInputType.FAN_IN:
+                continue
+
+            fan_in = c.prepare_fan_in(user_function_output, next_payload_metadata, input_payload, unum_index_list)
+            if fan_in != None:
+                payload, aggregation_function_instance_name, my_index, branch_instance_names = fan_in
+                return i, aggregation_function_instance_name, my_index, len(branch_instance_names)
+
+        return None
+
+
+
     def run_gc(self):
         '''Delete my parents' checkpoints to garbage collect
+
+        A parent's checkpoint is deleted by its only child, or by the
+        last-to-finish child if it has multiple, along with the gc
+        synchronization item of the children. A fan-in function also deletes
+        the fan-in synchronization item of its branches. All deletes are
+        collected and issued together with the data store's batched
+        delete_checkpoints() and delete_sync_points().
         '''
+        if self.fan_in_stream != None:
+            self.my_gc_tasks = self.fan_in_stream.gc_tasks()
 
         if self.my_gc_tasks == None:
             return
@@ -366,25 +818,143 @@ class Unum(object):
         if self.debug:
             print(f'[DEBUG] My instance name: {self.curr_instance_name}. My gc tasks:{self.my_gc_tasks}')
 
+        checkpoints = []
+        sync_points = []
+
         for k in self.my_gc_tasks:
-            if len(self.my_gc_tasks[k]) == 1:
-                if self.my_gc_tasks[k][0] == self.curr_instance_name:
+            num_edges = Unum.count_edges(self.my_gc_tasks[k])
+            my_idx = Unum.find_edge(self.my_gc_tasks[k], self.curr_instance_name)
+
+            if num_edges == 1:
+                if my_idx == 0:
                     # I'm the only child of my parent. Delete my parent's checkpoint now
-                    # print(f'[Unum] deleting {self.ds.checkpoint_name(self.curr_session, k)}')
-                    self.ds.delete_checkpoint(self.curr_session, k)
+                    checkpoints.append(k)
                 else:
                     print(f'I am not the child of my parent?')
 
-            elif len(self.my_gc_tasks[k]) > 1:
+            elif num_edges > 1:
                 # I have siblings.
-                my_idx = self.my_gc_tasks[k].index(self.curr_instance_name)
+                if my_idx == None:
+                    raise ValueError(f'{self.curr_instance_name} is not an outgoing edge of {k}: {self.my_gc_tasks[k]}')
 
-                if self.ds.gc_sync_ready(self.curr_session, k, my_idx, self.get_my_instance_name(), len(self.my_gc_tasks[k])):
-                    # print(f'[Unum] deleting {self.ds.checkpoint_name(self.curr_session, k)}')
-                    self.ds.delete_checkpoint(self.curr_session, k)
+                if self.ds.gc_sync_ready(self.curr_session, k, my_idx, self.curr_instance_name, num_edges):
+                    checkpoints.append(k)
+                    sync_points.append(self.ds.gc_sync_point_name(self.curr_session, k))
             else:
                 print(f'self.my_gc_tasks[k] has no element: {self.my_gc_tasks[k]}')
 
+        if self.fan_in_gc:
+            sync_points.append(self.ds.fanin_sync_point_name(self.curr_session, self.curr_instance_name))
+
+        if len(checkpoints) > 0:
+            self.ds.delete_checkpoints(self.curr_session, checkpoints)
+
+        if len(sync_points) > 0:
+            self.ds.delete_sync_points(sync_points)
+
+
+
+    def log_gc(self, input_payload):
+        '''Record my checkpoint and, if I'm a fan-in function, my branches'
+        fan-in synchronization item in the session's gc log
+
+        Used instead of run_gc() with deferred gc. This is called before
+        checkpointing, i.e., before anything that lets the session's last
+        function run: invoking continuations, or, with fused checkpoints
+        (see UnumIntermediaryDataStore.checkpoint_fanin_sync_ready()),
+        writing the checkpoint that marks my fan-in branch as ready. Every
+        function that runs before the last function has therefore logged its
+        items by the time the last function invokes the sweeper. Logging
+        items that are not written yet (e.g., the checkpoint of a run that
+        fails) is harmless, since the sweeper ignores missing items, and
+        logging the same items twice (e.g., by a duplicate) is idempotent.
+        '''
+        session = self.get_session(input_payload)
+        instance_name = self.get_my_instance_name(input_payload)
+        checkpoints = []
+        sync_points = []
+
+        # see _run_checkpoint() for when a checkpoint is written
+        if self.checkpoint or self.no_fan_in_continuation() == False:
+            checkpoints.append(instance_name)
+
+        if self.fan_in_gc:
+            sync_points.append(self.ds.fanin_sync_point_name(session, instance_name))
+
+        # see run_gc_sweeper()
+        if len(self.cont_list) == 0:
+            sync_points.extend(self.ds.fanin_sync_point_name(session, name) for name, index, size in self._gc_sweeper_sync_levels(input_payload))
+
+        self.ds.append_gc_log(session, instance_name, checkpoints, sync_points)
+
+
+
+    def _gc_sweeper_sync_levels(self, input_payload):
+        '''Return the synchronization of each level of my fan-out that the
+        last functions of a session that ends inside the fan-out go through
+        before invoking the sweeper, innermost level first
+
+        The branches of a level synchronize on a fan-in synchronization item
+        named after the sweeper and the indexes of the levels around it, e.g.,
+        UnumGCSweeper-unumIndex-3 for the inner Map of branch 3 of an outer
+        Map, and UnumGCSweeper for the outermost level.
+
+        @return list of (aggregation instance name, index, number of
+            branches). Empty if I'm not a branch of a fan-out.
+        '''
+        levels = []
+        fan_out = input_payload.get("Fan-out")
+
+        while fan_out != None:
+            outer_loop = fan_out.get("OuterLoop")
+            if outer_loop == None:
+                name = self.GC_SWEEPER_NAME
+            else:
+                name = f'{self.GC_SWEEPER_NAME}-unumIndex-{".".join(str(i) for i in Unum._compute_unum_index_list(outer_loop))}'
+
+            levels.append((name, int(fan_out["Index"]), int(fan_out["Size"])))
+            fan_out = outer_loop
+
+        return levels
+
+
+
+    def run_gc_sweeper(self, input_payload):
+        '''Invoke the UnumGCSweeper function on the session if I'm the
+        session's last function
+
+        I'm a last function if I have no continuations. If I'm not a branch
+        of a fan-out, I'm the session's only last function. Otherwise (e.g.,
+        a Map without a fan-in ends the workflow), every branch has a last
+        function, and they synchronize level by level of the fan-out,
+        innermost first, with fanin_sync_ready() (see
+        _gc_sweeper_sync_levels()). The last to finish at the outermost
+        level invokes the sweeper.
+
+        Sessions whose last functions never all run (e.g., a Map over an
+        empty list that ends the workflow, or a function whose Conditional
+        continuations all evaluate to false) are not swept. With a data
+        store that has no TTL (memory, sqlite, fs), their items stay until
+        they are deleted by other means.
+        '''
+        if len(self.cont_list) > 0:
+            return
+
+        session = self.get_session(input_payload)
+        instance_name = self.get_my_instance_name(input_payload)
+
+        for name, index, size in self._gc_sweeper_sync_levels(input_payload):
+            if self.ds.fanin_sync_ready(session, name, index, instance_name, size) == False:
+                return
+
+        if self.faas_backend == None:
+            self.faas_backend = InvocationBackend.create(self.platform)
+
+        if self.debug:
+            print(f'[DEBUG] Invoking {self.GC_SWEEPER_NAME} on session {self.get_session(input_payload)}')
+
+        self.faas_backend.invoke(self.GC_SWEEPER_NAME, {"Session": self.get_session(input_payload)})
+
 
 
     def no_fan_in_continuation(self):
@@ -396,6 +966,42 @@ class Unum(object):
 
 
 
+    def get_next_payload_metadata(self, input_payload):
+        '''Return the metadata fields after executing Next Payload Modifiers
+
+        This function caches the result into self.curr_next_payload_metadata
+        so that gc (get_my_outgoing_edges()) and continuations
+        (run_continuation()) share the same metadata. The returned metadata
+        is shared with the payloads of all continuations and must not be
+        modified.
+
+        See run_next_payload_modifiers() for how the metadata is computed.
+        '''
+        if self.curr_next_payload_metadata == None:
+            self.curr_next_payload_metadata = self.run_next_payload_modifiers(input_payload)
+
+        return self.curr_next_payload_metadata
+
+
+
+    @staticmethod
+    def _copy_fan_out(fan_out):
+        '''Copy a "Fan-out" field and all its "OuterLoop"s
+
+        Fan-out objects only hold scalars besides "OuterLoop", so this is a
+        deep copy without copy.deepcopy()'s bookkeeping.
+        '''
+        if fan_out == None:
+            return None
+
+        ret = dict(fan_out)
+        if "OuterLoop" in ret:
+            ret["OuterLoop"] = Unum._copy_fan_out(ret["OuterLoop"])
+
+        return ret
+
+
+
     def run_next_payload_modifiers(self, input_payload):
         '''Given the input payload, return the metadata fields after executing
         Next Payload Modifiers as a dict.
@@ -407,16 +1013,25 @@ class Unum(object):
         Metadata fields are:
             1. "Fan-out"
 
+        The input payload is never modified. "Pop" only selects an OuterLoop,
+        so the Fan-out field is copied only if a modifier assigns to unum
+        variables. Otherwise the returned metadata shares the Fan-out objects
+        of the input payload.
+
         @return a dict with all metadata fields. If a field doesn't exist in
             the input payload or is removed by a Next Payload Modifier, that
             field is included in the return dict and maps to None.
         '''
-        temp = {
-            "Fan-out": input_payload.get("Fan-out")
+        fan_out = input_payload.get("Fan-out")
+
+        if any(m != "Pop" for m in self.compiled_next_payload_modifiers):
+            fan_out = Unum._copy_fan_out(fan_out)
+
+        metadata = {
+            "Fan-out": fan_out
         }
 
-        metadata  = copy.deepcopy(temp)
-        for m in self.next_payload_modifiers:
+        for m in self.compiled_next_payload_modifiers:
             metadata = self._run_next_payload_modifier(m, metadata)
 
 
@@ -430,6 +1045,14 @@ class Unum(object):
     def _run_next_payload_modifier(self, modifier, metadata):
         '''Run a single modifier on the metadata and return the updated
         metadata
+
+        @param modifier "Pop" or an UnumExpression compiled from the modifier
+            in the unum config
+
+        Modifiers other than "Pop" are statements that read and assign unum
+        variables, e.g., "$0=$0+1". `$size` is the "Size" of the inner-most
+        Fan-out, and `$n` is the "Index" of the Fan-out n levels out from the
+        inner-most one (following "OuterLoop").
         '''
 
         # The following modifiers all require the metadata to have an
@@ -447,23 +1070,31 @@ class Unum(object):
             metadata["Fan-out"] = metadata["Fan-out"]["OuterLoop"]
             return metadata
 
-        exec_modifier = modifier
-        if "$size" in modifier:
-            exec_modifier = exec_modifier.replace("$size", 'metadata["Fan-out"]["Size"]')
+        def _fan_out_field(v):
+            # the Fan-out object and the key in it that variable v refers to
+            if v == 'size':
+                return metadata["Fan-out"], "Size"
 
-        if "$0" in modifier:
-            exec_modifier = exec_modifier.replace("$0", 'metadata["Fan-out"]["Index"]')
+            fan_out = metadata["Fan-out"]
+            for i in range(int(v)):
+                fan_out = fan_out["OuterLoop"]
 
-        if "$1" in modifier:
-            exec_modifier = exec_modifier.replace("$1", 'metadata["Fan-out"]["OuterLoop"]["Index"]')
+            return fan_out, "Index"
 
         if self.debug:
             print(f'[DEBUG] metadata before modifier: {metadata}')
 
-        exec(exec_modifier)
+        values = {}
+        for v in modifier.loads:
+            fan_out, key = _fan_out_field(v)
+            values[v] = fan_out[key]
+
+        for v, value in modifier.execute(values).items():
+            fan_out, key = _fan_out_field(v)
+            fan_out[key] = value
 
         if self.debug:
-            print(f'[DEBUG] exec_modifier: {exec_modifier}')
+            print(f'[DEBUG] modifier: {modifier.source}')
             print(f'[DEBUG] New metadata: {metadata}')
 
         return metadata
@@ -541,6 +1172,52 @@ class Unum(object):
 
 
 
+    @staticmethod
+    def count_edges(edges):
+        '''Return the number of function instances in a list of outgoing
+        edges
+
+        Outgoing edges are instance names or compact Map edges (see
+        UnumContinuation.compute_outgoing_edges()). A compact Map edge counts
+        as its "Size" instances.
+        '''
+        return sum(1 if isinstance(e, str) else int(e["Size"]) for e in edges)
+
+
+
+    @staticmethod
+    def find_edge(edges, instance_name):
+        '''Return the position of an instance in a list of outgoing edges
+
+        The position is the instance's index in the list with every compact
+        Map edge expanded in place to its instance names in branch order.
+        Compact Map edges are matched by parsing the instance name instead of
+        being expanded.
+
+        @return the position, or None if instance_name is not in the edges
+        '''
+        pos = 0
+        for e in edges:
+            if isinstance(e, str):
+                if e == instance_name:
+                    return pos
+                pos = pos + 1
+                continue
+
+            # "Size" is a Decimal if the edges are read from DynamoDB
+            size = int(e["Size"])
+            prefix = f'{e["Function"]}-unumIndex-'
+            if instance_name.startswith(prefix) and instance_name.endswith(e["Suffix"]):
+                i = instance_name[len(prefix):len(instance_name)-len(e["Suffix"])]
+                if i.isdigit() and int(i) < size:
+                    return pos + int(i)
+
+            pos = pos + size
+
+        return None
+
+
+
     @staticmethod
     def _compute_unum_index_list(fan_out_field):
         '''Given the "Fan-out" field of the input payload, compute the
@@ -662,21 +1339,7 @@ class Unum(object):
         Note: the names are expanded from the invoker's perspective based on
         the invoker's input payload before any Next Payload Modifier runs.
         '''
-        ret = name
-
-        if "$0" in ret:
-            ret = ret.replace("$0", str(input_payload["Fan-out"]["Index"]))
-
-        if "$1" in ret:
-            ret = ret.replace("$1", str(input_payload["Fan-out"]["OuterLoop"]["Index"]))
-
-        if "$2" in ret:
-            ret = ret.replace("$2", str(input_payload["Fan-out"]["OuterLoop"]["OuterLoop"]["Index"]))
-
-        if "$3" in ret:
-            ret = ret.replace("$2", str(input_payload["Fan-out"]["OuterLoop"]["OuterLoop"]["OuterLoop"]["Index"]))
-
-        return ret
+        return UnumExpression.substitute_positionals(name, Unum.compute_unum_index_list(input_payload))
 
 
 
@@ -730,11 +1393,16 @@ class Unum(object):
         self.curr_session = None
         self.curr_instance_name = None
         self.curr_next_payload_fanout = None
+        self.curr_next_payload_metadata = None
+        self.curr_fan_in_ready = {}
         self.curr_unumIndex_str = None
         self.curr_unumIndex_list = None
         self.previous_checkpoint = False
+        self.previous_output = None
         self.my_gc_tasks = None
         self.my_outgoing_edges = None
+        self.fan_in_stream = None
+        self.fan_in_gc = False
 
 
 
@@ -760,6 +1428,135 @@ class Unum(object):
 
 
 
+class UnumExpression(object):
+    '''A Conditional or Next Payload Modifier from the unum config, parsed
+    and compiled once
+
+    Unum variables in the source are replaced with Python identifiers (e.g.,
+    `$0` with `_unum_0`) by a regular expression that matches whole
+    variables, so `$1` never matches part of `$10`. The result is parsed into
+    an AST that is validated against a small set of allowed nodes (literals,
+    arithmetic, comparisons, boolean operators, conditional expressions and,
+    for modifiers, assignments to unum variables) and compiled into a code
+    object. Evaluating the expression binds only the unum variables it reads
+    and runs the code object without builtins.
+
+    Invalid sources raise ValueError when the expression is constructed,
+    i.e., at cold start instead of on the invocation that uses them.
+    '''
+    VARIABLE = re.compile(r'\$(size|ret|out|\d+)\b')
+    IDENTIFIER_PREFIX = '_unum_'
+
+    CONDITIONAL_VARIABLES = ['size', 'ret', 'out', 'n']
+    MODIFIER_VARIABLES = ['size', 'n']
+
+    ALLOWED_NODES = (ast.Expression, ast.Module, ast.Assign, ast.AugAssign,
+        ast.BoolOp, ast.BinOp, ast.UnaryOp, ast.Compare, ast.IfExp,
+        ast.Name, ast.Constant, ast.Load, ast.Store,
+        ast.boolop, ast.operator, ast.unaryop, ast.cmpop)
+
+    def __init__(self, source, mode, allowed_variables):
+        '''
+        @param source the Conditional or modifier string
+        @param mode 'eval' for Conditionals, 'exec' for modifiers
+        @param allowed_variables list of unum variable names the source may
+            use, without the '$'. 'n' stands for all positional variables.
+        '''
+        self.source = source
+        self.mode = mode
+
+        translated = self.VARIABLE.sub(lambda m: self.IDENTIFIER_PREFIX + m.group(1), source)
+
+        try:
+            tree = ast.parse(translated.strip(), mode=mode)
+        except SyntaxError as e:
+            raise ValueError(f'Invalid unum expression "{source}": {e.msg}')
+
+        loads = set()
+        stores = set()
+
+        for node in ast.walk(tree):
+            if not isinstance(node, self.ALLOWED_NODES):
+                raise ValueError(f'Invalid unum expression "{source}": {type(node).__name__} is not supported')
+
+            if isinstance(node, ast.Name):
+                if not node.id.startswith(self.IDENTIFIER_PREFIX):
+                    raise ValueError(f'Invalid unum expression "{source}": unknown name {node.id}')
+
+                v = node.id[len(self.IDENTIFIER_PREFIX):]
+                if (v.isdigit() and 'n' not in allowed_variables) or (not v.isdigit() and v not in allowed_variables):
+                    raise ValueError(f'Invalid unum expression "{source}": ${v} is not supported here')
+
+                if isinstance(node.ctx, ast.Store):
+                    stores.add(v)
+                else:
+                    loads.add(v)
+
+            if isinstance(node, ast.AugAssign):
+                # x += 1 reads x too
+                loads.add(node.target.id[len(self.IDENTIFIER_PREFIX):])
+
+        # unum variables read by the expression, without the '$'
+        self.loads = sorted(loads)
+        # unum variables assigned by the expression, without the '$'
+        self.stores = sorted(stores)
+
+        self.code = compile(tree, f'<unum expression: {source}>', mode)
+
+
+
+    @classmethod
+    def substitute_positionals(cls, name, unum_index_list):
+        '''Replace the positional unum variables in a name (e.g., $0, $1) with
+        the Fan-out indexes in `unum_index_list`
+
+        Variables are matched the same way as in expressions, so `$1` never
+        matches part of `$10`. Other unum variables are left as they are.
+        '''
+        def index(m):
+            if m.group(1).isdigit():
+                return str(unum_index_list[int(m.group(1))])
+
+            return m.group(0)
+
+        return cls.VARIABLE.sub(index, name)
+
+
+
+    def __str__(self):
+        return self.source
+
+
+
+    def _bind(self, values):
+        return {self.IDENTIFIER_PREFIX + v: values[v] for v in self.loads}
+
+
+
+    def evaluate(self, values):
+        '''Return the value of a Conditional
+
+        @param values dict from each unum variable in self.loads to its value
+        '''
+        return eval(self.code, {'__builtins__': {}}, self._bind(values))
+
+
+
+    def execute(self, values):
+        '''Run a modifier and return the new values of the unum variables it
+        assigns
+
+        @param values dict from each unum variable in self.loads to its value
+
+        @return dict from each unum variable in self.stores to its new value
+        '''
+        env = self._bind(values)
+        exec(self.code, {'__builtins__': {}}, env)
+
+        return {v: env[self.IDENTIFIER_PREFIX + v] for v in self.stores}
+
+
+
 class UnumContinuationInputType(Enum):
     SCALAR = 1
     MAP = 2
@@ -769,7 +1566,7 @@ class UnumContinuationInputType(Enum):
 
 class UnumContinuation(object):
 
-    def __init__(self, my_node_name, function_name, input_type, conditional, invoker, datastore_type, datastore, parallel_index=-1, parallel_size=0,debug=False):
+    def __init__(self, my_node_name, function_name, input_type, conditional, invoker, datastore_type, datastore, parallel_index=-1, parallel_size=0, dispatch_concurrency=1, map_tree_arity=0, payload_size_limit=0, payload_compression=False, debug=False):
         '''Given the "Name", "InputType", "Conditional" from the "Next" field
         of a unum config, create a UnumContinuation object
 
@@ -798,14 +1595,36 @@ class UnumContinuation(object):
         map already adds a "Fan-out" field to the runtime metadata in the
         payload.
 
+        `dispatch_concurrency` bounds how many invokes _run_map() keeps in
+        flight at once. See _dispatch_map(). `map_tree_arity` bounds how many
+        invokes a single function instance makes for one Map continuation.
+        See _dispatch_map_tree(). Payloads larger than `payload_size_limit`
+        are compressed or spilled. See _fit_payload().
+
         @param function_name str "Name" field
         @param input_type str or dict "InputType" field
+        @param dispatch_concurrency int "Dispatch Concurrency" field of the
+            unum config
+        @param map_tree_arity int "Map Tree Arity" field of the unum config.
+            0 or 1 disables relay trees.
+        @param payload_size_limit int payload size limit in bytes. 0 means no
+            limit.
+        @param payload_compression bool whether to compress oversized
+            payloads before spilling them
         '''
         self.my_node_name = my_node_name
         self.function_name = function_name
         self.invoker = invoker
         self.conditional = conditional
+        if conditional == None:
+            self.compiled_conditional = None
+        else:
+            self.compiled_conditional = UnumExpression(conditional, 'eval', UnumExpression.CONDITIONAL_VARIABLES)
         self.datastore = datastore
+        self.dispatch_concurrency = dispatch_concurrency
+        self.map_tree_arity = map_tree_arity
+        self.payload_size_limit = payload_size_limit
+        self.payload_compression = payload_compression
         self.debug=debug
 
         if input_type == 'Scalar':
@@ -851,114 +1670,86 @@ class UnumContinuation(object):
         unum variables come from the input payload of this function (the
         invoker) *before* any Next Payload Modifiers execute.
 
-        '''
-        # Need to replace all references with the actual value, not just the
-        # variable name
+        `$ret` and `$out` are the user function's output, e.g.,
+        `$ret == "done"` or `$out > 0`.
 
-        if self.conditional == None:
+        The conditional is compiled once when the continuation is created.
+        See UnumExpression.
+        '''
+        if self.compiled_conditional == None:
             return True
 
-        cond = self.conditional
-
-        if "$size" in cond:
-            cond = cond.replace("$size", str(input_payload["Fan-out"]["Size"]))
-        if "$0" in cond:
-            cond = cond.replace("$0", str(unum_index_list[0]))
-        if "$1" in cond:
-            cond = cond.replace("$1", str(unum_index_list[1]))
-        if "$2" in cond:
-            cond = cond.replace("$1", str(unum_index_list[2]))
-
-        if "$ret" in cond:
-            # TODO: Depending on the return value types that we want to support,
-            # we might need a more complex conversion than simply calling `str()`.
-            # See the Step Functions Choice state for the types and comparison
-            # operators that they support.
-
-            if isinstance(user_function_output,str):
-                cond = cond.replace("$ret", f"'{user_function_output}'")
+        values = {}
+        for v in self.compiled_conditional.loads:
+            if v == 'size':
+                values[v] = input_payload["Fan-out"]["Size"]
+            elif v == 'ret' or v == 'out':
+                values[v] = user_function_output
             else:
-                uerror(f'Unsupported user function return value type for Conditional')
-                return False
+                values[v] = unum_index_list[int(v)]
 
-        # raise IOError(f'{cond}, {type(cond)}; {cont["Conditional"]}')
-
-        # print(f"[check_conditional()] The conditional string to be eval: {cond} and it's {eval(cond)}")
-        
-        return eval(cond)
+        return self.compiled_conditional.evaluate(values)
 
 
 
-    def compute_payload_metadata(self, input_payload, user_function_output, post_modifier_metadata):
-        '''Given my input payload and my user code results, compute the input
-        payload metadata of this continuation
+    def compute_outgoing_edges(self, user_function_output, input_payload, unum_index_list, post_modifier_metadata):
+        '''Given my input payload and my user code results, return the
+        instance names of the functions this continuation will invoke
 
-        "Input payload metadata" refers to the input payload less the actual
-        data to user code.
+        The instance names are derived from the "Fan-out" field that the
+        continuation's payloads will have (see _run_scalar(), _run_map() and
+        _run_fan_in()) without building the payloads themselves.
 
-        If this continuation will not be invoked (e.g., due to a false
-        conditional), return None.
+        The branches of a Map are returned as a single compact Map edge,
 
-        Map continuations will return a list of payloads (dictionaries).
-
-        '''
-        if self.check_conditional(user_function_output, input_payload, Unum.compute_unum_index_list(input_payload)) == False:
-            return None
+            {
+                "Function": "B",
+                "Size": 100,
+                "Suffix": ".2.0"
+            }
 
-        if self.input_type == UnumContinuationInputType.SCALAR:
-            payload = {}
-            if self.parallel_size > 1:
-                payload["Fan-out"] = {
-                    "Type": "Parallel",
-                    "Index": self.parallel_index,
-                    "Size": self.parallel_size
-                }
+        which stands for the instance names B-unumIndex-0.2.0, ...,
+        B-unumIndex-99.2.0, so that the "GC" field every Map branch receives
+        stays the same size regardless of the Map's width. Use
+        Unum.count_edges() and Unum.find_edge() to read the edges.
 
-            for f in post_modifier_metadata:
-                if post_modifier_metadata[f] != None:
-                    if f == "Fan-out" and "Fan-out" in payload:
-                        payload["Fan-out"]["OuterLoop"] = post_modifier_metadata[f]
-                    else:
-                        payload[f] = post_modifier_metadata[f]
+        If this continuation will not be invoked (e.g., due to a false
+        conditional), return [].
 
-            return payload
+        @return a list of instance names and compact Map edges
+        '''
+        if self.check_conditional(user_function_output, input_payload, unum_index_list) == False:
+            return []
 
-        elif self.input_type == UnumContinuationInputType.FAN_IN:
-            payload = {}
-            for f in post_modifier_metadata:
-                if post_modifier_metadata[f] != None:
-                    if f == "Fan-out" and "Fan-out" in payload:
-                        payload["Fan-out"]["OuterLoop"] = post_modifier_metadata[f]
-                    else:
-                        payload[f] = post_modifier_metadata[f]
+        outer_loop = post_modifier_metadata.get("Fan-out")
+        if outer_loop == None:
+            outer_index_str = None
+        else:
+            outer_index_str = Unum.compute_unum_index_str({"Fan-out": outer_loop})
 
-            return payload
+        if self.input_type == UnumContinuationInputType.MAP:
+            if isinstance(user_function_output, list) == False:
+                return []
 
-        elif self.input_type == UnumContinuationInputType.MAP:
-            ret = []
+            if len(user_function_output) == 0:
+                return []
 
-            for i, d in enumerate(user_function_output):
-                payload = {
-                    "Fan-out": {
-                        "Type": "Map",
-                        "Index": i,
-                        "Size": len(user_function_output)
-                    }
-                }
+            return [{
+                "Function": self.function_name,
+                "Size": len(user_function_output),
+                "Suffix": '' if outer_index_str == None else f'.{outer_index_str}'
+            }]
 
-                for f in post_modifier_metadata:
-                    if post_modifier_metadata[f] != None:
-                        if f == "Fan-out":
-                            payload["Fan-out"]["OuterLoop"] = post_modifier_metadata[f]
-                        else:
-                            payload[f] = post_modifier_metadata[f]
+        if self.input_type == UnumContinuationInputType.SCALAR and self.parallel_size > 1:
+            suffix = '' if outer_index_str == None else f'.{outer_index_str}'
 
-                ret.append(payload)
+            return [f'{self.function_name}-unumIndex-{self.parallel_index}{suffix}']
 
-            return ret
+        # chain and fan-in payloads carry the Fan-out field as is
+        if outer_index_str == None:
+            return [self.function_name]
 
-        else:
-            print(f'Unknown contintuation type: {self.input_type}')
+        return [f'{self.function_name}-unumIndex-{outer_index_str}']
 
 
 
@@ -967,7 +1758,8 @@ class UnumContinuation(object):
 
         `user_function_output` is sent as a scalar to the continuation
         function, i.e., payload["Data"]["Value"] =
-        json.dumps(user_function_output)
+        json.dumps(user_function_output). The JSON is taken from the
+        `encoded_output` keyword argument (a serde.EncodedValue) if given.
 
         `user_function_output` can be any json serializable value.
 
@@ -1022,7 +1814,7 @@ class UnumContinuation(object):
         payload = {
             "Data": {
                 "Source": "http",
-                "Value": user_function_output # will be serialized once together with the payload by invoker.invoke()
+                "Value": serde.encode(kwargs.get('encoded_output', user_function_output))
             },
             "Session": session
         }
@@ -1044,6 +1836,8 @@ class UnumContinuation(object):
 
         payload['GC'] = kwargs['gc']
 
+        payload = self._fit_payload(payload, kwargs.get('spill_instance_name'))
+
         if self.debug:
             # t1 = time.perf_counter_ns()
             ret = self.invoker.invoke(self.function_name, payload)
@@ -1077,33 +1871,246 @@ class UnumContinuation(object):
 
         size = len(user_function_output)
 
-        for i,d in enumerate(user_function_output):
-            payload = {
+        self._dispatch_map_tree(serde.encode(kwargs.get('encoded_output', user_function_output)), 0, size, session, next_payload_metadata, kwargs['gc'], unum_index_list,
+            spill_instance_name=kwargs.get('spill_instance_name'))
+
+
+
+    def _map_payload(self, index, size, value, session, next_payload_metadata, gc):
+        '''Return the payload of the Map branch at `index`
+
+        @param value serde.EncodedValue the branch's element
+        '''
+        payload = {
+            "Data": {
+                "Source": "http",
+                "Value": value
+            },
+            "Session": session,
+            "Fan-out": {
+                "Type": "Map",
+                "Index": index,
+                "Size": size
+            }
+        }
+
+        for f in next_payload_metadata:
+            if next_payload_metadata[f] != None:
+                if f == "Fan-out":
+                    payload["Fan-out"]["OuterLoop"] = next_payload_metadata[f]
+                else:
+                    payload[f] = next_payload_metadata[f]
+
+        payload['GC'] = gc
+
+        return payload
+
+
+
+    def _dispatch_map_tree(self, values, start, size, session, next_payload_metadata, gc, unum_index_list, spill_instance_name=None):
+        '''Dispatch the Map branches at indexes [start, start+len(values))
+        through a k-ary tree of relay invocations, where k is
+        self.map_tree_arity
+
+        `values` is a serde.EncodedValue of the slice's elements. Each element
+        is serialized once and the JSON of relay sub-slices is joined from
+        the elements' JSON.
+
+        If relay trees are disabled (k <= 1) or the slice has at most k
+        elements, its branches are invoked directly. Otherwise, the slice is split into at most k contiguous
+        sub-slices and the Map continuation's function is invoked once per
+        sub-slice with a relay payload:
+
+            {
                 "Data": {
                     "Source": "http",
-                    "Value": d # will be serialized once together with the payload by invoker.invoke()
+                    "Value": [the elements of the sub-slice]
                 },
                 "Session": session,
-                "Fan-out": {
-                    "Type": "Map",
-                    "Index": i,
-                    "Size": size
-                }
+                "Relay": {
+                    "Function": the Map continuation's function name,
+                    "Start": the Map index of the sub-slice's first element,
+                    "Size": the size of the whole Map,
+                    "Arity": k,
+                    "Dispatch Concurrency": the invoker's dispatch concurrency,
+                    "Next Payload Metadata": next_payload_metadata
+                },
+                "GC": gc
             }
 
-            for f in next_payload_metadata:
-                if next_payload_metadata[f] != None:
-                    if f == "Fan-out":
-                        payload["Fan-out"]["OuterLoop"] = next_payload_metadata[f]
-                    else:
-                        payload[f] = next_payload_metadata[f]
+        The runtime of the invoked function recognizes the "Relay" field and
+        calls Unum.run_relay() instead of the user function, which continues
+        the dispatch from this function on its sub-slice. Each instance
+        therefore makes at most k invokes and the last branch is launched
+        after O(log_k N) levels of invokes instead of N serial ones.
 
-            payload['GC'] = kwargs['gc']
+        Leaf payloads are built by _map_payload() with the original Index
+        and Size, so instance names, fan-in and GC are the same as when the
+        invoker dispatches all branches itself.
 
-            if self.debug:
-                print(f'[DEBUG] {self.my_node_name}-{unum_index_list} is invoking {self.function_name} with {payload}')
+        `spill_instance_name` is the instance whose checkpoint has the whole
+        Map's elements, which oversized leaf and relay payloads refer to. See
+        _fit_payload().
+        '''
+        k = self.map_tree_arity
+        num_values = len(values.value)
 
-            self.invoker.invoke(self.function_name, payload)
+        if k <= 1 or num_values <= k:
+            payloads = [self._fit_payload(self._map_payload(start+i, size, d, session, next_payload_metadata, gc), spill_instance_name, Index=start+i)
+                for i, d in enumerate(values.elements())]
+            self._dispatch_map(payloads, list(range(start, start+num_values)), unum_index_list)
+            return
+
+        slice_size = math.ceil(num_values/k)
+        payloads = []
+        indexes = []
+
+        for i in range(0, num_values, slice_size):
+            payloads.append(self._fit_payload({
+                "Data": {
+                    "Source": "http",
+                    "Value": values.slice(i, i+slice_size)
+                },
+                "Session": session,
+                "Relay": {
+                    "Function": self.function_name,
+                    "Start": start+i,
+                    "Size": size,
+                    "Arity": k,
+                    "Dispatch Concurrency": self.dispatch_concurrency,
+                    "Next Payload Metadata": next_payload_metadata
+                },
+                "GC": gc
+            }, spill_instance_name, Start=start+i, End=start+min(i+slice_size, num_values)))
+            indexes.append(start+i)
+
+        self._dispatch_map(payloads, indexes, unum_index_list)
+
+
+
+    def _fit_payload(self, payload, spill_instance_name, **reference):
+        '''Serialize `payload`, passing its "Data" in a smaller form if it
+        does not fit in self.payload_size_limit
+
+        The payload is tried with its "Data" compressed first, if
+        self.payload_compression is true, and then spilled, i.e., with
+        "Data" referring to the checkpoint of `spill_instance_name`, which
+        holds the data. `reference` locates the payload's data in the
+        checkpoint, e.g., the Index of a Map branch. See
+        Unum.read_input_value() for the formats.
+
+        Spilling writes nothing. The invoker's checkpoint is written before
+        its continuations run and is garbage collected by its children as
+        usual. If the invoker does not checkpoint (`spill_instance_name` is
+        None), the payload is sent as is.
+
+        payload["Data"]["Value"] is a serde.EncodedValue, whose JSON is
+        reused rather than serialized again.
+
+        @return bytes the JSON of the payload, which the invoker sends as is
+        '''
+        encoded = serde.dumps_payload(payload)
+        size = len(encoded)
+
+        if self.payload_size_limit <= 0 or size <= self.payload_size_limit:
+            return encoded
+
+        if self.payload_compression:
+            value = base64.b64encode(zlib.compress(payload["Data"]["Value"].json)).decode('ascii')
+            compressed = serde.dumps({**payload, "Data": {"Source": "http", "Encoding": "zlib", "Value": value}})
+
+            if len(compressed) <= self.payload_size_limit:
+                if self.debug:
+                    print(f'[DEBUG] Compressed the {size}-byte payload to {self.function_name} to {len(compressed)} bytes')
+
+                return compressed
+
+        if spill_instance_name == None:
+            print(f'[WARN] The {size}-byte payload to {self.function_name} exceeds the payload size limit of {self.payload_size_limit} bytes, but cannot be spilled without a checkpoint')
+            return encoded
+
+        if self.debug:
+            print(f'[DEBUG] Spilled the {size}-byte payload to {self.function_name} to the checkpoint of {spill_instance_name}')
+
+        return serde.dumps({**payload, "Data": {"Source": "checkpoint", "Value": {"Instance": spill_instance_name, **reference}}})
+
+
+
+    def _dispatch_map(self, payloads, indexes, unum_index_list):
+        '''Invoke one instance of the Map continuation per payload
+
+        `indexes` lists the Map index of each payload and is used for error
+        reporting. Relay payloads are reported by the index of the first
+        element in their slice.
+
+        With a dispatch concurrency of 1, payloads are invoked one after
+        another in index order. The first failed invoke stops the dispatch,
+        leaving all later indexes un-invoked, and raises the same IOError as
+        below, naming the failed index.
+
+        With a dispatch concurrency greater than 1, up to that many invokes
+        are in flight at once on a thread pool. Every payload is invoked
+        exactly once regardless of failures at other indexes. Therefore, a
+        partial failure always leaves the same set of branches launched no
+        matter how the invokes happened to be scheduled. After all invokes
+        return, each failed index is reported in ascending order and an
+        IOError naming the failed indexes is raised from the lowest failed
+        index's exception.
+
+        Because fan-out is not checkpointed per branch, retrying the whole
+        function after a partial failure re-invokes the branches that
+        succeeded. Those duplicates are handled by the branches' own
+        checkpoints like any other duplicate invocation.
+        '''
+        failures = {}
+
+        if self.dispatch_concurrency <= 1 or len(payloads) <= 1:
+            for index, payload in zip(indexes, payloads):
+                if self.debug:
+                    print(f'[DEBUG] {self.my_node_name}-{unum_index_list} is invoking {self.function_name} with {payload}')
+
+                try:
+                    self.invoker.invoke(self.function_name, payload)
+                except Exception as e:
+                    failures[index] = e
+                    break
+
+            self._raise_map_failures(failures, len(payloads), unum_index_list)
+            return
+
+        with ThreadPoolExecutor(max_workers=min(self.dispatch_concurrency, len(payloads))) as executor:
+            futures = []
+            for payload in payloads:
+                if self.debug:
+                    print(f'[DEBUG] {self.my_node_name}-{unum_index_list} is invoking {self.function_name} with {payload}')
+
+                futures.append(executor.submit(self.invoker.invoke, self.function_name, payload))
+
+            for index, future in zip(indexes, futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failures[index] = e
+
+        self._raise_map_failures(failures, len(payloads), unum_index_list)
+
+
+
+    def _raise_map_failures(self, failures, num_payloads, unum_index_list):
+        '''Report each failed Map index in ascending order and raise an
+        IOError naming them from the lowest failed index's exception
+
+        @param failures dict of Map indexes to the exceptions of their invokes
+        '''
+        if len(failures) == 0:
+            return
+
+        failed_indexes = sorted(failures)
+
+        for i in failed_indexes:
+            print(f'[ERROR] {self.my_node_name}-{unum_index_list} failed to invoke {self.function_name} at Map index {i}: {failures[i]}')
+
+        raise IOError(f'Map continuation {self.function_name} failed to invoke {len(failed_indexes)} of {num_payloads} indexes: {failed_indexes}') from failures[failed_indexes[0]]
 
 
 
@@ -1130,10 +2137,43 @@ class UnumContinuation(object):
         have the "Fan-out" field for this function and we need the
         input_payload for the Fan-out metadata.
 
+        If my checkpoint was fused with my fan-in synchronization (see
+        Unum._run_checkpoint()), the `fan_in_ready` keyword argument has the
+        result and the branch does not synchronize again.
+        '''
+        fan_in = self.prepare_fan_in(user_function_output, next_payload_metadata, input_payload, unum_index_list)
+        if fan_in == None:
+            return
+
+        payload, aggregation_function_instance_name, my_index, branch_instance_names = fan_in
+
+        ready = kwargs.get('fan_in_ready')
+        if ready == None:
+            ready = self.datastore.fanin_sync_ready(session, aggregation_function_instance_name, my_index, kwargs['my_curr_instance_name'], len(branch_instance_names))
+
+        if ready:
+            payload['Data'] = {'Source': self.datastore.my_type, 'Value': branch_instance_names}
+            payload['Session'] = session
+
+            if self.debug:
+                print(f'[DEBUG] {self.my_node_name}-{unum_index_list} is invoking {self.function_name} with {payload}')
+
+            self.invoker.invoke(self.function_name, payload)
+        else:
+            # fan-in not ready. just return
+            pass
+
+
+
+    def prepare_fan_in(self, user_function_output, next_payload_metadata, input_payload, unum_index_list):
+        '''Compute what a fan-in branch needs to synchronize
 
+        @return None if the conditional is false. Otherwise, a tuple of the
+            aggregation function's payload metadata, its instance name, my
+            index among the branches and the instance names of all branches.
         '''
         if self.check_conditional(user_function_output, input_payload, unum_index_list) == False:
-            return
+            return None
 
         # compute the aggregation function's instance name based on the input payload
         payload = {}
@@ -1167,19 +2207,7 @@ class UnumContinuation(object):
 
         branch_instance_names = self.expand_all_fan_in_value_names(unum_index_list, input_payload)
 
-        num_branches = len(branch_instance_names)
-
-        if self.datastore.fanin_sync_ready(session, aggregation_function_instance_name, my_index, kwargs['my_curr_instance_name'], num_branches):
-            payload['Data'] = {'Source': self.datastore.my_type, 'Value': branch_instance_names}
-            payload['Session'] = session
-
-            if self.debug:
-                print(f'[DEBUG] {self.my_node_name}-{unum_index_list} is invoking {self.function_name} with {payload}')
-
-            self.invoker.invoke(self.function_name, payload)
-        else:
-            # fan-in not ready. just return
-            pass
+        return payload, aggregation_function_instance_name, my_index, branch_instance_names
 
 
 
@@ -1307,31 +2335,14 @@ class UnumContinuation(object):
         Note: the names are expanded from the invoker's perspective based on
         the invoker's input payload before any Next Payload Modifier runs.
         '''
-        ret = name
-
         # replace the positional variables (e.g., $0, $1, $2) with Fan-out Index values
-        # XXX: the use '\$.' has the limitation of up to $9.
-        positionals = re.findall('\$.', ret)
-        for p in positionals:
-            ret = ret.replace(p, str(unum_index_list[int(p[1])]))
-
-        # if "$0" in ret:
-        #     ret = ret.replace("$0", str(input_payload["Fan-out"]["Index"]))
-
-        # if "$1" in ret:
-        #     ret = ret.replace("$1", str(input_payload["Fan-out"]["OuterLoop"]["Index"]))
-
-        # if "$2" in ret:
-        #     ret = ret.replace("$2", str(input_payload["Fan-out"]["OuterLoop"]["OuterLoop"]["Index"]))
-
-        # if "$3" in ret:
-        #     ret = ret.replace("$2", str(input_payload["Fan-out"]["OuterLoop"]["OuterLoop"]["OuterLoop"]["Index"]))
+        ret = UnumExpression.substitute_positionals(name, unum_index_list)
 
         # computations involving positional variables (e.g., ($0-1), ($1+1).$0 )
-        exp_np = re.findall('\((.*?)\)', ret)
-        exp_wp = re.findall('\(.*?\)', ret)
+        exp_np = re.findall(r'\((.*?)\)', ret)
+        exp_wp = re.findall(r'\(.*?\)', ret)
         for i in range(0,len(exp_np)):
-            ret = ret.replace(exp_wp[i], str(eval(exp_np[i])))
+            ret = ret.replace(exp_wp[i], str(UnumExpression(exp_np[i], 'eval', []).evaluate({})))
 
         # If * is in the name, expand it based on the innermost Fan-out Size (i.e., input_payload["Fan-out"]["Size"])
         # NOTE: * currently only works on the $0 place
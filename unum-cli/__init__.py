@@ -89,7 +89,7 @@ def main():
     compile_parser.add_argument('-t', '--workflow-type', required=False, help="workflow type")
     compile_parser.add_argument('-w', '--workflow-definition', required=False, help="workflow definition")
     compile_parser.add_argument('-u', '--unum-template', required=False, help="Unum template file")
-    compile_parser.add_argument('-o', '--optimize', required=False, choices=['trim'], help="optimizations")
+    compile_parser.add_argument('-o', '--optimize', required=False, choices=['trim', 'fuse'], nargs='+', help="optimizations")
 
     # build command parser
     build_parser = subparsers.add_parser("build", description="build unum application in the current directory")
@@ -307,7 +307,14 @@ def main():
             if update_template:
                 pass
 
+            # Functions fused into another function are not deployed on their
+            # own. unum-cli build packages their code with the function they
+            # are fused into.
+            fc.mark_fused_functions(ir, app_template)
+
             # save the template file after IR compilation into .unum/ always
+            with open(os.path.join('.unum', os.path.basename(args.unum_template)), 'w') as f:
+                f.write(dump_yaml(app_template))
 
             logger.debug('Unum IR generated from Step Functions')
 
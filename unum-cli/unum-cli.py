@@ -45,6 +45,51 @@ def generate_sam_template(unum_template):
     # Set all Lambda timeouts to 900 sec
     sam_template["Globals"]["Function"]["Timeout"] = 900
 
+    # Optional workflow-wide runtime settings
+    if "SyncMode" in unum_template["Globals"]:
+        sam_template["Globals"]["Function"]["Environment"]["Variables"]["UNUM_SYNC_MODE"] = unum_template["Globals"]["SyncMode"]
+
+    if "SyncShards" in unum_template["Globals"]:
+        sam_template["Globals"]["Function"]["Environment"]["Variables"]["UNUM_SYNC_SHARDS"] = unum_template["Globals"]["SyncShards"]
+
+    if "ReadConcurrency" in unum_template["Globals"]:
+        sam_template["Globals"]["Function"]["Environment"]["Variables"]["UNUM_READ_CONCURRENCY"] = unum_template["Globals"]["ReadConcurrency"]
+
+    if "WriteConcurrency" in unum_template["Globals"]:
+        sam_template["Globals"]["Function"]["Environment"]["Variables"]["UNUM_WRITE_CONCURRENCY"] = unum_template["Globals"]["WriteConcurrency"]
+
+    if "CheckpointTTL" in unum_template["Globals"]:
+        sam_template["Globals"]["Function"]["Environment"]["Variables"]["UNUM_CHECKPOINT_TTL"] = unum_template["Globals"]["CheckpointTTL"]
+
+    if "FusedCheckpoint" in unum_template["Globals"]:
+        sam_template["Globals"]["Function"]["Environment"]["Variables"]["UNUM_FUSED_CHECKPOINT"] = str(unum_template["Globals"]["FusedCheckpoint"]).lower()
+
+    if "PayloadSizeLimit" in unum_template["Globals"]:
+        sam_template["Globals"]["Function"]["Environment"]["Variables"]["UNUM_PAYLOAD_SIZE_LIMIT"] = unum_template["Globals"]["PayloadSizeLimit"]
+
+    if "PayloadCompression" in unum_template["Globals"]:
+        sam_template["Globals"]["Function"]["Environment"]["Variables"]["UNUM_PAYLOAD_COMPRESSION"] = str(unum_template["Globals"]["PayloadCompression"]).lower()
+    if "CheckpointCodec" in unum_template["Globals"]:
+        sam_template["Globals"]["Function"]["Environment"]["Variables"]["UNUM_CHECKPOINT_CODEC"] = unum_template["Globals"]["CheckpointCodec"]
+    if "JSONBackend" in unum_template["Globals"]:
+        sam_template["Globals"]["Function"]["Environment"]["Variables"]["UNUM_JSON_BACKEND"] = unum_template["Globals"]["JSONBackend"]
+    if "LazyClients" in unum_template["Globals"]:
+        sam_template["Globals"]["Function"]["Environment"]["Variables"]["UNUM_LAZY_CLIENTS"] = str(unum_template["Globals"]["LazyClients"]).lower()
+    if "ConnectTimeout" in unum_template["Globals"]:
+        sam_template["Globals"]["Function"]["Environment"]["Variables"]["UNUM_CONNECT_TIMEOUT"] = str(unum_template["Globals"]["ConnectTimeout"])
+    if "ReadTimeout" in unum_template["Globals"]:
+        sam_template["Globals"]["Function"]["Environment"]["Variables"]["UNUM_READ_TIMEOUT"] = str(unum_template["Globals"]["ReadTimeout"])
+    if "RetryMode" in unum_template["Globals"]:
+        sam_template["Globals"]["Function"]["Environment"]["Variables"]["UNUM_RETRY_MODE"] = unum_template["Globals"]["RetryMode"]
+    if "RetryMaxAttempts" in unum_template["Globals"]:
+        sam_template["Globals"]["Function"]["Environment"]["Variables"]["UNUM_RETRY_MAX_ATTEMPTS"] = str(unum_template["Globals"]["RetryMaxAttempts"])
+
+    if "ExecutionLease" in unum_template["Globals"]:
+        sam_template["Globals"]["Function"]["Environment"]["Variables"]["UNUM_EXECUTION_LEASE"] = str(unum_template["Globals"]["ExecutionLease"])
+
+    if "CompletedCacheSize" in unum_template["Globals"]:
+        sam_template["Globals"]["Function"]["Environment"]["Variables"]["UNUM_COMPLETED_CACHE_SIZE"] = str(unum_template["Globals"]["CompletedCacheSize"])
+
     # Copy other global settings from unum-template to sam template
     if "MemorySize" in unum_template["Globals"]:
         sam_template["Globals"]["Function"]["MemorySize"] = unum_template["Globals"]["MemorySize"]
@@ -63,7 +108,7 @@ def generate_sam_template(unum_template):
     sam_template["Resources"]={}
     sam_template["Outputs"] = {}
 
-    for f in unum_template["Functions"]:
+    for f in deployed_functions(unum_template):
         unum_function_policies = []
         if "Policies" in unum_template["Functions"][f]["Properties"]:
             unum_function_policies = unum_template["Functions"][f]["Properties"]["Policies"]
@@ -83,8 +128,43 @@ def generate_sam_template(unum_template):
         arn = f"!GetAtt {f}Function.Arn"
         sam_template["Outputs"][f'{f}Function'] = {"Value": f"!GetAtt {f}Function.Arn"}
 
+    # With deferred gc, add the function that sweeps a session's gc log. It
+    # runs main.gc_sweeper_handler from the entry function's code.
+    if gc_deferred(unum_template):
+        start = [f for f in unum_template["Functions"] if unum_template["Functions"][f]["Properties"].get("Start")][0]
+
+        sam_template["Resources"]["UnumGCSweeperFunction"] = {
+                "Type":"AWS::Serverless::Function",
+                "Properties": {
+                    "Handler":"main.gc_sweeper_handler",
+                    "Runtime": unum_template["Functions"][start]["Properties"]["Runtime"],
+                    "CodeUri": unum_template["Functions"][start]["Properties"]["CodeUri"],
+                    "Policies": unum_function_needed_policies
+                }
+            }
+        sam_template["Outputs"]["UnumGCSweeperFunction"] = {"Value": "!GetAtt UnumGCSweeperFunction.Arn"}
+
     return sam_template
 
+
+
+def gc_deferred(unum_template):
+    ''' Return True if the unum template turns on deferred gc
+    '''
+    return str(unum_template["Globals"].get("GC")).lower() == 'deferred'
+
+
+
+def deployed_functions(unum_template):
+    ''' Return the names of the functions that are deployed as FaaS functions
+
+    Functions that the compiler fused into another function (FusedInto in
+    their Properties) are packaged with that function instead. See
+    package_fused_functions().
+    '''
+    return [f for f in unum_template["Functions"] if "FusedInto" not in unum_template["Functions"][f]["Properties"]]
+
+
 def sam_build_clean(args):
 
     if args.platform_template == None:
@@ -108,6 +188,10 @@ def sam_build_clean(args):
         except Exception as e:
             raise e
 
+        # remove the code of functions fused into this function
+        if len(fused_function_names(app_dir)) > 0:
+            shutil.rmtree(f'{app_dir}fused', ignore_errors=True)
+
     # remove the .aws-sam build directory
     try:
         ret = subprocess.run(["rm", "-rf", ".aws-sam"], check = True, capture_output=True)
@@ -116,6 +200,60 @@ def sam_build_clean(args):
 
     return
 
+def fused_function_names(app_dir):
+    ''' Return the names of the functions fused into the function in
+    `app_dir`, from its unum_config.json
+    '''
+    try:
+        with open(f'{app_dir}unum_config.json') as f:
+            config = json.loads(f.read())
+    except FileNotFoundError:
+        return []
+
+    return config.get("Fused", [])
+
+
+
+def package_fused_functions(platform_template, unum_template_file):
+    ''' Copy the code of fused functions into the function they are fused
+    into
+
+    The compiler fuses linear chains of functions into the first function of
+    the chain and lists the others in its unum_config.json's "Fused" field.
+    The runtime imports each fused function's app.py from
+    fused/<function name>/ in the function's directory.
+    '''
+    unum_template = None
+    packaged = []
+
+    for f in platform_template["Resources"]:
+        if platform_template["Resources"][f]["Type"] != 'AWS::Serverless::Function':
+            continue
+
+        # e.g., the UnumGCSweeper function shares the entry function's code
+        app_dir = platform_template["Resources"][f]["Properties"]["CodeUri"]
+        if app_dir in packaged:
+            continue
+        packaged.append(app_dir)
+
+        fused = fused_function_names(app_dir)
+        if len(fused) == 0:
+            continue
+
+        if unum_template == None:
+            with open(unum_template_file or 'unum-template.yaml') as t:
+                unum_template = yaml.load(t.read(), Loader=Loader)
+
+        for name in fused:
+            fused_dir = f'{app_dir}fused/{name}'
+            shutil.rmtree(fused_dir, ignore_errors=True)
+            shutil.copytree(unum_template["Functions"][name]["Properties"]["CodeUri"], fused_dir,
+                ignore=shutil.ignore_patterns('__pycache__', 'unum_config.json'))
+
+        print(f'Packaged fused functions {fused} with {f}')
+
+
+
 def sam_build(platform_template, args):
 
     if args.clean:
@@ -127,6 +265,8 @@ def sam_build(platform_template, args):
         app_dir = platform_template["Resources"][f]["Properties"]["CodeUri"]
         subprocess.run(f'cp common/* {app_dir}', shell=True, check=True)
 
+    package_fused_functions(platform_template, args.template)
+
     try:
         ret = subprocess.run(["sam", "build", "-t", args.platform_template, "--use-container"],
             capture_output=True, check= True)
@@ -298,7 +438,7 @@ def create_function_arn_mapping(sam_stdout, unum_template):
         function_arn = deploy_output[i+1] + deploy_output[i+2]
         function_to_arn_mapping[function_name] = function_arn
 
-        if len(unum_template["Functions"]) == len(function_to_arn_mapping.keys()):
+        if len(deployed_functions(unum_template)) + gc_deferred(unum_template) == len(function_to_arn_mapping.keys()):
             break
 
     # store function name to arn mapping in function-arn.yaml
@@ -432,9 +572,14 @@ def deploy_sam(args):
         function_to_arn_mapping = create_function_arn_mapping(sam_output, unum_template)
         print(f'\033[32m\n Function-to-arn Mapping Created\033[0m\n')
 
-    # copy function-arn.yaml into .aws-sam/build/[function_name]/
+    # copy function-arn.yaml into .aws-sam/build/[function_name]/, together
+    # with the same mapping as function-arn.json, which the runtime reads
+    # without a YAML parser during cold start
     base_dir = f'.aws-sam/build'
 
+    with open('function-arn.yaml') as f:
+        function_to_arn_mapping = yaml.load(f.read(), Loader=Loader)
+
     for f in platform_template["Resources"]:
         if platform_template["Resources"][f]["Type"] == 'AWS::Serverless::Function':
             function_artifact_dir = f'{base_dir}/{f}'
@@ -443,6 +588,9 @@ def deploy_sam(args):
 
             shutil.copy('function-arn.yaml', function_artifact_dir)
 
+            with open(f'{function_artifact_dir}/function-arn.json', 'w') as m:
+                m.write(json.dumps(function_to_arn_mapping))
+
 
         # # update the unum_config.json in all functions (in the build artifacts, not source code)
         # print(f'Updating unum configuration ......')
@@ -799,7 +947,7 @@ def main():
         help='workflow definition type', required=True)
     compile_parser.add_argument('-w', '--workflow', required=True, help="workflow file")
     compile_parser.add_argument('-t', '--template', required=True, help="unum template file")
-    compile_parser.add_argument('-o', '--optimize', required=False, choices=['trim'], help="optimizations")
+    compile_parser.add_argument('-o', '--optimize', required=False, choices=['trim', 'fuse'], nargs='+', help="optimizations")
 
     args = parser.parse_args()
 